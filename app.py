@@ -1,15 +1,28 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, session, send_from_directory
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, send_file, session, send_from_directory
 from werkzeug.utils import secure_filename
-from processing_scripts.image_transformer import process_image
 from processing_scripts.helpers import *
-from services.image_upload_service import process_metadata_overlay
-from livereload import Server
-import os, atexit, math, uuid, zlib
+from processing_scripts.image_context import get_effective_size
+from processing_scripts.encoders import available_profiles, get_encoder_profile, encoder_stats, DEFAULT_ENCODER_PROFILE
+from processing_scripts.renditions import rendition_filename
+from services.image_upload_service import process_metadata_overlay, save_upload, process_saved_overlay, process_border_image, BORDER_QUALITIES
+from services.batch_planner import plan_overlay_jobs
+from services.batch_executor import run_batch, shutdown_batch_executor, DEFAULT_BATCH_WORKERS
+from services.job_queue import get_job_queue
+from services.zip_stream import stream_zip
+from services.result_cache import get_result_cache
+from services.batch_store import get_batch_store
+from services.upload_ingest import IngestRequest, ingested_digest, DEFAULT_MAX_CONTENT_LENGTH, DEFAULT_MAX_UPLOAD_FILE_BYTES
+from processing_scripts.instrumentation import get_stage_metrics, render_prometheus
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+import os, atexit, logging, math, uuid, zlib
 from PIL import Image, ImageOps
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 app.secret_key = "your_secret_key"  # Needed for session management
 
+# Pipeline debugging output goes through logging (LOG_LEVEL=DEBUG shows it, LOG_STAGE_TIMINGS=1 adds per-image stage timings)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 # Cache static files for 1 hour
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 3600
 
@@ -17,12 +30,26 @@ app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 3600
 UPLOAD_FOLDER = 'static/uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Stream uploads straight to disk (hashed and checked as they arrive) with per-file and per-request limits
+app.request_class = IngestRequest
+app.config['MAX_CONTENT_LENGTH'] = DEFAULT_MAX_CONTENT_LENGTH
+app.config['MAX_UPLOAD_FILE_BYTES'] = DEFAULT_MAX_UPLOAD_FILE_BYTES
+
+# Number of worker processes used for multi-image batches (size this to the host)
+app.config['BATCH_WORKERS'] = DEFAULT_BATCH_WORKERS
+
 # Ensure the upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Clear the uploads folder on startup
 cleanup_directory(UPLOAD_FOLDER)
 
+# Oversized or non-image uploads are rejected while the body is still being read
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def upload_rejected(e):
+    return jsonify({"error": e.description}), e.code
+
 # Default route to the home page
 @app.route('/')
 def home():
@@ -31,48 +58,64 @@ def home():
 # Route for the metadata overlay form
 @app.route('/metadata')
 def upload_form():
-    return render_template('upload.html')
+    return render_template('upload.html', encoder_profiles=available_profiles(), default_encoder_profile=DEFAULT_ENCODER_PROFILE)
 
 # Route for the white border form
 @app.route('/border')
 def border_form():
-    return render_template('border.html')
+    return render_template('border.html', encoder_profiles=available_profiles(), default_encoder_profile=DEFAULT_ENCODER_PROFILE)
 
-# White border route
-@app.route('/white-border', methods=['POST'])
-def white_border_endpoint():
-    # Store referrer for error redirection
-    session['last_referrer'] = request.referrer or url_for('border_form')
+# Encode time and output size per encoder profile (for this process, batch workers keep their own counts)
+@app.route('/encoder-stats')
+def encoder_stats_endpoint():
+    return jsonify(encoder_stats())
 
-    # Expect multiple files under the 'images' field
-    if 'images' not in request.files:
-        return jsonify({"error": "No file uploaded"}), 400
+# Hit rate and size of the processed result cache (shared by every worker)
+@app.route('/cache-stats')
+def cache_stats_endpoint():
+    return jsonify(get_result_cache().stats())
 
-    # Grab the border size and aspect ratio from the request body
-    border_size = int(request.form.get('borderSize', 0))
-    aspect_ratio = request.form.get('aspectRatio', 'Default')
+# Per-stage processing time and allocated bytes, plus pipeline run counts, in the Prometheus text format (shared by every worker)
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(render_prometheus(get_stage_metrics().snapshot()), mimetype='text/plain; version=0.0.4')
 
-    processed_urls = []
-    processed_filenames = []
+# Batch helpers
+# --------------------------------------------------------------------
 
-    # Iterate through uploaded images and process each of them separately
+# Helper function that saves the uploads of a /white-border style request and builds one border job per image
+def build_border_jobs():
+    """
+    Saves every file under the 'images' field and works out its target aspect ratio.
+
+    Returns:
+        tuple[list[tuple], list[str]]: The `process_border_image` arguments for each image and the
+        matching original filenames (images with an unparsable aspect ratio are skipped).
+    """
+    # Grab the border size, aspect ratio and encoder profile from the request body
+    border_size = int(request.form.get('borderSize', 0))
+    aspect_ratio = request.form.get('aspectRatio', 'Default')
+    encoder_profile, _ = get_encoder_profile(request.form.get('encoderProfile'))
+    quality = request.form.get('quality') or 'full'
+    if quality not in BORDER_QUALITIES:
+        raise ValueError(f"Unknown quality: {quality} (available: {', '.join(BORDER_QUALITIES)})")
+
+    # Save every upload and work out its aspect ratio here, the pixel work is handed to the batch executor
+    jobs = []
+    filenames = []
     for image in request.files.getlist('images'):
         if not image or image.filename == '':
             continue
 
-        print(f"Uploaded image: {image.filename}")
-        original_filename = secure_filename(image.filename)
-        unique_prefix = uuid.uuid4().hex[:8]
-        filename = f"{unique_prefix}_{original_filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        image.save(filepath)
+        app.logger.debug("Uploaded image: %s", image.filename)
+        digest = ingested_digest(image)
+        filepath = save_upload(image, app.config['UPLOAD_FOLDER'])
+        filename = os.path.basename(filepath)
 
         # Determine aspect ratio tuple for THIS image
         if aspect_ratio == 'Default':
-            with Image.open(filepath) as img:
-                img = ImageOps.exif_transpose(img)
-                width, height = img.size
-                aspect_ratio_tuple = (width, height)
+            # Only the upright geometry is needed here, read it from the header instead of decoding
+            aspect_ratio_tuple = get_effective_size(filepath)
         else:
             parsed_aspect_ratio = aspect_ratio.split(':')
             if len(parsed_aspect_ratio) == 2:
@@ -81,42 +124,110 @@ def white_border_endpoint():
                     aspect_ratio_tuple = (w, h)
                 except ValueError:
                     # Skip this image if aspect ratio parsing failed
-                    print(f"Invalid aspect ratio provided: {aspect_ratio}")
+                    app.logger.warning("Invalid aspect ratio provided: %s", aspect_ratio)
                     continue
             else:
                 # Invalid aspect ratio format
-                print(f"Invalid aspect ratio format: {aspect_ratio}")
+                app.logger.warning("Invalid aspect ratio format: %s", aspect_ratio)
                 continue
 
-        print(f"Processing {filename} with aspect {aspect_ratio_tuple} and border {border_size}")
+        app.logger.debug("Processing %s with aspect %s and border %s", filename, aspect_ratio_tuple, border_size)
+        jobs.append((filepath, aspect_ratio_tuple, border_size, app.config['UPLOAD_FOLDER'], encoder_profile, digest, quality))
+        filenames.append(image.filename)
 
-        try:
-            with Image.open(filepath) as img:
-                img = ImageOps.exif_transpose(img)
-                processed_image = create_simple_border(img, aspect_ratio_tuple, border_size)
+    return jobs, filenames
 
-            processed_image_filename = f"border_{filename}"
-            processed_image_path = os.path.join(app.config['UPLOAD_FOLDER'], processed_image_filename)
-            processed_image.save(processed_image_path, quality=100, optimize=True, progressive=True)
+# Helper function that saves the uploads of a /process-images style request and builds one overlay job per image
+def build_overlay_jobs():
+    """
+    Saves every file under the 'images' field and collects its per-index form fields.
 
-            print(f"Processed image saved at: {processed_image_path}")
+    Returns:
+        tuple[list[tuple], list[str]]: The `process_saved_overlay` arguments for each image and the
+        matching original filenames.
+    """
+    # Save every upload and build its form here, the pixel work is handed to the batch executor
+    jobs = []
+    filenames = []
+    for index, curr_image in enumerate(request.files.getlist('images')):
+        if not curr_image or curr_image.filename == '':
+            continue
 
-            # Append URLs and filenames for the results page
-            processed_urls.append(url_for('static', filename=f"uploads/{processed_image_filename}"))
-            processed_filenames.append(processed_image_filename)
+        # Set up the current form
+        curr_form = {
+            "address": request.form.get(f"address[{index}]"),
+            "latitude": to_float(request.form.get(f"latitude[{index}]")),
+            "longitude": to_float(request.form.get(f"longitude[{index}]")),
+            "photoName": request.form.get(f"photoName[{index}]"),
+            "aspectRatio": request.form.get(f"aspectRatio[{index}]") or "Default",
+            "customAspectRatio": request.form.get(f"customAspectRatio[{index}]"),
+            "encoderProfile": request.form.get("encoderProfile"),
+        }
 
-        except Exception as e:
-            print(f"Error processing image {filename}: {str(e)}")
-            # skip on error and continue with next image
-            continue
+        digest = ingested_digest(curr_image)
+        filepath = save_upload(curr_image, app.config['UPLOAD_FOLDER'])
+        jobs.append((filepath, curr_form, app.config['UPLOAD_FOLDER'], digest))
+        filenames.append(curr_image.filename)
+
+    return jobs, filenames
+
+# Helper function to store a finished batch for the results page (replacing any previous batch)
+# (the filenames live in the server-side batch store, the cookie session only carries the batch ID)
+def store_batch_results(processed_filenames: list[str]):
+    session['batch_id'] = get_batch_store().save(processed_filenames) if processed_filenames else None
+
+# Helper function to get the processed filenames of the batch this session last produced
+def current_batch_filenames() -> list[str]:
+    return get_batch_store().get(session.get('batch_id')) or []
+
+# Helper function with the URL of a rendition of a processed image (the full image if the rendition is missing)
+def rendition_url(filename: str, full_url: str, rendition: str) -> str:
+    if filename:
+        name = rendition_filename(filename, rendition)
+        if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], name)):
+            return url_for('static', filename=f"uploads/{name}")
+    return full_url
+
+# Helper function with a random ID for this browser session (a job's outputs only go to the session that submitted it)
+def session_owner() -> str:
+    if 'owner_id' not in session:
+        session['owner_id'] = uuid.uuid4().hex
+    return session['owner_id']
+
+# Helper function with the URLs a client needs to follow a job
+def job_links(job_id: str) -> dict:
+    return {
+        "job_id": job_id,
+        "status_url": url_for('job_status', job_id=job_id),
+        "results_url": url_for('job_results', job_id=job_id),
+        "view_url": url_for('job_view', job_id=job_id),
+    }
+
+# White border route
+@app.route('/white-border', methods=['POST'])
+def white_border_endpoint():
+    # Store referrer for error redirection
+    session['last_referrer'] = request.referrer or url_for('border_form')
 
-    if len(processed_urls) == 0:
+    # Expect multiple files under the 'images' field
+    if 'images' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    try:
+        jobs, _ = build_border_jobs()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Process the images across the worker pool (results come back in upload order, failed images as None)
+    results = run_batch(process_border_image, jobs, app.config['BATCH_WORKERS'])
+    processed_filenames = [os.path.basename(path) for path in results if path]
+
+    if len(processed_filenames) == 0:
         # No successful processed images
         return redirect(session.get('last_referrer', url_for('border_form')))
 
     # Store the list of processed images in session for the results page
-    session['processed_image_urls'] = processed_urls
-    session['processed_image_filenames'] = processed_filenames
+    store_batch_results(processed_filenames)
 
     return redirect(url_for('results_page'))
 
@@ -136,24 +247,23 @@ def process_image_endpoint():
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
     
-    print(f"Uploaded image: {file.filename}")
+    app.logger.debug("Uploaded image: %s", file.filename)
     
     try:
         # Call the helper function to handle the incoming reuqest and process the image
         processed_image_path = process_metadata_overlay(file, request.form, app.config['UPLOAD_FOLDER'])
 
         if not processed_image_path:
-            print("No processed image path returned")
+            app.logger.warning("No processed image path returned")
             return redirect(session.get('last_referrer', url_for('upload_form')))
 
         # Store the processed image in session for the results page
-        session['processed_image_url'] = url_for('static', filename=f"uploads/{os.path.basename(processed_image_path)}")
-        session['processed_image_filename'] = os.path.basename(processed_image_path)
+        store_batch_results([os.path.basename(processed_image_path)])
 
         return redirect(url_for('results_page'))
 
     except Exception as e:
-        print("Error during image processing:", e)
+        app.logger.error("Error during image processing: %s", e)
         return redirect(session.get('last_referrer', url_for('upload_form')))
     
 @app.route('/process-images', methods=['POST'])
@@ -164,53 +274,90 @@ def process_images_endpoint():
     # Check if the images tag is in the request
     if "images" not in request.files:
         return jsonify({"error": "No file uploaded"}), 400
-    else:
-        print(len(request.files))
     
-    # Iterate through the list of images and process each one
-    image_list = request.files.getlist('images')
-    num_images = len(image_list)
-    for index in range(0, num_images):
-        curr_image = image_list[index]
-
-        # Set up the current form
-        
-        curr_form = {
-            "address": request.form.get(f"address[{index}]"),
-            "latitude": to_float(request.form.get(f"latitude[{index}]")),
-            "longitude": to_float(request.form.get(f"longitude[{index}]")),
-            "photoName": request.form.get(f"photoName[{index}]"),
-            "aspectRatio": request.form.get(f"aspectRatio[{index}]") or "Default",
-            "customAspectRatio": request.form.get(f"customAspectRatio[{index}]"),
-        }
-
-        try:
-            # Call the helper function to handle the incoming request and process the image
-            processed_image_path = process_metadata_overlay(curr_image, curr_form, app.config['UPLOAD_FOLDER'])
-
-            if not processed_image_path:
-                print("No processed image path returned for file:", curr_image.filename)
-                continue
-            
-            # Store the processed image in session for the results page
-            if 'processed_image_urls' not in session:
-                session['processed_image_urls'] = []
-                session['processed_image_filenames'] = []
+    jobs, filenames = build_overlay_jobs()
 
-            session['processed_image_urls'].append(url_for('static', filename=f"uploads/{os.path.basename(processed_image_path)}"))
-            session['processed_image_filenames'].append(os.path.basename(processed_image_path))
+    # Work out what each group of similar images shares once, then process the images across the worker pool
+    # (results come back in upload order, failed images as None)
+    results = run_batch(process_saved_overlay, plan_overlay_jobs(jobs), app.config['BATCH_WORKERS'])
+    for filename, processed_image_path in zip(filenames, results):
+        if not processed_image_path:
+            app.logger.warning("No processed image path returned for file: %s", filename)
 
-        except Exception as e:
-            print("Error during image processing for file", curr_image.filename, ":", e)
-            continue
+    # Store the processed images in session for the results page (replacing any previous batch)
+    store_batch_results([os.path.basename(path) for path in results if path])
 
-    if 'processed_image_urls' not in session or len(session['processed_image_urls']) == 0:
+    if not current_batch_filenames():
         return redirect(session.get('last_referrer', url_for('upload_form')))
     
     return redirect(url_for('results_page'))
-                  
 
-        
+# Background batch jobs
+# --------------------------------------------------------------------
+
+# Submit a metadata overlay batch and return immediately with a job ID
+@app.route('/jobs/process-images', methods=['POST'])
+def submit_overlay_job():
+    if "images" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    jobs, filenames = build_overlay_jobs()
+    job = get_job_queue().submit("overlay", process_saved_overlay, jobs, filenames, app.config['BATCH_WORKERS'], prepare=plan_overlay_jobs, owner=session_owner())
+    return jsonify(job_links(job.id)), 202
+
+# Submit a white border batch and return immediately with a job ID
+@app.route('/jobs/white-border', methods=['POST'])
+def submit_border_job():
+    if 'images' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    try:
+        jobs, filenames = build_border_jobs()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not jobs:
+        return jsonify({"error": "No valid images to process"}), 400
+
+    job = get_job_queue().submit("border", process_border_image, jobs, filenames, app.config['BATCH_WORKERS'], owner=session_owner())
+    return jsonify(job_links(job.id)), 202
+
+# Poll the per-image progress of a job (only in the session that submitted it)
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    snapshot = get_job_queue().snapshot(job_id, owner=session_owner())
+    if snapshot is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(snapshot)
+
+# List the outputs of a job (only the images that have finished so far, and only in the session that submitted it)
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    snapshot = get_job_queue().snapshot(job_id, owner=session_owner())
+    if snapshot is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    outputs = [item["output"] for item in snapshot["items"] if item["status"] == "done"]
+    return jsonify({
+        "job_id": job_id,
+        "status": snapshot["status"],
+        "results": [{
+            "filename": filename,
+            "url": url_for('static', filename=f"uploads/{filename}"),
+            "preview_url": rendition_url(filename, url_for('static', filename=f"uploads/{filename}"), "preview"),
+            "download_url": url_for('download_file', filename=filename),
+        } for filename in outputs],
+    })
+
+# Hand a finished job over to the regular results page (only in the session that submitted it)
+@app.route('/jobs/<job_id>/view')
+def job_view(job_id):
+    snapshot = get_job_queue().snapshot(job_id, owner=session_owner())
+    outputs = [item["output"] for item in snapshot["items"] if item["status"] == "done"] if snapshot else []
+    if not outputs:
+        return redirect(request.referrer or url_for('home'))
+
+    store_batch_results(outputs)
+    return redirect(url_for('results_page'))
 
 # Results page
 @app.route('/results')
@@ -218,17 +365,9 @@ def results_page():
     """
     Renders the results page to display the processed image.
     """
-    # Support multiple processed images (saved in session as lists)
-    processed_urls = session.get('processed_image_urls')
-    processed_filenames = session.get('processed_image_filenames')
-
-    # Backwards compatibility: single image keys
-    if not processed_urls:
-        single_url = session.get('processed_image_url')
-        single_filename = session.get('processed_image_filename')
-        if single_url:
-            processed_urls = [single_url]
-            processed_filenames = [single_filename] if single_filename else [None]
+    # Look up the processed images of this session's batch in the server-side store
+    processed_filenames = current_batch_filenames()
+    processed_urls = [url_for('static', filename=f"uploads/{filename}") for filename in processed_filenames]
 
     if not processed_urls:
         # Redirect to the upload page if no image was processed
@@ -238,9 +377,13 @@ def results_page():
         else:
             return redirect(url_for('upload_form'))
 
-    print(f"Processed image URLs: {processed_urls}")
+    app.logger.debug("Processed image URLs: %s", processed_urls)
 
-    return render_template('results.html', image_urls=processed_urls, download_filenames=processed_filenames)
+    # The page displays the small renditions, the full-size files are only fetched on download
+    preview_urls = [rendition_url(filename, url, "preview") for filename, url in zip(processed_filenames, processed_urls)]
+    medium_urls = [rendition_url(filename, url, "medium") for filename, url in zip(processed_filenames, processed_urls)]
+
+    return render_template('results.html', image_urls=medium_urls, preview_urls=preview_urls, download_filenames=processed_filenames)
 
 # Route to download a single file from the results page
 @app.route('/download/<filename>')
@@ -255,38 +398,34 @@ def download_file(filename):
 def download_all_files():
     """
     Allows users to download all processed image files as a zip archive.
+    The archive is streamed as it is built, so memory stays flat and the download starts right away.
     """
-    from io import BytesIO
-    import zipfile
-
-    processed_filenames = session.get('processed_image_filenames', [])
+    processed_filenames = current_batch_filenames()
     if not processed_filenames:
         return redirect(url_for('results_page'))
 
-    # Create a zip in memory
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zip_file:
-        for filename in processed_filenames:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            zip_file.write(file_path, arcname=filename)
+    files = [(os.path.join(app.config['UPLOAD_FOLDER'], filename), filename) for filename in processed_filenames]
 
-    zip_buffer.seek(0)
-
-    return send_file(
-        zip_buffer,
+    return Response(
+        stream_zip(files),
         mimetype='application/zip',
-        as_attachment=True,
-        download_name='processed_images.zip'
+        headers={'Content-Disposition': 'attachment; filename=processed_images.zip'}
     )
 
-# Cleanup the upload directory on exit
-atexit.register(cleanup_directory, UPLOAD_FOLDER)
+# Cleanup the upload directory on exit (only in the process that loaded the app, forked server workers
+# exiting must not wipe uploads the others are still serving) and stop the batch workers
+_app_pid = os.getpid()
+atexit.register(lambda: cleanup_directory(UPLOAD_FOLDER) if os.getpid() == _app_pid else None)
+atexit.register(shutdown_batch_executor)
 
 if __name__ == '__main__':
     # Ensure template reloading is enabled
     app.config["TEMPLATES_AUTO_RELOAD"] = True
     app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 0
 
+    # Development only, production runs wsgi.py under Gunicorn (see gunicorn.conf.py)
+    from livereload import Server
+
     server = Server(app.wsgi_app)
 
     # Watch your templates and static files
@@ -0,0 +1,7 @@
+'''
+Benchmark harness for the processing pipeline
+
+Synthesizes camera-sized test images with realistic EXIF, runs the overlay (`process_image`) and
+white border (`create_simple_border`) pipelines stage by stage, and writes wall time, peak RSS and
+output size per case as JSON so two commits can be compared. Run it with `python -m benchmarks`.
+'''
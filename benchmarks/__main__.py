@@ -0,0 +1,253 @@
+import argparse, json, os, platform, statistics, subprocess, sys, tempfile, time
+
+'''
+Benchmark command line
+
+    python -m benchmarks run [--sizes 12,24,40,60] [--orientations landscape,portrait,square]
+                             [--pipelines overlay,border] [--repeat 3] [--output results.json]
+    python -m benchmarks compare base.json head.json [--threshold 10]
+
+`run` synthesizes the test images once (kept in --image-dir), then runs every case in a fresh
+Python process so its peak RSS belongs to that case alone. `compare` prints the change of every
+metric between two reports and exits with status 1 if anything got slower or bigger than the
+threshold allows.
+'''
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Version of the JSON report layout
+REPORT_SCHEMA = 1
+
+DEFAULT_SIZES = "12,24,40,60"
+DEFAULT_ORIENTATIONS = "landscape,portrait,square"
+DEFAULT_PIPELINES = "overlay,border"
+DEFAULT_IMAGE_DIR = os.path.join(REPO_ROOT, "cache", "benchmarks")
+
+# Stages shorter than this are too noisy to flag as regressions
+MIN_COMPARED_SECONDS = 0.01
+
+# Helper function to read the peak resident set size of this process
+def peak_rss_bytes() -> int:
+    """
+    Returns the peak RSS of the current process in bytes (None where the resource module is missing, e.g. Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+# Helper function to describe the machine and code a report was produced with
+def environment_info() -> dict:
+    import numpy, PIL
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+# Benchmark cases
+# --------------------------------------------------------------------
+
+'''
+Runs one case in this process and writes its result to a JSON file (the `case` subcommand, spawned by `run`)
+'''
+def run_case(args):
+    from benchmarks.pipeline import PIPELINES, install_offline_stubs
+
+    pipeline = PIPELINES[args.pipeline]
+
+    # Import everything the pipeline needs up front so module loading isn't billed to the first stage
+    from processing_scripts import encoders, helpers, image_context, palette
+    from services import image_upload_service
+    if args.pipeline == "overlay":
+        import Pylette
+        from processing_scripts import image_transformer
+
+    runs = []
+    with tempfile.TemporaryDirectory() as directory:
+        install_offline_stubs(directory)
+        baseline_rss = peak_rss_bytes()
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            run = pipeline(args.image, directory, args.profile)
+            run["wall_seconds"] = time.perf_counter() - start
+            runs.append(run)
+
+    result = {
+        "stages": {stage: statistics.median(run["stages"][stage] for run in runs) for stage in runs[0]["stages"]},
+        "wall_seconds": statistics.median(run["wall_seconds"] for run in runs),
+        "output_size": runs[0]["output_size"],
+        "output_bytes": runs[0]["output_bytes"],
+        "baseline_rss_bytes": baseline_rss,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    with open(args.result_file, "w") as f:
+        json.dump(result, f)
+
+'''
+Synthesizes the test images and runs every (pipeline, size, orientation) case in its own process
+'''
+def run_suite(args):
+    from benchmarks.synthetic import cached_image, source_dimensions
+
+    sizes = [float(size) for size in args.sizes.split(",")]
+    orientations = args.orientations.split(",")
+    pipelines = args.pipelines.split(",")
+
+    cases = []
+    for megapixels in sizes:
+        for orientation in orientations:
+            print(f"Preparing {megapixels:g} MP {orientation} image", file=sys.stderr)
+            image_path = cached_image(args.image_dir, megapixels, orientation)
+            for pipeline in pipelines:
+                name = f"{pipeline}/{megapixels:g}mp/{orientation}"
+                with tempfile.TemporaryDirectory() as directory:
+                    result_file = os.path.join(directory, "result.json")
+                    command = [sys.executable, "-m", "benchmarks", "case", "--pipeline", pipeline, "--image", image_path,
+                               "--repeat", str(args.repeat), "--result-file", result_file]
+                    if args.profile:
+                        command += ["--profile", args.profile]
+                    # The pipeline prints a lot, only show it when asked
+                    output = None if args.verbose else subprocess.DEVNULL
+                    completed = subprocess.run(command, cwd=REPO_ROOT, stdout=output)
+                    if completed.returncode != 0:
+                        # Keep going, a failing case is reported instead of losing the rest of the run
+                        print(f"{name}: failed with exit status {completed.returncode}", file=sys.stderr)
+                        cases.append({"name": name, "pipeline": pipeline, "megapixels": megapixels, "orientation": orientation,
+                                      "error": f"exit status {completed.returncode}"})
+                        continue
+                    with open(result_file) as f:
+                        result = json.load(f)
+
+                case = {
+                    "name": name,
+                    "pipeline": pipeline,
+                    "megapixels": megapixels,
+                    "orientation": orientation,
+                    "source_size": list(source_dimensions(megapixels, orientation)),
+                    "source_bytes": os.path.getsize(image_path),
+                    **result,
+                }
+                cases.append(case)
+                stages = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in case["stages"].items())
+                rss = f"{case['peak_rss_bytes'] / 2 ** 20:.0f} MiB" if case["peak_rss_bytes"] else "n/a"
+                print(f"{name}: {case['wall_seconds']:.3f}s ({stages}), peak RSS {rss}, output {case['output_bytes']} bytes", file=sys.stderr)
+
+    report = {
+        "schema": REPORT_SCHEMA,
+        "environment": environment_info(),
+        "settings": {"repeat": args.repeat, "encoder_profile": args.profile},
+        "cases": cases,
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(cases)} cases to {args.output}", file=sys.stderr)
+
+# Comparing reports
+# --------------------------------------------------------------------
+
+# Helper function to flatten a case into the metrics that are compared
+def case_metrics(case: dict) -> dict:
+    metrics = {"wall_seconds": case["wall_seconds"]}
+    metrics.update({f"stage.{stage}": seconds for stage, seconds in case["stages"].items()})
+    metrics["peak_rss_bytes"] = case.get("peak_rss_bytes")
+    metrics["output_bytes"] = case["output_bytes"]
+    return metrics
+
+'''
+Compares two reports case by case
+
+Parameters:
+- base: The report to compare against (dict)
+- head: The new report (dict)
+- threshold: Allowed increase in percent before a metric counts as a regression (float)
+
+Returns:
+- A list of (case, metric, base value, head value, change in percent, regressed) rows for the cases present in both reports
+'''
+def compare_reports(base, head, threshold=10.0):
+    base_cases = {case["name"]: case for case in base["cases"]}
+    rows = []
+    for case in head["cases"]:
+        if case["name"] not in base_cases or "error" in case or "error" in base_cases[case["name"]]:
+            continue
+        base_metrics = case_metrics(base_cases[case["name"]])
+        for metric, value in case_metrics(case).items():
+            old = base_metrics.get(metric)
+            if old is None or value is None:
+                continue
+            change = (value - old) / old * 100 if old else 0.0
+            noisy = metric.startswith("stage.") and max(old, value) < MIN_COMPARED_SECONDS
+            rows.append((case["name"], metric, old, value, change, change > threshold and not noisy))
+    return rows
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    print(f"base {base['environment'].get('commit')} -> head {head['environment'].get('commit')}")
+    rows = compare_reports(base, head, args.threshold)
+    for name, metric, old, value, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<28} {metric:<18} {old:>14.4g} {value:>14.4g} {change:>+8.1f}%{flag}")
+
+    regressions = sum(1 for row in rows if row[5])
+    print(f"{regressions} regression(s) above {args.threshold:g}%")
+    return 1 if regressions else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the image processing pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark suite and write a JSON report")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma separated sizes in megapixels")
+    run_parser.add_argument("--orientations", default=DEFAULT_ORIENTATIONS, help="Comma separated orientations")
+    run_parser.add_argument("--pipelines", default=DEFAULT_PIPELINES, help="Comma separated pipelines (overlay, border)")
+    run_parser.add_argument("--repeat", type=int, default=1, help="Runs per case, the median is reported")
+    run_parser.add_argument("--profile", default=None, help="Encoder profile (defaults to ENCODER_PROFILE)")
+    run_parser.add_argument("--image-dir", default=DEFAULT_IMAGE_DIR, help="Where synthesized images are kept between runs")
+    run_parser.add_argument("--output", default="-", help="Report file (- for stdout)")
+    run_parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+
+    case_parser = commands.add_parser("case", help="Run a single case (used internally by run)")
+    case_parser.add_argument("--pipeline", required=True)
+    case_parser.add_argument("--image", required=True)
+    case_parser.add_argument("--repeat", type=int, default=1)
+    case_parser.add_argument("--profile", default=None)
+    case_parser.add_argument("--result-file", required=True)
+
+    compare_parser = commands.add_parser("compare", help="Compare two reports")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="Allowed increase in percent")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run_suite(args)
+    elif args.command == "case":
+        run_case(args)
+    else:
+        return compare(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import os
+from PIL import Image
+
+'''
+Runs of the two pipelines through their real entry points
+
+`run_overlay` and `run_border` call the functions the web app and the batch workers call
+(`process_saved_overlay`, which runs `process_image` and the encode, and `process_border_image`)
+inside a trace of their own, so the stages those functions record (see
+processing_scripts.instrumentation) are the stage timings of the benchmark. Geocoding and the
+timezone lookup are replaced by fixed answers, and the result cache and the shared stage metrics
+are switched off (`install_offline_stubs`), so a run needs no network, every repeat really
+renders and nothing is added to the web app's stores.
+'''
+
+# The stages each pipeline records (in order), the geocode stage never runs with the fixed coordinates
+OVERLAY_STAGES = ("open", "metadata", "overlay", "palette", "composite", "save")
+BORDER_STAGES = ("open", "border", "save")
+
+# Fixed location used for every overlay case (Zermatt)
+BENCHMARK_COORDINATES = (46.0207, 7.7491)
+BENCHMARK_TIMEZONE = "Europe/Zurich"
+BENCHMARK_TITLE = "Benchmark"
+
+# Print aspect ratio per shape of the upright image (a square image stacks into a portrait layout)
+BENCHMARK_PRINT_ASPECT_RATIOS = {"landscape": (3, 2), "portrait": (2, 3), "square": (4, 5)}
+
+# White border settings used for every border case
+BENCHMARK_BORDER_ASPECT_RATIO = (4, 5)
+BENCHMARK_BORDER_SIZE = 5
+
+'''
+Replaces geocoding and the timezone lookup with fixed answers so a benchmark never leaves the machine, and
+switches off the result cache (every repeat renders again) and the shared stage metrics
+
+Parameters:
+- scratch_dir: A directory for the (disabled) result cache's index (str)
+'''
+def install_offline_stubs(scratch_dir):
+    from processing_scripts import helpers
+    from processing_scripts.geocode_cache import GeocodeCache, MemoryGeocodeStore, set_geocode_cache
+    from processing_scripts.instrumentation import StageMetrics, set_stage_metrics
+    from services.result_cache import ResultCache, set_result_cache
+
+    set_geocode_cache(GeocodeCache(geocoder=lambda address: BENCHMARK_COORDINATES, store=MemoryGeocodeStore()))
+    helpers.lookup_timezone = lambda latitude, longitude: BENCHMARK_TIMEZONE
+    set_result_cache(ResultCache(os.path.join(scratch_dir, "results"), max_bytes=0))
+    set_stage_metrics(StageMetrics(None))
+
+# Helper function to turn the trace of a run into the benchmark result
+def _run_result(current_trace, output_path) -> dict:
+    if current_trace.failed or output_path is None:
+        raise RuntimeError(f"The {current_trace.pipeline} pipeline failed on {current_trace.name}")
+    with Image.open(output_path) as output:
+        output_size = list(output.size)
+    return {
+        "stages": {name: seconds for name, seconds, _ in current_trace.stages},
+        "output_size": output_size,
+        "output_bytes": os.path.getsize(output_path),
+    }
+
+'''
+Runs the metadata overlay pipeline on one image (process_saved_overlay: process_image, encode and renditions)
+
+Parameters:
+- image_path: The source image (str)
+- output_dir: The folder the result is written to (str)
+- encoder_profile: The encoder profile to save with (str)
+
+Returns:
+- A dict with the seconds per stage ("stages"), the output dimensions ("output_size") and the encoded size ("output_bytes")
+'''
+def run_overlay(image_path, output_dir, encoder_profile=None):
+    from processing_scripts.image_context import get_effective_size
+    from processing_scripts.instrumentation import trace
+    from services.image_upload_service import process_saved_overlay
+
+    # The upright shape decides the print aspect ratio
+    width, height = get_effective_size(image_path)
+    shape = "landscape" if width > height else "portrait" if height > width else "square"
+
+    latitude, longitude = BENCHMARK_COORDINATES
+    form = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "photoName": BENCHMARK_TITLE,
+        "aspectRatio": "Custom",
+        "customAspectRatio": "%d:%d" % BENCHMARK_PRINT_ASPECT_RATIOS[shape],
+        "encoderProfile": encoder_profile,
+    }
+
+    # The pipeline's own trace joins this one, the upload digest is computed while ingesting in the web app
+    with trace("overlay", os.path.basename(image_path)) as current_trace:
+        output_path = process_saved_overlay(image_path, form, output_dir, upload_digest="benchmark")
+    return _run_result(current_trace, output_path)
+
+'''
+Runs the white border pipeline on one image (process_border_image: border, encode and renditions)
+
+Parameters:
+- image_path: The source image (str)
+- output_dir: The folder the result is written to (str)
+- encoder_profile: The encoder profile to save with (str)
+
+Returns:
+- A dict with the seconds per stage ("stages"), the output dimensions ("output_size") and the encoded size ("output_bytes")
+'''
+def run_border(image_path, output_dir, encoder_profile=None):
+    from processing_scripts.instrumentation import trace
+    from services.image_upload_service import process_border_image
+
+    with trace("border", os.path.basename(image_path)) as current_trace:
+        output_path = process_border_image(image_path, BENCHMARK_BORDER_ASPECT_RATIO, BENCHMARK_BORDER_SIZE, output_dir, encoder_profile, upload_digest="benchmark")
+    return _run_result(current_trace, output_path)
+
+PIPELINES = {
+    "overlay": run_overlay,
+    "border": run_border,
+}
@@ -0,0 +1,131 @@
+import math, os, piexif
+from PIL import Image, ImageChops
+
+'''
+Synthetic test images
+
+Builds JPEGs the size of real camera files: a smooth random color field (so the palette step has
+something to cluster and the encoder has something to compress) with Gaussian grain on top, plus
+the EXIF block a camera would write. Portrait images are stored landscape with orientation 6, the
+way cameras record them, so the decode stage pays for the transpose just like a real upload.
+'''
+
+ORIENTATIONS = ("landscape", "portrait", "square")
+
+# Camera bodies the EXIF is borrowed from (closest entry by megapixels is used)
+CAMERAS = {
+    12: ("SONY", "ILCE-7SM3", "FE 24-70mm F2.8 GM II"),
+    24: ("NIKON CORPORATION", "NIKON Z 6_2", "NIKKOR Z 24-70mm f/4 S"),
+    40: ("FUJIFILM", "X-T5", "XF16-55mmF2.8 R LM WR"),
+    60: ("SONY", "ILCE-7RM4A", "FE 24-105mm F4 G OSS"),
+}
+
+# Quality the synthesized JPEGs are written with (typical of an in-camera "fine" JPEG)
+SOURCE_JPEG_QUALITY = 92
+
+# Helper function to work out the stored pixel dimensions of a test image
+def source_dimensions(megapixels: float, orientation: str) -> tuple[int, int]:
+    """
+    Returns the stored (width, height) of a synthetic image. Landscape and portrait images are 3:2
+    (portrait is stored landscape and rotated by its EXIF orientation), square images are 1:1.
+
+    Parameters:
+        megapixels (float): The target size in megapixels.
+        orientation (str): One of ORIENTATIONS.
+
+    Returns:
+        tuple[int, int]: The stored (width, height) in pixels.
+    """
+    if orientation not in ORIENTATIONS:
+        raise ValueError(f"Unknown orientation: {orientation}")
+
+    pixels = megapixels * 1_000_000
+    if orientation == "square":
+        side = round(math.sqrt(pixels))
+        return (side, side)
+
+    # Exact multiples of 3:2 so the "Default" aspect ratio reduces to 3:2 like a real camera file
+    unit = round(math.sqrt(pixels / 6))
+    return (3 * unit, 2 * unit)
+
+# Helper function to build the EXIF block of a test image
+def synthetic_exif(megapixels: float, orientation: str) -> bytes:
+    """
+    Returns an EXIF block with the camera, lens, exposure and capture time fields the metadata overlay reads.
+
+    Parameters:
+        megapixels (float): Used to pick the camera body from CAMERAS.
+        orientation (str): One of ORIENTATIONS (portrait gets orientation 6).
+
+    Returns:
+        bytes: The EXIF block, ready to pass to `Image.save(exif=...)`.
+    """
+    make, model, lens = CAMERAS[min(CAMERAS, key=lambda size: abs(size - megapixels))]
+    exif = {
+        "0th": {
+            piexif.ImageIFD.Make: make.encode(),
+            piexif.ImageIFD.Model: model.encode(),
+            piexif.ImageIFD.Orientation: 6 if orientation == "portrait" else 1,
+            piexif.ImageIFD.Software: b"Benchmark 1.0",
+            piexif.ImageIFD.DateTime: b"2024:06:01 12:30:00",
+            piexif.ImageIFD.XResolution: (300, 1),
+            piexif.ImageIFD.YResolution: (300, 1),
+            piexif.ImageIFD.ResolutionUnit: 2,
+        },
+        "Exif": {
+            piexif.ExifIFD.DateTimeOriginal: b"2024:06:01 12:30:00",
+            piexif.ExifIFD.DateTimeDigitized: b"2024:06:01 12:30:00",
+            piexif.ExifIFD.ExposureTime: (1, 250),
+            piexif.ExifIFD.FNumber: (56, 10),
+            piexif.ExifIFD.ISOSpeedRatings: 200,
+            piexif.ExifIFD.FocalLength: (330, 10),
+            piexif.ExifIFD.FocalLengthIn35mmFilm: 50,
+            piexif.ExifIFD.ExposureBiasValue: (-1, 3),
+            piexif.ExifIFD.LensMake: make.encode(),
+            piexif.ExifIFD.LensModel: lens.encode(),
+            piexif.ExifIFD.ColorSpace: 1,
+        },
+        "GPS": {},
+        "1st": {},
+    }
+    return piexif.dump(exif)
+
+# Helper function to write a synthetic test image
+def synthesize_image(path: str, megapixels: float, orientation: str, seed: int=0) -> str:
+    """
+    Writes a synthetic camera JPEG (smooth color field, grain and EXIF) to path.
+
+    Parameters:
+        path (str): Where to write the JPEG.
+        megapixels (float): The target size in megapixels.
+        orientation (str): One of ORIENTATIONS.
+        seed (int, optional): Seed for the random color field. Default is 0.
+
+    Returns:
+        str: The path that was written.
+    """
+    width, height = source_dimensions(megapixels, orientation)
+
+    # A coarse grid of random colors blown up with bicubic resampling gives sky/landscape-like gradients
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    grid = rng.integers(0, 256, (max(2, height // 384), max(2, width // 384), 3), dtype=np.uint8)
+    image = Image.fromarray(grid, "RGB").resize((width, height), Image.Resampling.BICUBIC)
+
+    # Sensor-like grain, centered on zero so the colors stay where they are
+    grain = Image.effect_noise((width, height), 10).convert("RGB")
+    image = ImageChops.add(image, grain, offset=-128)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    image.save(path, "JPEG", quality=SOURCE_JPEG_QUALITY, exif=synthetic_exif(megapixels, orientation))
+    return path
+
+# Helper function to reuse a synthesized image between runs (the big ones take a while to build)
+def cached_image(directory: str, megapixels: float, orientation: str) -> str:
+    """
+    Returns the path of the synthetic image for a case, synthesizing it into directory if needed.
+    """
+    path = os.path.join(directory, f"synthetic_{megapixels:g}mp_{orientation}.jpg")
+    if not os.path.isfile(path):
+        synthesize_image(path, megapixels, orientation)
+    return path
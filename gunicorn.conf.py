@@ -0,0 +1,27 @@
+import os, multiprocessing
+
+# Gunicorn settings for the production server (every value can be overridden from the environment)
+# --------------------------------------------------------------------
+
+wsgi_app = "wsgi:create_app()"
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+
+# Web workers and threads per worker. The image work runs in the batch process pool, so one threaded
+# web worker keeps uploads and polling responsive. Background jobs run in the worker that accepted them
+# and keep their progress in cache/jobs.sqlite3, so any worker can answer the /jobs polling requests.
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_class = "gthread"
+
+# Load the app and the heavy processing state once in the master, before forking the workers
+preload_app = True
+
+# Large uploads and synchronous batches can take a while
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))
+graceful_timeout = 30
+
+# Split the CPUs between the web workers' batch pools instead of giving each of them all of them
+os.environ.setdefault("BATCH_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
+
+accesslog = "-"
+errorlog = "-"
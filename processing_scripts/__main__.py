@@ -0,0 +1,4 @@
+import sys
+from processing_scripts.cli import main
+
+sys.exit(main())
@@ -0,0 +1,383 @@
+import argparse, csv, glob, hashlib, json, logging, math, os, sys, time
+from PIL import Image, ImageOps
+from processing_scripts.helpers import create_simple_border, get_coordinates_from_address, saved_image_path, to_float
+from processing_scripts.image_context import get_effective_size, load_image_context, request_draft, DRAFT_MAX_SIZE
+from processing_scripts.encoders import encode_image, get_encoder_profile, DEFAULT_ENCODER_PROFILE
+from processing_scripts.instrumentation import STAGES, StageMetrics, set_stage_metrics, stage, trace
+from processing_scripts.strip_render import create_strip_border, use_strip_render
+from services.batch_executor import iter_batch, shutdown_batch_executor, DEFAULT_BATCH_WORKERS
+
+'''
+Headless batch command line
+
+    python -m processing_scripts overlay ~/Pictures/Archive --manifest photos.csv --output renders/ --jobs 8
+    python -m processing_scripts border "shoots/**/*.jpg" --aspect-ratio 4:5 --border-size 5 --output borders/
+
+Renders every input image (directories, files or glob patterns) into the output folder without ever
+prompting. Per-file parameters (title, coordinates or address, aspect ratio, border size) come from
+an optional CSV or JSON manifest, with the command line options as defaults. Files are rendered in
+parallel on the batch process pool, and an output is skipped when it is still up to date: the
+output folder keeps a state file with a fingerprint of each output's source file (size and
+modification time), parameters and encoder profile, and only outputs whose fingerprint changed (or
+that are missing) are rendered again. A throughput summary is printed at the end.
+'''
+
+logger = logging.getLogger(__name__)
+
+# Extensions picked up when a directory is given as input
+INPUT_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp"}
+
+# Largest image (megapixels) the command line opens. Pillow refuses images over twice MAX_IMAGE_PIXELS as
+# decompression bombs (about 179 MP by default), which the web app keeps for uploads. Local scans and
+# panoramas are trusted files and rendered in strips up to this size.
+DEFAULT_MAX_IMAGE_MEGAPIXELS = float(os.environ.get("MAX_IMAGE_MEGAPIXELS", 400))
+
+# Output name suffix per mode (the overlay one is what save_image has always used)
+OUTPUT_SUFFIXES = {"overlay": "_IT", "border": "_border"}
+
+# Manifest columns (keys for JSON manifests) and how their values are parsed
+MANIFEST_FIELDS = {
+    "title": lambda value: value or None,
+    "latitude": to_float,
+    "longitude": to_float,
+    "address": lambda value: value or None,
+    "aspect_ratio": lambda value: value or None,
+    "border_size": lambda value: int(value) if value not in (None, "") else None,
+}
+
+# Name of the state file kept in the output folder
+STATE_FILENAME = ".image_transformer_state.json"
+
+# Bump when the rendering changes so every output is considered out of date
+RENDER_STATE_VERSION = 1
+
+# How many finished renders are recorded before the state file is written again
+STATE_SAVE_INTERVAL = 50
+
+# Inputs and manifests
+# --------------------------------------------------------------------
+
+# Helper function to expand the input arguments into a sorted list of image files
+def collect_inputs(patterns: list[str], recursive: bool=False, exclude_dir: str=None) -> list[str]:
+    """
+    Expands directories (their image files, optionally recursively), glob patterns and plain paths.
+
+    Parameters:
+        patterns (list[str]): Directories, files or glob patterns ("**" matches nested folders).
+        recursive (bool, optional): Walk directories recursively. Default is False.
+        exclude_dir (str, optional): Files inside this folder are ignored (the output folder).
+
+    Returns:
+        list[str]: The image paths, sorted and without duplicates.
+    """
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                for root, _, filenames in os.walk(pattern):
+                    found.update(os.path.join(root, filename) for filename in filenames)
+            else:
+                found.update(os.path.join(pattern, filename) for filename in os.listdir(pattern))
+        else:
+            found.update(glob.glob(pattern, recursive=True))
+
+    excluded = os.path.abspath(exclude_dir) + os.sep if exclude_dir else None
+    return sorted(
+        path for path in found
+        if os.path.isfile(path)
+        and os.path.splitext(path)[1].lower() in INPUT_EXTENSIONS
+        and not (excluded and os.path.abspath(path).startswith(excluded))
+    )
+
+# Helper function to read a per-file parameter manifest
+def load_manifest(path: str) -> dict:
+    """
+    Reads a CSV (header row with a `filename` column) or JSON manifest (a list of objects with a
+    `filename` key, or an object mapping filenames to parameters).
+
+    Parameters:
+        path (str): The manifest file.
+
+    Returns:
+        dict: The parsed parameters (see MANIFEST_FIELDS) keyed by filename as written in the manifest.
+    """
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        rows = [dict(params, filename=filename) for filename, params in data.items()] if isinstance(data, dict) else data
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+
+    manifest = {}
+    for row in rows:
+        filename = row.get("filename")
+        if not filename:
+            raise ValueError(f"Manifest entry without a filename: {row}")
+        # JSON manifests may hold numbers, CSV ones only strings
+        manifest[filename] = {field: parse(None if row[field] is None else str(row[field]))
+                              for field, parse in MANIFEST_FIELDS.items() if field in row}
+    return manifest
+
+# Helper function to find the manifest entry of an input (by the path as given, then by file name)
+def manifest_entry(manifest: dict, path: str) -> dict:
+    return manifest.get(path) or manifest.get(os.path.normpath(path)) or manifest.get(os.path.basename(path)) or {}
+
+# Helper function to turn an aspect ratio argument into a (width, height) tuple
+def parse_aspect_ratio(value: str, image_size: tuple[int, int]) -> tuple[int, int]:
+    """
+    Parses "W:H", or "Default" for the image's own (reduced) aspect ratio.
+
+    Parameters:
+        value (str): The aspect ratio argument.
+        image_size (tuple[int, int]): The upright (width, height) of the image, used for "Default".
+
+    Returns:
+        tuple[int, int]: The aspect ratio.
+    """
+    if value is None or value == "Default":
+        divisor = math.gcd(*image_size)
+        return (image_size[0] // divisor, image_size[1] // divisor)
+    try:
+        width, height = map(int, value.split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid aspect ratio: {value}")
+    return (width, height)
+
+# Rendering (runs in the batch worker processes)
+# --------------------------------------------------------------------
+
+# Helper function to write an output without ever leaving a half-written file under its final name
+def _encode_atomically(image: Image, output_path: str, encoder_profile: str, exif_bytes: bytes, icc_profile: bytes):
+    root, extension = os.path.splitext(output_path)
+    temporary = f"{root}.part-{os.getpid()}{extension}"
+    try:
+        encode_image(image, temporary, encoder_profile, exif_bytes, icc_profile)
+        os.replace(temporary, output_path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+'''
+Renders one file (the batch job run on the worker processes)
+
+Parameters:
+- source_path: The input image (str)
+- output_path: Where the result is written (str)
+- mode: "overlay" or "border" (str)
+- params: The resolved parameters of this file (dict, see MANIFEST_FIELDS)
+- encoder_profile: The encoder profile to save with (str)
+
+Returns:
+- A dict with the output path, the input size in megapixels, the output size in bytes and the seconds per stage
+'''
+def render_file(source_path, output_path, mode, params, encoder_profile):
+    # Worker processes get the image size limit from the environment, like the metrics location
+    Image.MAX_IMAGE_PIXELS = int(float(os.environ.get("MAX_IMAGE_MEGAPIXELS", DEFAULT_MAX_IMAGE_MEGAPIXELS)) * 1_000_000 / 2)
+
+    with trace(mode, os.path.basename(source_path)) as current_trace:
+        if mode == "overlay":
+            with stage("open"):
+                context = load_image_context(source_path)
+            latitude, longitude = params.get("latitude"), params.get("longitude")
+            if (latitude is None or longitude is None) and params.get("address"):
+                with stage("geocode"):
+                    latitude, longitude = get_coordinates_from_address(params["address"])
+
+            # Imported here so the border mode never loads Pylette/NumPy
+            from processing_scripts.image_transformer import process_image
+
+            size = context.size
+            image = process_image(context, latitude=latitude, longitude=longitude, photo_title=params.get("title"),
+                                  print_aspect_ratio=parse_aspect_ratio(params.get("aspect_ratio"), size))
+            exif_bytes, icc_profile = context.exif_bytes, context.icc_profile
+        else:
+            # The upright size of the source (a draft decodes fewer pixels, "Default" still means the original ratio)
+            size = get_effective_size(source_path)
+            with Image.open(source_path) as img:
+                with stage("open"):
+                    if params.get("quality") == "draft":
+                        request_draft(img, DRAFT_MAX_SIZE)
+                    exif_bytes = img.info.get("exif")
+                    icc_profile = img.info.get("icc_profile")
+                    # Very large images are bordered in strips, read band by band from the file when they are encoded
+                    strip_render = use_strip_render(*img.size)
+                    if not strip_render:
+                        ImageOps.exif_transpose(img, in_place=True)
+                with stage("border"):
+                    aspect_ratio = parse_aspect_ratio(params.get("aspect_ratio"), size)
+                    if strip_render:
+                        image = create_strip_border(source_path, aspect_ratio, params.get("border_size") or 0)
+                    else:
+                        image = create_simple_border(img, aspect_ratio, params.get("border_size") or 0)
+
+        with stage("save"):
+            _encode_atomically(image, output_path, encoder_profile, exif_bytes, icc_profile)
+
+    return {
+        "output": output_path,
+        "megapixels": size[0] * size[1] / 1_000_000,
+        "output_bytes": os.path.getsize(output_path),
+        "stages": {name: seconds for name, seconds, _ in current_trace.stages},
+    }
+
+# Up-to-date tracking
+# --------------------------------------------------------------------
+
+class RenderState:
+    """
+    The fingerprints of the outputs in an output folder, kept in STATE_FILENAME.
+
+    Parameters:
+        output_dir (str): The output folder.
+    """
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, STATE_FILENAME)
+        self.outputs = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.outputs = json.load(f).get("outputs", {})
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable state file %s: %s", self.path, e)
+
+    @staticmethod
+    def fingerprint(source_path: str, mode: str, params: dict, encoder_profile: str) -> str:
+        """
+        Builds the fingerprint of an output from its source file's size and modification time, the
+        parameters and the encoder profile (no pixels are read, so checking thousands of files is cheap).
+        """
+        source = os.stat(source_path)
+        payload = json.dumps([RENDER_STATE_VERSION, mode, source.st_size, source.st_mtime_ns, params, encoder_profile], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_current(self, output_path: str, fingerprint: str) -> bool:
+        return self.outputs.get(os.path.basename(output_path)) == fingerprint and os.path.isfile(output_path)
+
+    def mark(self, output_path: str, fingerprint: str):
+        self.outputs[os.path.basename(output_path)] = fingerprint
+
+    def save(self):
+        # Written through a temporary file so an interrupted run never leaves a truncated state file
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"version": RENDER_STATE_VERSION, "outputs": self.outputs}, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+
+# Command line
+# --------------------------------------------------------------------
+
+# Helper function to format a byte count for the summary
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m processing_scripts", description="Render metadata overlays or white borders for a batch of images")
+    parser.add_argument("mode", choices=sorted(OUTPUT_SUFFIXES), help="overlay (metadata + palette, process_image) or border (create_simple_border)")
+    parser.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="Output folder")
+    parser.add_argument("-m", "--manifest", help="CSV or JSON file with per-file parameters (filename, title, latitude, longitude, address, aspect_ratio, border_size)")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_BATCH_WORKERS, help=f"Worker processes (default {DEFAULT_BATCH_WORKERS})")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Walk input directories recursively")
+    parser.add_argument("--profile", default=DEFAULT_ENCODER_PROFILE, help=f"Encoder profile (default {DEFAULT_ENCODER_PROFILE})")
+    parser.add_argument("--force", action="store_true", help="Render every file, even if its output is up to date")
+    parser.add_argument("--title", help="Default photo title")
+    parser.add_argument("--latitude", type=float, help="Default latitude")
+    parser.add_argument("--longitude", type=float, help="Default longitude")
+    parser.add_argument("--address", help="Default address (geocoded when no coordinates are given)")
+    parser.add_argument("--aspect-ratio", default="Default", help="Default aspect ratio, W:H or Default (the image's own)")
+    parser.add_argument("--border-size", type=int, default=5, help="Default border size in percent of the shorter side (border mode)")
+    parser.add_argument("--quality", choices=("full", "draft"), default="full", help=f"Border mode: full resolution, or a draft decoded at reduced scale (long edge about {DRAFT_MAX_SIZE}px)")
+    parser.add_argument("--max-megapixels", type=float, default=DEFAULT_MAX_IMAGE_MEGAPIXELS, help=f"Largest image to open, in megapixels (default {DEFAULT_MAX_IMAGE_MEGAPIXELS:g}, larger than the web app's decompression bomb limit)")
+    parser.add_argument("--metrics-path", default="", help="Also add the stage timings to this metrics store (e.g. the web app's cache/metrics.sqlite3)")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="Log more (-vv for the pipeline's debug output)")
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)], format="%(levelname)s %(name)s: %(message)s")
+
+    # Worker processes read the metrics location (disabled unless asked for) and the image size limit from the environment
+    os.environ["METRICS_PATH"] = args.metrics_path
+    os.environ["MAX_IMAGE_MEGAPIXELS"] = str(args.max_megapixels)
+    set_stage_metrics(StageMetrics(args.metrics_path))
+
+    encoder_profile, _ = get_encoder_profile(args.profile)
+    manifest = load_manifest(args.manifest) if args.manifest else {}
+    os.makedirs(args.output, exist_ok=True)
+    sources = collect_inputs(args.inputs, args.recursive, exclude_dir=args.output)
+    if not sources:
+        print("No input images found")
+        return 1
+
+    defaults = {
+        "title": args.title,
+        "latitude": args.latitude,
+        "longitude": args.longitude,
+        "address": args.address,
+        "aspect_ratio": args.aspect_ratio,
+        "border_size": args.border_size if args.mode == "border" else None,
+        "quality": args.quality if args.mode == "border" else None,
+    }
+
+    # Work out every output up front, two inputs with the same name would overwrite each other
+    state = RenderState(args.output)
+    jobs, fingerprints, outputs = [], [], {}
+    skipped = 0
+    for source in sources:
+        output_path = saved_image_path(source, args.output, encoder_profile, OUTPUT_SUFFIXES[args.mode])
+        if output_path in outputs:
+            print(f"{source} and {outputs[output_path]} would both be written to {output_path}, rename one of them")
+            return 1
+        outputs[output_path] = source
+
+        entry = manifest_entry(manifest, source)
+        params = {field: entry[field] if entry.get(field) is not None else default for field, default in defaults.items()}
+        fingerprint = RenderState.fingerprint(source, args.mode, params, encoder_profile)
+        if not args.force and state.is_current(output_path, fingerprint):
+            skipped += 1
+            continue
+        jobs.append((source, output_path, args.mode, params, encoder_profile))
+        fingerprints.append(fingerprint)
+
+    print(f"{len(sources)} images, {skipped} up to date, rendering {len(jobs)} with {args.jobs} worker(s)")
+
+    start = time.perf_counter()
+    rendered = failed = 0
+    megapixels = output_bytes = 0
+    stage_seconds = {}
+    try:
+        for done, (index, result) in enumerate(iter_batch(render_file, jobs, args.jobs), start=1):
+            source = jobs[index][0]
+            if result is None:
+                failed += 1
+                print(f"[{done}/{len(jobs)}] {source} failed")
+                continue
+
+            rendered += 1
+            megapixels += result["megapixels"]
+            output_bytes += result["output_bytes"]
+            for name, seconds in result["stages"].items():
+                stage_seconds[name] = stage_seconds.get(name, 0.0) + seconds
+            state.mark(result["output"], fingerprints[index])
+            if rendered % STATE_SAVE_INTERVAL == 0:
+                state.save()
+            print(f"[{done}/{len(jobs)}] {source} -> {result['output']} ({sum(result['stages'].values()):.2f}s)")
+    finally:
+        # Keep what was rendered even if the run is interrupted
+        state.save()
+        shutdown_batch_executor(wait=False)
+
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {rendered}, skipped {skipped} up to date, failed {failed} in {elapsed:.1f}s")
+    if rendered:
+        print(f"Throughput: {rendered / elapsed:.2f} images/s, {megapixels / elapsed:.1f} MP/s, {_format_bytes(output_bytes)} written")
+        total = sum(stage_seconds.values())
+        order = {name: position for position, name in enumerate(STAGES)}
+        breakdown = ", ".join(f"{name} {seconds / total:.0%}" for name, seconds in sorted(stage_seconds.items(), key=lambda item: order.get(item[0], len(STAGES))))
+        print(f"Time by stage: {breakdown}")
+    return 1 if failed else 0
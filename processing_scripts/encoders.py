@@ -0,0 +1,244 @@
+import io, logging, os, threading, time
+from PIL import ExifTags, Image
+from processing_scripts.image_context import EXIF_ORIENTATION_TAG
+
+logger = logging.getLogger(__name__)
+
+# Encoder profiles
+# --------------------------------------------------------------------
+
+"""
+Named output settings for every place a processed image is written. `format` None keeps the
+container implied by the output filename (what the app always did), any other format replaces
+the extension. `keep_icc` / `keep_exif` copy the source's color profile and EXIF block into the
+output (the EXIF orientation is reset since the pixels are already upright, and the location,
+maker notes and owner/serial numbers are removed, see PRIVATE_EXIF_TAGS).
+"""
+ENCODER_PROFILES = {
+    # Highest quality, slowest and largest (the original hardcoded settings, no EXIF written)
+    "archive": {
+        "label": "Archive (maximum quality)",
+        "format": None,
+        "quality": 100,
+        "subsampling": None,
+        "optimize": True,
+        "progressive": True,
+        "keep_icc": True,
+        "keep_exif": False,
+    },
+    # Visually lossless for prints, full chroma resolution. The only profile that keeps the camera EXIF,
+    # so picking it is the explicit opt-in
+    "print": {
+        "label": "Print (high quality JPEG, keeps camera EXIF)",
+        "format": "JPEG",
+        "quality": 95,
+        "subsampling": "4:4:4",
+        "optimize": True,
+        "progressive": False,
+        "keep_icc": True,
+        "keep_exif": True,
+    },
+    # Sharing online, EXIF (camera details, GPS) is dropped
+    "web": {
+        "label": "Web (smaller JPEG)",
+        "format": "JPEG",
+        "quality": 85,
+        "subsampling": "4:2:0",
+        "optimize": True,
+        "progressive": True,
+        "keep_icc": True,
+        "keep_exif": False,
+    },
+    # Fast, small previews
+    "preview": {
+        "label": "Preview (WebP)",
+        "format": "WEBP",
+        "quality": 75,
+        "method": 4,
+        "keep_icc": True,
+        "keep_exif": False,
+    },
+    # Lossless
+    "png": {
+        "label": "Lossless (PNG)",
+        "format": "PNG",
+        "compress_level": 6,
+        "keep_icc": True,
+        "keep_exif": False,
+    },
+    # Smallest files, only offered when Pillow was built with AVIF support
+    "avif": {
+        "label": "AVIF (smallest)",
+        "format": "AVIF",
+        "quality": 70,
+        "keep_icc": True,
+        "keep_exif": False,
+    },
+}
+
+# Profile used when a request doesn't pick one (override with the ENCODER_PROFILE environment variable)
+DEFAULT_ENCODER_PROFILE = os.environ.get("ENCODER_PROFILE", "archive")
+
+# File extension written for each explicit format
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp", "AVIF": ".avif", "PNG": ".png"}
+
+# Modes each format can store directly (anything else is converted to RGB first)
+FORMAT_MODES = {"JPEG": ("RGB", "L", "CMYK"), "WEBP": ("RGB", "RGBA"), "AVIF": ("RGB", "RGBA")}
+
+# Tags of the Exif sub-IFD that identify the camera or its owner (MakerNote holds vendor data such as
+# serial numbers and, for some cameras, the location again)
+PRIVATE_EXIF_TAGS = (
+    ExifTags.Base.MakerNote,
+    ExifTags.Base.CameraOwnerName,
+    ExifTags.Base.BodySerialNumber,
+    ExifTags.Base.LensSerialNumber,
+    ExifTags.Base.ImageUniqueID,
+)
+
+# Helper function to check whether this Pillow build can write a format
+def format_supported(image_format: str) -> bool:
+    """
+    Returns True if Pillow has an encoder for the given format (e.g. "AVIF" needs a build with libavif).
+    """
+    Image.init()
+    return image_format is None or image_format.upper() in Image.SAVE
+
+# Helper function to list the profiles this Pillow build can actually write
+def available_profiles() -> dict:
+    """
+    Returns the encoder profiles usable on this host, keyed by name.
+
+    Returns:
+        dict: The subset of ENCODER_PROFILES whose format is supported.
+    """
+    return {name: profile for name, profile in ENCODER_PROFILES.items() if format_supported(profile["format"])}
+
+# Helper function to resolve the profile a request asked for
+def get_encoder_profile(name: str=None) -> tuple[str, dict]:
+    """
+    Looks up an encoder profile, falling back to DEFAULT_ENCODER_PROFILE when no name is given.
+
+    Parameters:
+        name (str, optional): The profile name (case-insensitive).
+
+    Returns:
+        tuple[str, dict]: The profile name and its settings.
+
+    Raises:
+        ValueError: If the profile is unknown or not supported by this Pillow build.
+    """
+    name = (name or DEFAULT_ENCODER_PROFILE).strip().lower()
+    profiles = available_profiles()
+    if name not in profiles:
+        raise ValueError(f"Unknown encoder profile: {name} (available: {', '.join(profiles)})")
+    return name, profiles[name]
+
+# Helper function to work out the output filename for a profile
+def output_filename(filename: str, profile: str=None) -> str:
+    """
+    Swaps the extension of a filename for the one the profile writes (profiles without a fixed
+    format keep the original extension).
+
+    Parameters:
+        filename (str): The filename (or path) the output would otherwise have.
+        profile (str, optional): The encoder profile name.
+
+    Returns:
+        str: The filename with the profile's extension.
+    """
+    _, settings = get_encoder_profile(profile)
+    if settings["format"] is None:
+        return filename
+    return os.path.splitext(filename)[0] + FORMAT_EXTENSIONS[settings["format"]]
+
+# Helper function to reset the orientation tag of a source EXIF block
+def upright_exif(exif_bytes: bytes) -> bytes:
+    """
+    Returns the EXIF block with its orientation set to 1, since the processed pixels are already upright,
+    and without the GPS location and the tags of PRIVATE_EXIF_TAGS.
+    """
+    exif = Image.Exif()
+    exif.load(exif_bytes)
+    if exif.get(EXIF_ORIENTATION_TAG, 1) != 1:
+        exif[EXIF_ORIENTATION_TAG] = 1
+
+    # Outputs are shared and printed, where the camera settings are worth keeping but not where the photo was taken
+    exif.pop(ExifTags.IFD.GPSInfo, None)
+    if ExifTags.IFD.Exif in exif:
+        # tobytes writes the sub-IFD from the dict get_ifd keeps, so removing tags from it is enough
+        details = exif.get_ifd(ExifTags.IFD.Exif)
+        for tag in PRIVATE_EXIF_TAGS:
+            details.pop(tag, None)
+    return exif.tobytes()
+
+# Encode statistics
+# --------------------------------------------------------------------
+
+_encoder_stats = {}
+_encoder_stats_lock = threading.Lock()
+
+# Helper function to record one encode
+def record_encode(profile: str, seconds: float, size_bytes: int):
+    with _encoder_stats_lock:
+        stats = _encoder_stats.setdefault(profile, {"count": 0, "seconds": 0.0, "bytes": 0})
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        stats["bytes"] += size_bytes
+
+# Helper function to read the per-profile encode statistics of this process
+def encoder_stats() -> dict:
+    """
+    Returns the number of encodes, total encode seconds and total output bytes for each profile
+    used in this process.
+    """
+    with _encoder_stats_lock:
+        return {profile: dict(stats) for profile, stats in _encoder_stats.items()}
+
+# Encoding
+# --------------------------------------------------------------------
+
+# Helper function that writes an image with the settings of an encoder profile
+def encode_image(image: Image, destination, profile: str=None, exif_bytes: bytes=None, icc_profile: bytes=None) -> dict:
+    """
+    Encodes an image with a named encoder profile and records how long it took and how large it is.
+
+    Parameters:
+        image (Image | StripCanvas): The PIL Image to encode, or a strip rendered canvas (written strip by strip, see strip_render.py).
+        destination (str | file object): The output path, or a binary file object (then the profile must have a fixed format).
+        profile (str, optional): The encoder profile name, DEFAULT_ENCODER_PROFILE if None.
+        exif_bytes (bytes, optional): The source EXIF block, written if the profile keeps EXIF.
+        icc_profile (bytes, optional): The source ICC profile, written if the profile keeps ICC.
+
+    Returns:
+        dict: The `profile`, `format`, `bytes` written and encode `seconds`.
+    """
+    name, settings = get_encoder_profile(profile)
+    image_format = settings["format"]
+    if image_format is None and isinstance(destination, str):
+        image_format = Image.registered_extensions().get(os.path.splitext(destination)[1].lower())
+
+    # Only pass the options the profile sets (Pillow's defaults otherwise)
+    options = {key: settings[key] for key in ("quality", "subsampling", "optimize", "progressive", "method", "compress_level") if settings.get(key) is not None}
+    if settings["keep_icc"] and icc_profile:
+        options["icc_profile"] = icc_profile
+    if settings["keep_exif"] and exif_bytes:
+        options["exif"] = upright_exif(exif_bytes)
+
+    allowed_modes = FORMAT_MODES.get(image_format)
+    if allowed_modes and image.mode not in allowed_modes:
+        image = image.convert("RGB")
+
+    start = time.perf_counter()
+    if isinstance(destination, str):
+        image.save(destination, format=image_format, **options)
+        size_bytes = os.path.getsize(destination)
+    else:
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, **options)
+        size_bytes = buffer.tell()
+        destination.write(buffer.getbuffer())
+    seconds = time.perf_counter() - start
+
+    record_encode(name, seconds, size_bytes)
+    logger.debug("Encoded %sx%s %s with profile '%s' in %.3fs (%s bytes)", image.width, image.height, image_format, name, seconds, size_bytes)
+    return {"profile": name, "format": image_format, "bytes": size_bytes, "seconds": seconds}
@@ -0,0 +1,284 @@
+import os, re, sqlite3, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Geocoding cache settings
+# --------------------------------------------------------------------
+
+# How long a found address stays cached (addresses don't move, so this can be long)
+GEOCODE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# How long a "not found" answer is cached before Nominatim is asked again
+GEOCODE_NEGATIVE_TTL_SECONDS = 24 * 60 * 60
+
+# Most addresses kept in each process's memory layer (least recently used ones are dropped first)
+GEOCODE_MEMORY_ENTRIES = 1024
+
+# Where the persistent cache lives (override with the GEOCODE_CACHE_PATH environment variable)
+DEFAULT_GEOCODE_CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH", os.path.join("cache", "geocode.sqlite3"))
+
+# Address normalization
+# --------------------------------------------------------------------
+
+# Helper function to normalize an address so trivially different spellings share a cache entry
+def normalize_address(address: str) -> str:
+    """
+    Normalizes an address for use as a cache key (case, surrounding/duplicate whitespace and
+    spacing around commas are ignored).
+
+    Parameters:
+        address (str): The address as typed by the user.
+
+    Returns:
+        str: The normalized address.
+    """
+    normalized = address.casefold().strip()
+    normalized = re.sub(r"\s*,\s*", ", ", normalized)
+    normalized = re.sub(r"\s+", " ", normalized)
+    return normalized.strip(" ,.")
+
+# Geocoders
+# --------------------------------------------------------------------
+
+_nominatim = None
+
+# Default geocoder backed by Nominatim (one shared client per process)
+def nominatim_geocoder(address: str) -> tuple[float, float]:
+    """
+    Geocodes an address with Nominatim.
+
+    Parameters:
+        address (str): The address to look up.
+
+    Returns:
+        tuple[float, float]: The (latitude, longitude), or None if Nominatim found nothing.
+    """
+    global _nominatim
+
+    if _nominatim is None:
+        from geopy.geocoders import Nominatim
+        _nominatim = Nominatim(user_agent="image_transformer", timeout=10)
+
+    location = _nominatim.geocode(address)
+    if location:
+        return (location.latitude, location.longitude)
+    return None
+
+# Storage backends
+# --------------------------------------------------------------------
+
+class MemoryGeocodeStore:
+    """
+    Non-persistent backend (used when no cache file is wanted, e.g. in tests).
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key: str, coordinates: tuple[float, float], expires_at: float):
+        with self._lock:
+            self._entries[key] = (coordinates, expires_at)
+
+
+class SQLiteGeocodeStore:
+    """
+    Persistent backend in a local SQLite file, shared by every worker process on the host.
+    """
+
+    def __init__(self, path: str=DEFAULT_GEOCODE_CACHE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "address TEXT PRIMARY KEY, latitude REAL, longitude REAL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # A short-lived connection per call keeps the store safe across threads and forked workers
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key: str):
+        with self._connect() as connection:
+            row = connection.execute("SELECT latitude, longitude, expires_at FROM geocode WHERE address = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        latitude, longitude, expires_at = row
+        coordinates = (latitude, longitude) if latitude is not None else None
+        return (coordinates, expires_at)
+
+    def set(self, key: str, coordinates: tuple[float, float], expires_at: float):
+        latitude, longitude = coordinates if coordinates else (None, None)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO geocode (address, latitude, longitude, expires_at) VALUES (?, ?, ?, ?)",
+                (key, latitude, longitude, expires_at),
+            )
+
+# Geocoding cache
+# --------------------------------------------------------------------
+
+class GeocodeCache:
+    """
+    Caches address -> coordinates lookups in memory (LRU, bounded) and in a persistent store, with
+    a TTL for found addresses, a shorter TTL for "not found" answers, and request coalescing so
+    concurrent lookups of the same address share a single geocoder call.
+
+    Parameters:
+        geocoder (callable): Function taking an address and returning (latitude, longitude) or None.
+        store: Persistent backend with `get(key)` / `set(key, coordinates, expires_at)` (None for memory only).
+        ttl (float): Seconds a found address stays valid.
+        negative_ttl (float): Seconds a "not found" answer stays valid.
+        clock (callable): Returns the current time in seconds (injectable for tests).
+        max_entries (int): Most addresses kept in memory.
+    """
+
+    def __init__(self, geocoder=nominatim_geocoder, store=None, ttl: float=GEOCODE_TTL_SECONDS, negative_ttl: float=GEOCODE_NEGATIVE_TTL_SECONDS, clock=time.time, max_entries: int=GEOCODE_MEMORY_ENTRIES):
+        self.geocoder = geocoder
+        self.store = store
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.max_entries = max_entries
+
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "coalesced": 0}
+
+    def _remembered(self, key: str):
+        # Called with the lock held. An expired entry is dropped, so the store (which another worker may
+        # have refreshed since) gets asked instead of the entry hiding a fresher one
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= self.clock():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry
+
+    def _remember(self, key: str, entry: tuple):
+        # Called with the lock held
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _stored(self, key: str):
+        # Reads the persistent store without holding the lock (it is file I/O), warming the memory copy
+        if self.store is None:
+            return None
+        entry = self.store.get(key)
+        if entry is None or entry[1] <= self.clock():
+            return None
+        with self._lock:
+            self._remember(key, entry)
+        return entry
+
+    def _served(self, entry: tuple) -> tuple[float, float]:
+        # Called with the lock held
+        coordinates = entry[0]
+        self.stats["hits" if coordinates else "negative_hits"] += 1
+        return coordinates if coordinates else (None, None)
+
+    def lookup(self, address: str) -> tuple[float, float]:
+        """
+        Returns the coordinates for an address, geocoding it only on a cache miss.
+
+        Parameters:
+            address (str): The address to look up.
+
+        Returns:
+            tuple[float, float]: The (latitude, longitude), or (None, None) if the address wasn't found.
+        """
+        key = normalize_address(address)
+
+        # Memory first, then the persistent store
+        with self._lock:
+            entry = self._remembered(key)
+        if entry is None:
+            entry = self._stored(key)
+        if entry is not None:
+            with self._lock:
+                return self._served(entry)
+
+        with self._lock:
+            # The address may have been geocoded while the store was read
+            entry = self._remembered(key)
+            if entry is not None:
+                return self._served(entry)
+
+            # Someone is already geocoding this address, wait for their answer instead of asking again
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                leader = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                self.stats["misses"] += 1
+                leader = True
+
+        if not leader:
+            coordinates = future.result()
+            return coordinates if coordinates else (None, None)
+
+        try:
+            coordinates = self.geocoder(address)
+        except Exception as e:
+            # Errors (timeouts, rate limits) are not cached, the next request simply tries again
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        coordinates = tuple(coordinates) if coordinates else None
+        expires_at = self.clock() + (self.ttl if coordinates else self.negative_ttl)
+        with self._lock:
+            self._remember(key, (coordinates, expires_at))
+            del self._inflight[key]
+        if self.store is not None:
+            self.store.set(key, coordinates, expires_at)
+
+        future.set_result(coordinates)
+        return coordinates if coordinates else (None, None)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+# Helper function to get the process-wide cache used by get_coordinates_from_address
+def get_geocode_cache() -> GeocodeCache:
+    """
+    Returns the shared GeocodeCache (Nominatim + SQLite store at DEFAULT_GEOCODE_CACHE_PATH), creating it on first use.
+
+    Returns:
+        GeocodeCache: The shared cache.
+    """
+    global _default_cache
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = GeocodeCache(store=SQLiteGeocodeStore(DEFAULT_GEOCODE_CACHE_PATH))
+        return _default_cache
+
+# Helper function to swap the shared cache (e.g. for a stub geocoder in tests or offline runs)
+def set_geocode_cache(cache: GeocodeCache):
+    """
+    Replaces the shared GeocodeCache.
+
+    Parameters:
+        cache (GeocodeCache): The cache get_coordinates_from_address should use from now on.
+    """
+    global _default_cache
+
+    with _default_cache_lock:
+        _default_cache = cache
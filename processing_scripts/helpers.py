@@ -1,86 +1,111 @@
-import json, string, os, piexif, shutil, numpy as np, pytz
-from geopy.geocoders import Nominatim
+import io, json, logging, math, string, os, piexif, shutil, threading
 from PIL import Image, ImageOps, ExifTags, ImageDraw, ImageFont
 from PIL.ExifTags import TAGS, GPSTAGS
-from Pylette import extract_colors
-from Pylette import Palette
 from datetime import datetime
-from timezonefinder import TimezoneFinder
-from typing import Any
+from typing import Any, TYPE_CHECKING
+from functools import lru_cache
 from math import gcd
 from fractions import Fraction
+from processing_scripts.image_context import EXIF_ORIENTATION_TAG, ImageContext, load_image_context
+from processing_scripts.encoders import encode_image, output_filename
+from processing_scripts.geocode_cache import get_geocode_cache
+
+# Heavy dependencies (timezonefinder, pytz, Pylette/scikit-learn, numpy) are imported inside the functions
+# that need them, so importing the helpers (e.g. for the border tool) doesn't pay for them
+if TYPE_CHECKING:
+    import numpy as np
+    from timezonefinder import TimezoneFinder
+
+logger = logging.getLogger(__name__)
 
 # Helper Functions
 # --------------------------------------------------------------------
 
 # Helper function to get image metadata and optionally add a location to the GPS metadata
-def get_image_metadata(image_path, latitude: float=None, longitude: float=None):
+def get_image_metadata(image_path, latitude: float=None, longitude: float=None, timezone_str: str=None):
     """
     Extracts and returns cleaned metadata from an image file, with optional embedding of GPS coordinates 
     into the image's EXIF data if latitude and longitude are provided. Adjusts for GPS data, shutter speed, 
     and original timestamp formatting if necessary.
 
     Parameters:
-        image_path (str): Path to the image file.
+        image_path (str | ImageContext): Path to the image file, or the ImageContext already built for it.
         latitude (float, optional): Latitude coordinate to embed in the GPS metadata. Defaults to None.
         longitude (float, optional): Longitude coordinate to embed in the GPS metadata. Defaults to None.
+        timezone_str (str, optional): The timezone of the coordinates if it is already known (e.g. shared by a batch plan). Defaults to None.
 
     Returns:
         dict: A dictionary containing the cleaned and formatted image metadata, including 'GPSInfo' 
         if GPS coordinates are provided. Fields include shutter speed, date and time adjustments based 
         on timezone, and sanitized EXIF data.
     """
-    with Image.open(image_path) as img:
-        # Get Image metadata and GPS metadata if available
-        img_metadata = {ExifTags.TAGS[k]: v for k, v in img._getexif().items() if k in ExifTags.TAGS}
-        gps_metadata = {ExifTags.GPSTAGS[k]: v for k, v in img._getexif().items() if k in ExifTags.GPSTAGS}
-        
-        # Add the GPS matadata if we are passing in a latitude and logitude
-        if latitude and longitude and gps_metadata == {}:
-            # Define GPS tags
-            exif_dict = piexif.load(img.info.get("exif", b""))
-            gps_ifd = {
-                piexif.GPSIFD.GPSLatitudeRef: 'N' if latitude >= 0 else 'S',
-                piexif.GPSIFD.GPSLatitude: to_dms(abs(latitude), 'lat')[0],
-                piexif.GPSIFD.GPSLongitudeRef: 'E' if longitude >= 0 else 'W',
-                piexif.GPSIFD.GPSLongitude: to_dms(abs(longitude), 'lon')[0],
-            }
-            
-            # Add GPS data to EXIF
-            exif_dict["GPS"] = gps_ifd
-            exif_bytes = piexif.dump(exif_dict)
-            
-            gps_metadata = {ExifTags.GPSTAGS.get(k): v for k, v in gps_ifd.items()}
-
-        # Join the 2 metadata dictionaries
-        metadata = img_metadata | gps_metadata
-
-        # Clean the data of any possible unwanted binary chars
-        printable_chars = set(string.printable)
-        cleaned_metadata = {}
-
-        # Iterate through the dictionary
-        for k, v in metadata.items():
-            if isinstance(v, str):
-                cleaned_value = ''.join(filter(lambda x: x in printable_chars, v))
-                cleaned_metadata[k] = cleaned_value
-            else:
-                cleaned_metadata[k] = v
+    # Reuse the already parsed EXIF when we're handed a context, otherwise read the file once
+    context = image_path if isinstance(image_path, ImageContext) else load_image_context(image_path)
+
+    # Get Image metadata and GPS metadata if available
+    img_metadata = {ExifTags.TAGS[k]: v for k, v in context.exif.items() if k in ExifTags.TAGS}
+    gps_metadata = {ExifTags.GPSTAGS[k]: v for k, v in context.exif.items() if k in ExifTags.GPSTAGS}
 
-        metadata = cleaned_metadata
+    # Add the GPS matadata if we are passing in a latitude and logitude
+    if latitude and longitude and gps_metadata == {}:
+        # Define GPS tags
+        exif_dict = piexif.load(context.exif_bytes)
+        gps_ifd = gps_ifd_for_coordinates(latitude, longitude)
 
-        # Tweak the Shutter Speed formatting
-        metadata['ShutterSpeedValue'] = format_shutter_speed(metadata['ExposureTime'])
+        # Add GPS data to EXIF
+        exif_dict["GPS"] = gps_ifd
+        exif_bytes = piexif.dump(exif_dict)
 
-        # Tweak the DateTimeOriginal if we have a latitude and longitude
-        if latitude and longitude and gps_metadata:
-            metadata['DateTimeOriginal'] = change_timezone((latitude, longitude), metadata)
+        gps_metadata = gps_metadata_for_coordinates(latitude, longitude)
 
-        return metadata
+    # Join the 2 metadata dictionaries
+    metadata = img_metadata | gps_metadata
 
+    # Clean the data of any possible unwanted binary chars
+    printable_chars = set(string.printable)
+    cleaned_metadata = {}
 
+    # Iterate through the dictionary
+    for k, v in metadata.items():
+        if isinstance(v, str):
+            cleaned_value = ''.join(filter(lambda x: x in printable_chars, v))
+            cleaned_metadata[k] = cleaned_value
+        else:
+            cleaned_metadata[k] = v
+
+    metadata = cleaned_metadata
+
+    # Tweak the Shutter Speed formatting
+    metadata['ShutterSpeedValue'] = format_shutter_speed(metadata['ExposureTime'])
 
+    # Tweak the DateTimeOriginal if we have a latitude and longitude
+    if latitude and longitude and gps_metadata:
+        metadata['DateTimeOriginal'] = change_timezone((latitude, longitude), metadata, timezone_str)
 
+    return metadata
+
+# Helper function with the GPS IFD that gets embedded for a pair of coordinates
+def gps_ifd_for_coordinates(latitude: float, longitude: float) -> dict:
+    """
+    Builds the piexif GPS IFD (references and DMS values) for a pair of decimal coordinates.
+
+    Parameters:
+        latitude (float): Latitude of the location.
+        longitude (float): Longitude of the location.
+
+    Returns:
+        dict: The GPS IFD keyed by piexif GPS tag.
+    """
+    return {
+        piexif.GPSIFD.GPSLatitudeRef: 'N' if latitude >= 0 else 'S',
+        piexif.GPSIFD.GPSLatitude: to_dms(abs(latitude), 'lat')[0],
+        piexif.GPSIFD.GPSLongitudeRef: 'E' if longitude >= 0 else 'W',
+        piexif.GPSIFD.GPSLongitude: to_dms(abs(longitude), 'lon')[0],
+    }
+
+# Helper function with the GPS metadata get_image_metadata reports for a pair of coordinates
+def gps_metadata_for_coordinates(latitude: float, longitude: float) -> dict:
+    return {ExifTags.GPSTAGS.get(k): v for k, v in gps_ifd_for_coordinates(latitude, longitude).items()}
 
 # Helper function that will get the shutter speed in the correct format given the 'ShutterSpeedValue' from the metadata
 def format_shutter_speed(ExposureTime: float) -> str:
@@ -116,13 +141,14 @@ def format_shutter_speed(ExposureTime: float) -> str:
 
 
 # Helper function to update the DateTimeOriginal based on the coordinates of the picture
-def change_timezone(coordinates: tuple[float, float],  metadata: dict[str, Any]) -> str:
+def change_timezone(coordinates: tuple[float, float],  metadata: dict[str, Any], timezone_str: str=None) -> str:
     """
     Adjusts the 'DateTimeOriginal' field in metadata based on the local timezone of the provided coordinates.
 
     Parameters:
         coordinates (tuple): A tuple of latitude and longitude (float) representing the picture's location.
         metadata (dict): A dictionary of metadata that includes 'DateTimeOriginal', formatted as "%Y:%m:%d %H:%M:%S".
+        timezone_str (str, optional): The timezone of the coordinates if it is already known, looked up otherwise.
 
     Returns:
         str: The adjusted date and time as a string in the format "%m/%d/%Y %H:%M:%S" based on the local timezone.
@@ -131,75 +157,190 @@ def change_timezone(coordinates: tuple[float, float],  metadata: dict[str, Any])
     # Get the DateTimeOriginal field from the metadata
     original_datetime = datetime.strptime(metadata['DateTimeOriginal'], "%Y:%m:%d %H:%M:%S")
 
+    import pytz
+
     # Set the EST timezone
     est = pytz.timezone("America/New_York")
     original_datetime_est = est.localize(original_datetime)
 
-    # Find the timezone of the given coordinates
-    tf = TimezoneFinder()
-    timezone_str = tf.timezone_at(lat=coordinates[0], lng=coordinates[1])
+    # Find the timezone of the given coordinates (shared finder + memoized lookup), unless the batch plan already did
+    if timezone_str is None:
+        timezone_str = lookup_timezone(coordinates[0], coordinates[1])
     if not timezone_str:
-        print("Could not determine the timezone for the given coordinates")
+        logger.warning("Could not determine the timezone for the given coordinates")
         return metadata['DateTimeOriginal']
     
     # Adjust the timezone
     local_timezone = pytz.timezone(timezone_str)
     local_datetime = original_datetime_est.astimezone(local_timezone)
     formatted_local_datetime = local_datetime.strftime("%m/%d/%Y %H:%M:%S")
-    print(f"Adjusted DateTime: {formatted_local_datetime}")
+    logger.debug("Adjusted DateTime: %s", formatted_local_datetime)
 
     return formatted_local_datetime
 
-# Helper function to dynamically determine the font size given an image
-def calculate_font_size(image, scale_factor):
-    font_size = int(min(image.size) * scale_factor)
-    print(font_size)
+# Coordinates are rounded to this many decimals (about 100 m) before the timezone lookup so nearby shots share a cache entry
+TIMEZONE_COORDINATE_PRECISION = 3
+
+# Process-wide TimezoneFinder, loading its polygon dataset is expensive so it only happens once per process
+_timezone_finder = None
+_timezone_finder_lock = threading.Lock()
+_timezone_lookup_lock = threading.Lock()
+
+# Helper function to get the shared TimezoneFinder (created on first use, or preloaded at worker start)
+def get_timezone_finder(in_memory: bool=False) -> "TimezoneFinder":
+    """
+    Returns the process-wide TimezoneFinder, creating it on first use.
+
+    Parameters:
+        in_memory (bool, optional): Read the whole dataset into memory when the finder is created 
+            (used when preloading before forking workers, so they share it instead of file handles).
+
+    Returns:
+        TimezoneFinder: The shared finder instance.
+    """
+    global _timezone_finder
+
+    if _timezone_finder is None:
+        with _timezone_finder_lock:
+            if _timezone_finder is None:
+                from timezonefinder import TimezoneFinder
+                _timezone_finder = TimezoneFinder(in_memory=in_memory)
+    return _timezone_finder
+
+@lru_cache(maxsize=4096)
+def _timezone_at_rounded(latitude: float, longitude: float) -> str:
+    # The finder isn't documented as thread safe, and misses are rare enough that serializing them is free
+    with _timezone_lookup_lock:
+        return get_timezone_finder().timezone_at(lat=latitude, lng=longitude)
+
+# Helper function to look up the timezone name for a pair of coordinates (memoized with LRU eviction)
+def lookup_timezone(latitude: float, longitude: float) -> str:
+    """
+    Returns the IANA timezone name for the given coordinates, using an LRU cache keyed on the 
+    coordinates rounded to TIMEZONE_COORDINATE_PRECISION decimals.
+
+    Parameters:
+        latitude (float): Latitude of the location.
+        longitude (float): Longitude of the location.
+
+    Returns:
+        str: The timezone name (e.g. "Europe/Zurich"), or None if it cannot be determined.
+    """
+    return _timezone_at_rounded(round(latitude, TIMEZONE_COORDINATE_PRECISION), round(longitude, TIMEZONE_COORDINATE_PRECISION))
+
+# Helper function to report how well the timezone cache is doing
+def timezone_cache_stats() -> dict:
+    """
+    Returns the hit/miss counters of the timezone lookup cache.
+
+    Returns:
+        dict: `hits`, `misses`, `size` (entries currently cached) and `maxsize`.
+    """
+    info = _timezone_at_rounded.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+
+# Helper function to dynamically determine the font size given the (width, height) of the overlay
+def calculate_font_size(image_size: tuple[int, int], scale_factor):
+    font_size = int(min(image_size) * scale_factor)
+    logger.debug("Font size: %s", font_size)
     return font_size
 
+# Helper function to read a font file once per process (every size of a font is loaded from these bytes)
+@lru_cache(maxsize=32)
+def load_font_data(font_path: str) -> bytes:
+    with open(font_path, "rb") as font_file:
+        return font_file.read()
+
+# Helper function to load a TrueType font, cached on (path, size) so repeated sizes are only parsed once per process
+@lru_cache(maxsize=256)
+def load_font(font_path: str, font_size: int) -> ImageFont.FreeTypeFont:
+    """
+    Loads a TrueType font at the given size, reusing previously loaded (path, size) pairs.
+
+    Parameters:
+        font_path (str): Path to the .ttf file.
+        font_size (int): The font size in points.
+
+    Returns:
+        ImageFont.FreeTypeFont: The loaded font (failures raise IOError and are not cached).
+    """
+    return ImageFont.truetype(io.BytesIO(load_font_data(font_path)), font_size)
+
 # Helper function that will make adjustments to the font size if we detect any overlapping text (Compare by line)
+# (memoized, images of a shoot share most of their overlay text and the same width)
+@lru_cache(maxsize=1024)
 def adjust_line_font(left_text: str, right_text: str, font_path: str, initial_font_size: int, image_width: int):
     # Set a default gap of 10 pixels and minimum font size
     gap = 10
     min_font_size = 10
 
-    # Initilaize an ImageDraw object
-    image = Image.new('RGB', (image_width, 100), color=(255, 255, 255))
-    draw = ImageDraw.Draw(image)
-
     # Load the font
     try:
-        font = ImageFont.truetype(font_path, initial_font_size)
-        print("Successfully loaded desired font for adjustment")
+        load_font(font_path, initial_font_size)
     except IOError:
-        print("Failed to load desired font, using default font")
-        font = ImageFont.load_default()
-    
-    while True:
-        left_end_x = draw.textbbox((0, 0), left_text, font=font)[2]
-        right_width = draw.textbbox((0, 0), right_text, font=font)[2]
-        right_start_x = image_width - right_width
-
-        if left_end_x + gap < right_start_x:
-            # No overlap, return the current font size
-            print(f"No overlap detected with font size: {initial_font_size}")
-            new_font_size = font.size
-            break
-
-        if font.size > min_font_size:
-            # Reduce the font size and try again
-            new_font_size = font.size - 1
-            font = ImageFont.truetype(font_path, new_font_size)
-        else:
-            # If we reach the minimum font size, break the loop
-            print(f"Reached minimum font size: {min_font_size}")
-            break
+        logger.warning("Failed to load desired font, keeping the initial font size")
+        return initial_font_size, 1.0
+
+    # The line fits when the left text ends (plus the gap) before the right-aligned text starts.
+    # getbbox measures the same box draw.textbbox did, without needing a scratch canvas.
+    def line_fits(font_size: int) -> bool:
+        font = load_font(font_path, font_size)
+        left_end_x = font.getbbox(left_text, mode="L")[2]
+        right_width = font.getbbox(right_text, mode="L")[2]
+        return left_end_x + gap < image_width - right_width
+
+    if line_fits(initial_font_size) or initial_font_size <= min_font_size:
+        new_font_size = initial_font_size
+    elif not line_fits(min_font_size):
+        # Even the minimum font size overlaps, that's as small as we go
+        new_font_size = min_font_size
+    else:
+        # Binary search for the largest size that still fits (min_font_size fits, initial_font_size doesn't)
+        low, high = min_font_size, initial_font_size
+        while high - low > 1:
+            middle = (low + high) // 2
+            if line_fits(middle):
+                low = middle
+            else:
+                high = middle
+        new_font_size = low
 
     scale_factor = new_font_size / initial_font_size
     return new_font_size, scale_factor
 
 
+# Helper function to work out the canvas, font sizes and text positions of the metadata overlay from the image dimensions alone
+def metadata_layout(img_width: int, img_height: int) -> dict:
+    """
+    Returns the layout `generate_metadata_image` uses for an image of the given size, before any
+    font is adjusted to the text.
+
+    Parameters:
+        img_width (int): Width of the original image in pixels.
+        img_height (int): Height of the original image in pixels.
+
+    Returns:
+        dict: The overlay `size`, its initial `larger_font_size` and `smaller_font_size`, and the
+        vertical offsets of the two text lines (`first_line_start`, `second_line_start`).
+    """
+    # Set our font and image sizes depending on whether we have a landscape or portrait picture this will be the initial size
+    if img_width > img_height:
+        size = (img_width, img_height // 11)
+        larger_scale, smaller_scale = 0.30, 0.25
+    else:
+        size = (img_width, img_height // 13)
+        larger_scale, smaller_scale = 0.236, 0.197
+
+    return {
+        "size": size,
+        "larger_font_size": calculate_font_size(size, larger_scale),
+        "smaller_font_size": calculate_font_size(size, smaller_scale),
+        "first_line_start": get_proportions(img_width, img_height, 50),
+        "second_line_start": get_proportions(img_width, img_height, 250),
+    }
+
 # Helper function to create an image with metadata details and dimensions of orginal image (Optional Image name too)
-def generate_metadata_image(metadata: dict[str, Any], img_width: int, img_height: int, img_name: str=None) -> Image:
+def generate_metadata_image(metadata: dict[str, Any], img_width: int, img_height: int, img_name: str=None, layout: dict=None, location_str: str=None) -> Image:
     """
     Creates an image overlay with metadata details, formatted according to the dimensions of the 
     original image. Optionally includes the image name and GPS metadata if provided.
@@ -210,39 +351,37 @@ def generate_metadata_image(metadata: dict[str, Any], img_width: int, img_height
         img_width (int): Width of the original image in pixels.
         img_height (int): Height of the original image in pixels.
         img_name (str, optional): Name of the image to display in the overlay, if provided.
+        layout (dict, optional): The `metadata_layout` of these dimensions if it was already worked out.
+        location_str (str, optional): The formatted GPS location if it was already worked out.
 
     Returns:
         Image: A new PIL Image instance containing the metadata overlay, with text positioned 
                and formatted based on image orientation and size.
     """
-    # Create a new blank image
-    width, height = img_width, img_height
+    if layout is None:
+        layout = metadata_layout(img_width, img_height)
 
-    # Set our font and image sizes depending on whether we have a landscape or portrait picture this will be the initial size
-    if img_width > img_height:
-        image = Image.new('RGB', (width, height // 11), color=(255,255,255))
-        larger_font_size = calculate_font_size(image, 0.30)
-        smaller_font_size = calculate_font_size(image, 0.25)
-    else:
-        image = Image.new('RGB', (width, height // 13), color=(255,255,255))
-        larger_font_size = calculate_font_size(image, 0.236)
-        smaller_font_size = calculate_font_size(image, 0.197)
+    # Create a new blank image
+    image = Image.new('RGB', layout["size"], color=(255,255,255))
+    larger_font_size = layout["larger_font_size"]
+    smaller_font_size = layout["smaller_font_size"]
 
     draw = ImageDraw.Draw(image)
 
     # Load a font
     try:
-        font_bold = ImageFont.truetype("fonts/timesbd.ttf", larger_font_size)
-        font_regular = ImageFont.truetype("fonts/times.ttf", smaller_font_size)
-        print("Successfully loaded desired font")
+        font_bold = load_font("fonts/timesbd.ttf", larger_font_size)
+        font_regular = load_font("fonts/times.ttf", smaller_font_size)
+        logger.debug("Successfully loaded desired font")
     except IOError:
         font = ImageFont.load_default(larger_font_size)
-        print("Loaded default font")
+        logger.warning("Loaded default font")
 
     # Set the text that will be on the 1st line
     if img_name and all([metadata['GPSLatitude'], metadata['GPSLatitudeRef'], metadata['GPSLongitude'], metadata['GPSLongitudeRef']]):
         # Get the GPS metadata in the correct format
-        location_str = format_gps_decimal(metadata)
+        if location_str is None:
+            location_str = format_gps_decimal(metadata)
         first_line_left = f"{img_name} ({location_str})"
     else:
         first_line_left = f"{metadata['Make']} {metadata['Model']}"
@@ -255,24 +394,22 @@ def generate_metadata_image(metadata: dict[str, Any], img_width: int, img_height
         second_line_left = f"{metadata['LensModel']}"
     second_line_right = f"{metadata['DateTimeOriginal']}"
 
-    print("first_line_left: ", first_line_left)
-    print("first_line_right: ", first_line_right)
-    print("second_line_left: ", second_line_left)
-    print("second_line_right: ", second_line_right)
+    logger.debug("first_line_left: %s, first_line_right: %s", first_line_left, first_line_right)
+    logger.debug("second_line_left: %s, second_line_right: %s", second_line_left, second_line_right)
 
     # Check if we need to adjust the font size based on the text length of the first line
     adjusted_font_size, scale_factor = adjust_line_font(first_line_left, first_line_right, "fonts/timesbd.ttf", larger_font_size, img_width)
     if adjusted_font_size != larger_font_size:
-        print(f"Adjusted font size from {larger_font_size} to {adjusted_font_size} with scale factor {scale_factor}")
+        logger.debug("Adjusted font size from %s to %s with scale factor %s", larger_font_size, adjusted_font_size, scale_factor)
         # Recalculate the font sizes based on the new adjusted font size
         larger_font_size = adjusted_font_size
         smaller_font_size = int(smaller_font_size * scale_factor)
-        font_bold = ImageFont.truetype("fonts/timesbd.ttf", larger_font_size)
-        font_regular = ImageFont.truetype("fonts/times.ttf", smaller_font_size)
+        font_bold = load_font("fonts/timesbd.ttf", larger_font_size)
+        font_regular = load_font("fonts/times.ttf", smaller_font_size)
 
-    # Calculate the starting positions for the text lines based on the image dimensions
-    first_line_start = get_proportions(img_width, img_height, 50)
-    second_line_start = get_proportions(img_width, img_height, 250)
+    # The starting positions for the text lines based on the image dimensions
+    first_line_start = layout["first_line_start"]
+    second_line_start = layout["second_line_start"]
 
     # First line left side (Bold)
     draw.text((0, first_line_start), first_line_left, font=font_bold, fill=(0, 0, 0))
@@ -314,7 +451,7 @@ def get_aspect_ratio(img: Image) -> tuple[int, int]:
     # Divide width and height to get the simplified ratio
     aspect_ratio = (width // ratio_gcd, height // ratio_gcd)
 
-    print(f"Aspect ratio: {aspect_ratio}")
+    logger.debug("Aspect ratio: %s", aspect_ratio)
     return aspect_ratio
 
 # Helper method to calculate the padding(border), assume that the target padding is for the longer side
@@ -369,6 +506,9 @@ def calculate_padding_for_aspect_ratio(img: Image, aspect_ratio: tuple[int, int]
     return horizontal_padding, vertical_padding
 
 
+# Size of the reference image every proportion is scaled from (a 40 MP 3:2 image)
+PROPORTION_REFERENCE_SIZE = (7728, 5152)
+
 # Helper function to dynamically get the border size, whitespace between image and palette, and other proportions (40 MP image with a 3:2 aspect ratio should have border of 750)
 def get_proportions(image_width: int, image_height: int, reference_value: int) -> int:
     """
@@ -384,8 +524,7 @@ def get_proportions(image_width: int, image_height: int, reference_value: int) -
         int: The calculated proportional value for the given image dimensions.
     """
     # Set our values for a reference border size
-    reference_width = 7728
-    reference_height = 5152
+    reference_width, reference_height = PROPORTION_REFERENCE_SIZE
     reference_border_size = reference_value
 
     image_min, image_max = sorted([image_width, image_height])
@@ -395,7 +534,6 @@ def get_proportions(image_width: int, image_height: int, reference_value: int) -
 
     border_size = int(reference_border_size * proportion)
 
-    print(border_size)
     return border_size
 
 
@@ -409,10 +547,10 @@ def save_palette() -> bool:
               `False` if the file already exists.
     """
     if os.path.isfile("./color_palette.jpg"):
-        print("The file exists don't need to save")
+        logger.debug("The file exists don't need to save")
         return False
     else:
-        print("The file doesn't exist so we can save")
+        logger.debug("The file doesn't exist so we can save")
         return True
     
 # Helper function get image dimensions
@@ -442,8 +580,12 @@ def get_palette_dimensions(img, num_colors):
               height (`palette_height`) in pixels.
     """
     img_dimensions = get_dimensions(img)
-    palette_width = img_dimensions["img_width"] / num_colors
-    palette_height = (10 / 100) * img_dimensions["img_height"]
+    return get_palette_dimensions_for(img_dimensions["img_width"], img_dimensions["img_height"], num_colors)
+
+# Helper function with the palette dimensions for an image size (so the layout can be worked out before decoding)
+def get_palette_dimensions_for(img_width: int, img_height: int, num_colors: int) -> dict:
+    palette_width = img_width / num_colors
+    palette_height = (10 / 100) * img_height
     return {"palette_width": palette_width, "palette_height": palette_height}
 
 # Helper function that will override the Pylette display function
@@ -458,30 +600,36 @@ def local_display(self, w: float = 50.0, h: float = 50.0, save_to_file: bool = F
         filename (str): Filename.
         extension (str): File extension.
     """
-    # Cast width and height to int for image creation
-    img_width = int(w * self.number_of_colors)
-    img_height = int(h)
-    
-    img = Image.new("RGB", size=(img_width, img_height))
-    arr = np.asarray(img).copy()
-    
-    for i in range(self.number_of_colors):
-        c = self.colors[i]
-        # Use int casts for pixel operations
-        arr[:, int(i * w) : int((i + 1) * w), :] = c.rgb
-    
-    img = Image.fromarray(arr, "RGB")
+    from processing_scripts.palette import render_palette
 
-    # Display the Palette only if it doesn't exist
-    # if save_palette() == True:
-    #     print("Showing palette since it is newly generated")
-    #     img.show()
+    # Build the swatches in memory, the file is only written when explicitly requested
+    img = render_palette(self, w=w, h=h)
 
     if save_to_file:
         img.save(f"{filename}.{extension}")
 
+# Helper function to work out where save_image puts an image (also used by the CLI to check for existing outputs)
+def saved_image_path(original_image_path: str, destination_folder: str, encoder_profile: str="archive", suffix: str="_IT") -> str:
+    """
+    Returns the path save_image writes to: the original name plus `suffix`, with the extension of the encoder profile.
+
+    Parameters:
+        original_image_path (str): The file path of the original image.
+        destination_folder (str): The folder the image is saved to.
+        encoder_profile (str, optional): The encoder profile it is saved with. Default is "archive".
+        suffix (str, optional): Appended to the original name. Default is "_IT".
+
+    Returns:
+        str: The output path.
+    """
+    base_name = os.path.splitext(os.path.basename(original_image_path))[0] + suffix
+    return os.path.join(destination_folder, output_filename(base_name + ".jpg", encoder_profile))
+
+# Answers accepted by save_image's on_exists (what the interactive prompt asks for)
+SAVE_ON_EXISTS_OPTIONS = ("prompt", "new", "replace", "skip")
+
 # Helper function to save the new image in the highest quality possible
-def save_image(image_to_save: Image, original_image_path: str, destination_folder: str):
+def save_image(image_to_save: Image, original_image_path: str, destination_folder: str, encoder_profile: str="archive", on_exists: str="prompt", suffix: str="_IT") -> str:
     """
     Saves an image in the highest quality possible with options for handling 
     existing files in the destination folder.
@@ -490,44 +638,55 @@ def save_image(image_to_save: Image, original_image_path: str, destination_folde
         image_to_save (Image): A PIL Image instance to be saved.
         original_image_path (str): The file path of the original image.
         destination_folder (str): The folder where the new image should be saved.
+        encoder_profile (str, optional): The encoder profile to save with. Default is "archive".
+        on_exists (str, optional): What to do when the file already exists: "prompt" asks the user, 
+            "new" saves a numbered new version, "replace" overwrites it and "skip" keeps it. Default is "prompt".
+        suffix (str, optional): Appended to the original name. Default is "_IT".
+
+    Returns:
+        str: The path the image was saved to, or None if it wasn't saved.
 
     Behavior:
-        - If the file already exists, the user is prompted to choose one of three options:
-          save a new version, replace the existing file, or skip saving.
-        - Saves the image with quality 100, optimized and progressive settings.
+        - If the file already exists, `on_exists` decides (by default the user is prompted to choose one of three 
+          options: save a new version, replace the existing file, or skip saving).
+        - Saves the image with the encoder profile's settings (quality 100, optimized and progressive for "archive").
     """
-    base_name = os.path.basename(original_image_path).split(".")[0] + "_IT"
-    new_file_name = base_name + ".jpg"
-    print(new_file_name)
-
-    new_path = os.path.join(destination_folder, new_file_name)
+    if on_exists not in SAVE_ON_EXISTS_OPTIONS:
+        raise ValueError(f"Unknown on_exists option: {on_exists}")
 
-    print(new_path)
+    new_path = saved_image_path(original_image_path, destination_folder, encoder_profile, suffix)
+    base_name, extension = os.path.splitext(os.path.basename(new_path))
+    new_file_name = base_name + extension
+    logger.debug("Saving to %s", new_path)
 
     # Check if the file exists already, if it does then we give the user the option to save it again
     if os.path.exists(new_path):
-        user_input = input(f"{new_file_name} already exists. Chosose an option - Save a new version(y), Replace(r), Don't save(n): ").strip().lower()
+        if on_exists == "prompt":
+            user_input = input(f"{new_file_name} already exists. Chosose an option - Save a new version(y), Replace(r), Don't save(n): ").strip().lower()
+            on_exists = {"y": "new", "r": "replace"}.get(user_input, "skip")
 
         # Save a new version
-        if user_input == "y":
+        if on_exists == "new":
             counter = 1
             while os.path.exists(new_path):
-                new_file_name = f"{base_name}_{counter}.jpg"
+                new_file_name = f"{base_name}_{counter}{extension}"
                 new_path = os.path.join(destination_folder, new_file_name)
                 counter += 1
             # Save the image utilizing the counter
-            print(f"Saving the image as {new_file_name}")
-            image_to_save.save(new_path, quality=100, optimize=True, progressive=True)
+            logger.info("Saving the image as %s", new_file_name)
+            encode_image(image_to_save, new_path, encoder_profile)
         # Replace the current version
-        elif user_input == "r":
-            print(f"Replacing the existing image at {new_file_name}")
-            image_to_save.save(new_path, quality=100, optimize=True, progressive=True)
+        elif on_exists == "replace":
+            logger.info("Replacing the existing image at %s", new_file_name)
+            encode_image(image_to_save, new_path, encoder_profile)
         # Don't save the file
         else:
-            print("Not saving the image as it already exists")
+            logger.info("Not saving the image as it already exists")
+            return None
     else:
-        print("Saving the image since it doesn't exist")
-        image_to_save.save(new_path, quality=100, optimize=True, progressive=True)
+        logger.info("Saving the image since it doesn't exist")
+        encode_image(image_to_save, new_path, encoder_profile)
+    return new_path
 
 
 # Helper function to determine which Aspect ratio is the best to use given an image (Used for prints)
@@ -614,62 +773,224 @@ def setup_print_padding(original_image: Image, stacked_image: Image, base_pad_va
         - Ensures all padding values are balanced and optimized for print.
 
     """
-    # Get the value for the automatic vertical pad we will have in our new image
-    auto_vertical_pad = get_proportions(original_image.width, original_image.height, base_pad_value)
-    if original_image.width > original_image.height:
-        while (auto_vertical_pad * 2) + stacked_image.height > stacked_image.width:
-            base_pad_value -= 50
-            auto_vertical_pad = get_proportions(original_image.width, original_image.height, base_pad_value)
-    else:
-        while (auto_vertical_pad * 2) + stacked_image.height < stacked_image.width:
-            base_pad_value -= 50
-            auto_vertical_pad = get_proportions(original_image.width, original_image.height, base_pad_value)
-    print(f"auto_vertical_pad: {auto_vertical_pad}")
-
-    # Calculate the adjustments needed for all transformations to all common print aspect ratios
-    aspect_ratio_adjustment_list = best_aspect_ratios_for_padding(stacked_image.width, stacked_image.height + (2 * auto_vertical_pad))
-    print(aspect_ratio_adjustment_list)
-
-    # Format the target aspect ratio if present:
-    if desired_aspect_ratio is not None:
-        if type(desired_aspect_ratio) is tuple and len(desired_aspect_ratio) == 2:
-            aspect_ratio_str = f"{desired_aspect_ratio[0]}:{desired_aspect_ratio[1]}"
-        else:
-            aspect_ratio_str = str(desired_aspect_ratio)
+    return compute_print_padding(original_image.width, original_image.height, stacked_image.width, stacked_image.height, base_pad_value, desired_aspect_ratio)
+
+# Step the base pad value is lowered by until the padded stack of a landscape image is no taller than it is wide
+PRINT_PAD_STEP = 50
+
+# Helper function to turn a requested print aspect ratio into a (width, height) tuple
+def parse_print_aspect_ratio(desired_aspect_ratio, image_width: int, image_height: int) -> tuple[int, int]:
+    """
+    Normalizes the print aspect ratio: a (width, height) tuple, a "W:H" string, or None for the
+    default (5:4 for landscape and 2:3 for portrait images).
+
+    Raises:
+        ValueError: If the aspect ratio can't be parsed.
+    """
+    if desired_aspect_ratio is None:
+        return (5, 4) if image_width > image_height else (2, 3)
+    if isinstance(desired_aspect_ratio, (tuple, list)) and len(desired_aspect_ratio) == 2:
+        width, height = desired_aspect_ratio
     else:
-        # Set a default processing if no desired aspect ratio (5:4 for Landscape and 2:3 for Portrait)
-        aspect_ratio = (5, 4) if original_image.width > original_image.height else (2, 3)
-        aspect_ratio_str = f"{aspect_ratio[0]}:{aspect_ratio[1]}"
-        
-    # Get the aspect ratio adjustment object    
-    aspect_ratio_adjustment_obj = next((item for item in aspect_ratio_adjustment_list if item["aspect_ratio"] == aspect_ratio_str), None)
+        try:
+            width, height = map(int, str(desired_aspect_ratio).split(":"))
+        except ValueError:
+            raise ValueError(f"Invalid print aspect ratio: {desired_aspect_ratio}")
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid print aspect ratio: {desired_aspect_ratio}")
+    return (int(width), int(height))
+
+# Helper function with the print padding math, working purely on dimensions so the stacked image never has to exist
+def compute_print_padding(image_width: int, image_height: int, stacked_width: int, stacked_height: int, base_pad_value: int=400, desired_aspect_ratio: tuple[int, int]=None) -> tuple[int, int]:
+    """
+    Same as `setup_print_padding`, but takes the dimensions of the original and stacked images 
+    directly so the padding can be worked out before any canvas is allocated.
+
+    The vertical padding is solved for directly (see `_print_padding`) and the horizontal padding
+    is computed for the requested aspect ratio alone, so any aspect ratio works (not just the
+    common print ratios of the image's orientation). Results are memoized.
+
+    Parameters:
+        image_width (int): Width of the original (oriented) image.
+        image_height (int): Height of the original (oriented) image.
+        stacked_width (int): Width of the metadata + image + palette stack.
+        stacked_height (int): Height of the metadata + image + palette stack.
+        base_pad_value (int, optional): The base padding value for calculating vertical padding. Default is 400.
+        desired_aspect_ratio (tuple[int, int] | str, optional): The desired aspect ratio (width, height) or "W:H".
+
+    Returns:
+        tuple[int, int]: The (horizontal_padding, vertical_padding) to add on each side.
+
+    Raises:
+        ValueError: If the aspect ratio can't be parsed.
+    """
+    aspect_ratio = parse_print_aspect_ratio(desired_aspect_ratio, image_width, image_height)
+    padding = _print_padding(int(image_width), int(image_height), int(stacked_width), int(stacked_height), int(base_pad_value), aspect_ratio)
+    logger.debug("Horizontal padding: %s and Vertical padding: %s", padding[0], padding[1])
+    return padding
+
+@lru_cache(maxsize=4096)
+def _print_padding(image_width: int, image_height: int, stacked_width: int, stacked_height: int, base_pad_value: int, aspect_ratio: tuple[int, int]) -> tuple[int, int]:
+    # The vertical pad is get_proportions(base_pad_value) for landscape images, lowered in PRINT_PAD_STEP steps
+    # until the padded stack is no taller than it is wide. get_proportions is linear in the base value (up to
+    # truncation), so the number of steps is estimated directly and only corrected by a step or two.
+    # (Portrait stacks are always at least as tall as they are wide, so they keep the base value.)
+    auto_vertical_pad = get_proportions(image_width, image_height, base_pad_value)
+    limit = stacked_width - stacked_height
+    if image_width > image_height and auto_vertical_pad * 2 > limit:
+        proportion = min(image_width, image_height) / min(PROPORTION_REFERENCE_SIZE)
+        steps = max(1, math.ceil((base_pad_value - (limit / 2 + 1) / proportion) / PRINT_PAD_STEP))
+        while get_proportions(image_width, image_height, base_pad_value - steps * PRINT_PAD_STEP) * 2 > limit:
+            steps += 1
+        while steps > 1 and get_proportions(image_width, image_height, base_pad_value - (steps - 1) * PRINT_PAD_STEP) * 2 <= limit:
+            steps -= 1
+        auto_vertical_pad = get_proportions(image_width, image_height, base_pad_value - steps * PRINT_PAD_STEP)
+
+    # Widen the padded stack to the aspect ratio if it is too tall for it (a stack that is too wide keeps its width)
+    padded_height = stacked_height + 2 * auto_vertical_pad
+    target_ratio = aspect_ratio[0] / aspect_ratio[1]
+    width_padding = int(padded_height * target_ratio) - stacked_width if stacked_width / padded_height < target_ratio else 0
+
+    return (width_padding // 2, auto_vertical_pad)
+
+# Helper function with the print padding of many images at once (e.g. every group of a batch plan)
+def compute_print_padding_bulk(image_sizes, stacked_sizes, aspect_ratios=None, base_pad_value: int=400) -> "np.ndarray":
+    """
+    Vectorized `compute_print_padding`: the same padding for N images in one NumPy call.
+
+    Parameters:
+        image_sizes (array-like): The (width, height) of each original image, shape (N, 2).
+        stacked_sizes (array-like): The (width, height) of each stack, shape (N, 2).
+        aspect_ratios (array-like, optional): The (width, height) print aspect ratio of each image, shape (N, 2),
+            or one ratio for all of them, shape (2,). Defaults to 5:4 for landscape and 2:3 for portrait images.
+        base_pad_value (int, optional): The base padding value for calculating vertical padding. Default is 400.
+
+    Returns:
+        np.ndarray: An int64 array of shape (N, 2) with each (horizontal_padding, vertical_padding).
+    """
+    import numpy as np
+
+    image_sizes = np.asarray(image_sizes, dtype=np.int64).reshape(-1, 2)
+    stacked_sizes = np.asarray(stacked_sizes, dtype=np.int64).reshape(-1, 2)
+    width, height = image_sizes[:, 0], image_sizes[:, 1]
+    landscape = width > height
+    if aspect_ratios is None:
+        aspect_ratios = np.where(landscape[:, None], [5, 4], [2, 3])
+    aspect_ratios = np.broadcast_to(np.asarray(aspect_ratios, dtype=np.int64), image_sizes.shape)
+
+    # Same arithmetic as get_proportions (float64 product, truncated), for base values lowered by `steps`
+    proportion = np.minimum(width, height) / min(PROPORTION_REFERENCE_SIZE)
+    def pad(steps):
+        return np.trunc((base_pad_value - steps * PRINT_PAD_STEP) * proportion).astype(np.int64)
+
+    limit = stacked_sizes[:, 0] - stacked_sizes[:, 1]
+    lowered = landscape & (pad(0) * 2 > limit)
+    steps = np.where(lowered, np.maximum(1, np.ceil((base_pad_value - (limit / 2 + 1) / proportion) / PRINT_PAD_STEP)), 0).astype(np.int64)
+    while True:
+        too_tall = lowered & (pad(steps) * 2 > limit)
+        if not too_tall.any():
+            break
+        steps += too_tall
+    while True:
+        too_low = lowered & (steps > 1) & (pad(steps - 1) * 2 <= limit)
+        if not too_low.any():
+            break
+        steps -= too_low
+    vertical = pad(steps)
+
+    padded_height = stacked_sizes[:, 1] + 2 * vertical
+    target_ratio = aspect_ratios[:, 0] / aspect_ratios[:, 1]
+    widen = stacked_sizes[:, 0] / padded_height < target_ratio
+    width_padding = np.where(widen, np.trunc(padded_height * target_ratio).astype(np.int64) - stacked_sizes[:, 0], 0)
 
-    # Set the padding values
-    horizontal_padding = aspect_ratio_adjustment_obj["width_padding"] // 2
-    vertical_padding = auto_vertical_pad
+    return np.stack([width_padding // 2, vertical], axis=1)
 
-    print(f"Horizontal padding: {horizontal_padding} and Vertical padding: {vertical_padding}")
+# Helper function to work out the whole layout of process_image from the image dimensions alone
+def overlay_layout(img_width: int, img_height: int, used_for_print: bool=True, print_aspect_ratio: tuple[int, int]=None, num_colors: int=7, padding: tuple[int, int]=None) -> dict:
+    """
+    Works out every size and offset of the metadata + image + palette stack and its padding. Only
+    the dimensions are needed, so images of the same size and aspect ratio can share one layout.
+
+    Parameters:
+        img_width (int): Width of the original (oriented) image.
+        img_height (int): Height of the original (oriented) image.
+        used_for_print (bool, optional): Pad to `print_aspect_ratio` instead of a constant border. Default is True.
+        print_aspect_ratio (tuple[int, int], optional): The print aspect ratio (see `compute_print_padding`).
+        num_colors (int, optional): The number of palette swatches. Default is 7.
+        padding (tuple[int, int], optional): The padding if it was already worked out (e.g. by `compute_print_padding_bulk`).
 
-    return (horizontal_padding, vertical_padding)
+    Returns:
+        dict: The `image_size` it was made for, the `metadata` layout (see `metadata_layout`), the
+        `palette_width` of each swatch, the `white_space` above the palette, the `stacked_size`,
+        the `padding` as (horizontal, vertical) and the final `canvas_size`.
+    """
+    metadata = metadata_layout(img_width, img_height)
+    palette_width = get_palette_dimensions_for(img_width, img_height, num_colors)["palette_width"]
+
+    # Work out the layout of the 3 stacked images (Metadata image -> main image -> palette image)
+    white_space = get_proportions(img_width, img_height, 300)
+    stacked_width = img_width
+    stacked_height = int(img_height) + int(palette_width) + metadata["size"][1] + white_space
+
+    if padding is not None:
+        horizontal_padding, vertical_padding = (int(value) for value in padding)
+    elif used_for_print == True:
+        # Set the horizonal and vertical padding according to common print apsect ratios
+        horizontal_padding, vertical_padding = compute_print_padding(img_width, img_height, stacked_width, stacked_height, 400, print_aspect_ratio)
+    else:
+        # Use a constant border value (a 40 MP image should have a border value of 600)
+        horizontal_padding = vertical_padding = get_proportions(img_width, img_height, 600)
+
+    return {
+        "image_size": (img_width, img_height),
+        "metadata": metadata,
+        "palette_width": palette_width,
+        "white_space": white_space,
+        "stacked_size": (stacked_width, stacked_height),
+        "padding": (horizontal_padding, vertical_padding),
+        "canvas_size": (stacked_width + 2 * horizontal_padding, stacked_height + 2 * vertical_padding),
+    }
+
+# Helper function to work out everything a group of similar images can share before their pixels are touched
+def overlay_plan(image_size: tuple[int, int], latitude: float, longitude: float, print_aspect_ratio: tuple[int, int]=None, used_for_print: bool=True, padding: tuple[int, int]=None) -> dict:
+    """
+    Builds the shared part of the overlay pipeline for images of one size and aspect ratio taken at
+    one location: the layout and padding, the timezone of the location and its formatted GPS string.
+
+    Parameters:
+        image_size (tuple[int, int]): The upright (width, height) of the images.
+        latitude (float): Latitude of the location.
+        longitude (float): Longitude of the location.
+        print_aspect_ratio (tuple[int, int], optional): The print aspect ratio.
+        used_for_print (bool, optional): Whether the images are padded for print. Default is True.
+        padding (tuple[int, int], optional): The padding if it was already worked out for the whole batch.
+
+    Returns:
+        dict: The `latitude`, `longitude`, `print_aspect_ratio`, `timezone`, `location` string and `layout` (see `overlay_layout`).
+    """
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "print_aspect_ratio": print_aspect_ratio,
+        "timezone": lookup_timezone(latitude, longitude),
+        "location": format_gps_decimal(gps_metadata_for_coordinates(latitude, longitude)),
+        "layout": overlay_layout(image_size[0], image_size[1], used_for_print, print_aspect_ratio, padding=padding),
+    }
 
 
 # ------------------------------------------------------ Location Helper Functions ------------------------------------------------------
 
 # Helper function to get the coordinates from an address input by the user
 def get_coordinates_from_address(address: str) -> tuple[float, float]:
-    # Initialize the user agent for Geopy
-    loc = Nominatim(user_agent="image_transformer", timeout=10)
-
-    # Geocode the input address
-    location = loc.geocode(address)
+    # Geocode through the shared cache (repeat addresses never hit Nominatim twice)
+    coordinates = get_geocode_cache().lookup(address)
 
     # Check if we got a valid location
-    if location:
-        print(f"Coordinates for {address}: {location.latitude}, {location.longitude}")
-        return (location.latitude, location.longitude)
+    if coordinates != (None, None):
+        logger.debug("Coordinates for %s: %s, %s", address, coordinates[0], coordinates[1])
     else:
-        print(f"Could not find coordinates for address: {address}")
-        return (None, None)
+        logger.warning("Could not find coordinates for address: %s", address)
+    return coordinates
     
 
 # Helper function to format GPS metadata to a string
@@ -758,12 +1079,12 @@ def cleanup_directory(directory: str):
                 # Check if it's a file or directory and remove accordingly
                 if os.path.isfile(file_path):
                     os.remove(file_path)
-                    print(f"Removed file: {file_path}")
+                    logger.debug("Removed file: %s", file_path)
                 elif os.path.isdir(file_path):
                     shutil.rmtree(file_path)
-                    print(f"Removed directory: {file_path}")
+                    logger.debug("Removed directory: %s", file_path)
             except Exception as e:
-                print(f"Error removing {file_path}: {e}")
+                logger.warning("Error removing %s: %s", file_path, e)
 
 
 # ----------------------------------------------- Basic Border Helper Functions ----------------------------------------------------------
@@ -781,17 +1102,36 @@ def create_simple_border(image: Image, target_aspect_ratio: tuple[int, int], bor
     Returns:
         Image: A new PIL Image instance with the added border and adjusted size.
     """
-    # Ensure that the image is in the correct orientation
-    image = ImageOps.exif_transpose(image)
+    # Ensure that the image is in the correct orientation (callers usually pass an already transposed image,
+    # in which case exif_transpose would only make a full copy)
+    if image.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1:
+        image = ImageOps.exif_transpose(image)
 
-    img_width, img_height = image.size
-    current_aspect_ratio = img_width / img_height
+    # Work out both borders on the dimensions alone, then expand the image once
+    padding = simple_border_padding(image.width, image.height, target_aspect_ratio, border_percentage)
+    return ImageOps.expand(image, border=padding, fill="white")
+
+# Helper function to calculate the border added by create_simple_border
+def simple_border_padding(image_width: int, image_height: int, target_aspect_ratio: tuple[int, int], border_percentage: int) -> tuple[int, int, int, int]:
+    """
+    Calculates the (left, top, right, bottom) border create_simple_border adds to an image: a uniform 
+    border first, then even padding on one axis to reach the target aspect ratio.
+
+    Parameters:
+        image_width (int): The width of the (oriented) image in pixels.
+        image_height (int): The height of the (oriented) image in pixels.
+        target_aspect_ratio (tuple[int, int]): The desired aspect ratio as a tuple (width, height).
+        border_percentage (int): The size of the uniform border as a percentage of the shorter side.
+
+    Returns:
+        tuple[int, int, int, int]: The (left, top, right, bottom) border in pixels.
+    """
     target_aspect_ratio_value = target_aspect_ratio[0] / target_aspect_ratio[1]
 
     # Step 1: Add constant uniform border first
-    uniform_border_size = int(min(img_width, img_height) * (border_percentage / 100)) // 2
-    image = ImageOps.expand(image, border=uniform_border_size, fill="white")
-    img_width, img_height = image.size
+    uniform_border_size = int(min(image_width, image_height) * (border_percentage / 100)) // 2
+    img_width = image_width + 2 * uniform_border_size
+    img_height = image_height + 2 * uniform_border_size
 
     # Step 2: Adjust aspect ratio by padding evenly
     current_aspect_ratio = img_width / img_height
@@ -809,8 +1149,28 @@ def create_simple_border(image: Image, target_aspect_ratio: tuple[int, int], bor
         # Already correct aspect ratio
         padding = (0, 0, 0, 0)
 
-    image = ImageOps.expand(image, border=padding, fill="white")
-    return image
+    left, top, right, bottom = padding
+    return (left + uniform_border_size, top + uniform_border_size, right + uniform_border_size, bottom + uniform_border_size)
+
+# Helper function to paste several images into one freshly allocated canvas
+def compose_canvas(canvas_size: tuple[int, int], components: list[tuple[Image.Image, tuple[int, int]]], mode: str="RGB", fill=(255, 255, 255)) -> Image:
+    """
+    Allocates the final canvas once and pastes every component at its offset, instead of building 
+    intermediate stacked images and expanding them with borders.
+
+    Parameters:
+        canvas_size (tuple[int, int]): The (width, height) of the final image.
+        components (list[tuple[Image, tuple[int, int]]]): The images to paste with their (x, y) offsets.
+        mode (str, optional): The mode of the canvas. Default is "RGB".
+        fill (optional): The background color. Default is white.
+
+    Returns:
+        Image: The composed image.
+    """
+    canvas = Image.new(mode, canvas_size, fill)
+    for component, offset in components:
+        canvas.paste(component, offset)
+    return canvas
 
 
 # ------------------------------------------------------ String utility Functions ------------------------------------------------------
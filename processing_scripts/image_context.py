@@ -0,0 +1,185 @@
+import math
+from io import BytesIO
+from PIL import Image, ImageOps
+
+# EXIF tag holding the camera orientation (values 5-8 mean the image is stored rotated by 90 degrees)
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Long edge (pixels) that draft renders are decoded at, at least (big enough for an on-screen proof)
+DRAFT_MAX_SIZE = 2048
+
+# Header-only geometry
+# --------------------------------------------------------------------
+
+# Helper function to apply an EXIF orientation value to stored dimensions
+def oriented_size(width: int, height: int, orientation: int) -> tuple[int, int]:
+    """
+    Returns the dimensions an image will have once its EXIF orientation is applied.
+
+    Parameters:
+        width (int): Stored width in pixels.
+        height (int): Stored height in pixels.
+        orientation (int): The EXIF Orientation value (1-8).
+
+    Returns:
+        tuple[int, int]: The (width, height) after rotation.
+    """
+    if orientation in (5, 6, 7, 8):
+        return (height, width)
+    return (width, height)
+
+# Helper function to read the dimensions and orientation of an image without decoding any pixels
+def read_image_geometry(image_source) -> tuple[int, int, int]:
+    """
+    Reads the stored width, height and EXIF orientation from the file header alone.
+
+    Parameters:
+        image_source (str | file-like): Path to the image or an open binary file object.
+
+    Returns:
+        tuple[int, int, int]: The stored (width, height) and the orientation (1 when the tag is missing).
+    """
+    with Image.open(image_source) as img:
+        # Image.open only parses the header, and getexif() reads the APP1 block that came with it
+        orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        return img.width, img.height, orientation
+
+# Helper function to get the upright (post EXIF rotation) size of an image without decoding it
+def get_effective_size(image_source) -> tuple[int, int]:
+    """
+    Returns the size an image will have after `ImageOps.exif_transpose`, without decoding or rotating it.
+
+    Parameters:
+        image_source (str | file-like): Path to the image or an open binary file object.
+
+    Returns:
+        tuple[int, int]: The effective (width, height) in pixels.
+    """
+    width, height, orientation = read_image_geometry(image_source)
+    return oriented_size(width, height, orientation)
+
+# Reduced-resolution decode
+# --------------------------------------------------------------------
+
+# Helper function to let libjpeg decode a JPEG at 1/2, 1/4 or 1/8 scale instead of decoding everything
+def request_draft(img: Image, max_size: int) -> int:
+    """
+    Configures an opened (not yet decoded) image to decode at the smallest DCT scale whose long edge
+    is still at least `max_size`. The scaling happens inside libjpeg, so the decode cost falls
+    roughly with the square of the scale. Anything that isn't a JPEG is left as it is.
+
+    Only use this when the consumer doesn't need full resolution (print renders never do).
+
+    Parameters:
+        img (Image): The opened image, before its pixels are loaded.
+        max_size (int): The smallest long edge (pixels) the decoded image may have.
+
+    Returns:
+        int: The scale the image will be decoded at (1 when it is decoded at full resolution).
+    """
+    width, height = img.size
+    long_edge = max(width, height)
+    if img.format != "JPEG" or long_edge <= max_size:
+        return 1
+
+    # Pillow picks the largest scale that keeps both sides at or above the requested size
+    requested = (math.ceil(width * max_size / long_edge), math.ceil(height * max_size / long_edge))
+    if img.draft(img.mode, requested) is None:
+        return 1
+    return round(width / img.width)
+
+# Image context
+# --------------------------------------------------------------------
+
+class ImageContext:
+    """
+    Holds everything the overlay pipeline needs from a single upload so the file is read,
+    decoded and EXIF-parsed exactly once per request.
+
+    Attributes:
+        path (str): Path the bytes were read from (None when built from an in-memory upload).
+        raw_bytes (bytes): The untouched file contents.
+        format (str): The Pillow format name of the source (e.g. "JPEG").
+        exif (dict): The parsed EXIF dictionary keyed by numeric tag, as returned by `_getexif()`.
+        exif_bytes (bytes): The raw EXIF block from the source (empty when the file has none).
+        icc_profile (bytes): The embedded ICC profile, or None.
+        orientation (int): The EXIF orientation of the stored pixels (1 when missing).
+    """
+
+    def __init__(self, raw_bytes: bytes, path: str=None):
+        self.path = path
+        self.raw_bytes = raw_bytes
+
+        # Opening only parses the header, the pixels are decoded on first access of `image`
+        self._source = Image.open(BytesIO(raw_bytes))
+        self.format = self._source.format
+        self.exif = (self._source._getexif() if hasattr(self._source, "_getexif") else None) or {}
+        self.exif_bytes = self._source.info.get("exif", b"")
+        self.icc_profile = self._source.info.get("icc_profile")
+        self.orientation = self.exif.get(EXIF_ORIENTATION_TAG, 1)
+        self._image = None
+
+        # Geometry comes from the header, so asking for the size never forces a decode
+        self._size = oriented_size(self._source.width, self._source.height, self.orientation)
+
+    @property
+    def image(self) -> Image:
+        """
+        The decoded pixels with the EXIF orientation already applied (decoded once, then cached).
+        """
+        if self._image is None:
+            img = self._source
+            img.load()
+            # Transpose in place so an upright image doesn't get copied for nothing
+            ImageOps.exif_transpose(img, in_place=True)
+            self._image = img
+        return self._image
+
+    def draft_image(self, max_size: int=DRAFT_MAX_SIZE) -> Image:
+        """
+        The pixels decoded at reduced scale (see `request_draft`) with the EXIF orientation applied,
+        for consumers that don't need full resolution. If the full-resolution pixels were already
+        decoded they are returned instead, resizing those is cheaper than decoding again.
+
+        Parameters:
+            max_size (int, optional): The smallest long edge (pixels) the result may have. Default is DRAFT_MAX_SIZE.
+
+        Returns:
+            Image: The decoded pixels (a new image every call, unless they are the full-resolution ones).
+        """
+        if self._image is not None:
+            return self._image
+
+        img = Image.open(BytesIO(self.raw_bytes))
+        request_draft(img, max_size)
+        img.load()
+        ImageOps.exif_transpose(img, in_place=True)
+        return img
+
+    @property
+    def width(self) -> int:
+        return self._size[0]
+
+    @property
+    def height(self) -> int:
+        return self._size[1]
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self._size
+
+
+# Helper function to build the shared context for an upload on disk
+def load_image_context(image_path: str) -> ImageContext:
+    """
+    Reads an image file once and wraps it in an ImageContext.
+
+    Parameters:
+        image_path (str): Path to the image file.
+
+    Returns:
+        ImageContext: The context holding the raw bytes, parsed EXIF and (lazily) decoded pixels.
+    """
+    with open(image_path, "rb") as f:
+        raw_bytes = f.read()
+    return ImageContext(raw_bytes, path=image_path)
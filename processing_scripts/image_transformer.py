@@ -1,28 +1,21 @@
-import json, string, os, piexif
+import json, logging, string, os, piexif
 from PIL import Image, ImageOps, ExifTags, ImageDraw, ImageFont
 from processing_scripts.helpers import *
+from processing_scripts.palette import extract_palette, render_palette
+from processing_scripts.image_context import ImageContext, load_image_context
+from processing_scripts.instrumentation import stage, trace
+from processing_scripts.strip_render import StripCanvas, UprightRows, use_strip_render
 from PIL.ExifTags import TAGS, GPSTAGS
-from Pylette import extract_colors
-from Pylette import Palette
 from typing import Any
 from fractions import Fraction
 from math import gcd
-import numpy as np
 
-# Function overrides
-# --------------------------------------------------------------------
-
-# Override the display function to allow the use of floats
-"""
-Override the display function of the Palette class to allow more flexibility 
-in how palettes are rendered and saved (e.g., float-based width and height).
-"""
-Palette.display = local_display
+logger = logging.getLogger(__name__)
 
 # Image processing
 # --------------------------------------------------------------------
 
-def process_image(image_path: string, latitude: float=None, longitude: float=None, used_for_print=True, print_aspect_ratio: tuple[int, int]=None, photo_title: string=None, local_save: bool=False) -> Image:
+def process_image(image_path: string, latitude: float=None, longitude: float=None, used_for_print=True, print_aspect_ratio: tuple[int, int]=None, photo_title: string=None, local_save: bool=False, plan: dict=None) -> Image:
     """
     Processes an image by extracting metadata, generating a color palette, 
     and combining these elements into a final image with optional print-friendly borders.
@@ -33,8 +26,9 @@ def process_image(image_path: string, latitude: float=None, longitude: float=Non
     specified aspect ratio for printing.
 
     Args:
-        image_path (str): 
-            Path to the input image file.
+        image_path (str | ImageContext): 
+            Path to the input image file, or an ImageContext already built for it 
+            so the upload is decoded and EXIF-parsed only once.
         latitude (float, optional): 
             Latitude for geotagging the image. Default is None.
         longitude (float, optional): 
@@ -51,6 +45,10 @@ def process_image(image_path: string, latitude: float=None, longitude: float=Non
         local_save (bool, optional):
             If True, saves the processed image to a local directory. 
             Default is False.
+        plan (dict, optional):
+            The `overlay_plan` shared by a batch of images with the same dimensions, 
+            location and aspect ratio (layout, padding, timezone and GPS string are 
+            then not worked out again). Default is None.
 
     Returns:
         Image: 
@@ -85,67 +83,73 @@ def process_image(image_path: string, latitude: float=None, longitude: float=Non
         ...     photo_title="My Photo"
         ... )
     """
-    # Open an image from the specified path for processing and ensure the orientation is corrected based on EXIF data.
-    
-    img = Image.open(image_path)
-    # Fix the image orientation
-    img = ImageOps.exif_transpose(img)
-    img_dimensions = get_dimensions(img)
-    print(get_dimensions(img))
-
-    # Get the image metadata and use that to generate a separate image
-    # Here we can use the optional latitude, longitude, and photo title
-    print (f"Latitude: {latitude}, Longitude: {longitude}, Photo Title: {photo_title}")
-    metadata = get_image_metadata(image_path, latitude, longitude)
-    print(metadata)
-    metadata_image = generate_metadata_image(metadata, img_dimensions["img_width"], img_dimensions["img_height"], photo_title)
-    # metadata_image.show()
-
-    # Setup the palette image and show a preview of it
-
-    palette = extract_colors(image=image_path, palette_size=7)
-    palette_dimensions = get_palette_dimensions(img, 7)
-    print(palette_dimensions)
-    palette.display(w=palette_dimensions["palette_width"], h=palette_dimensions["palette_width"],filename='color_palette', extension='jpg', save_to_file=True)
-    palette_image = Image.open('./color_palette.jpg')
-
-    # Stack the 3 images together (Metadata image -> main image -> palette image)
-
-    white_space = get_proportions(img.width, img.height, 300)
-    new_image = Image.new('RGB', (img_dimensions["img_width"], int(img_dimensions["img_height"]) + int(palette_dimensions["palette_width"]) + metadata_image.height + white_space), (255, 255, 255))
-    new_image.paste(metadata_image, (0, 0))
-    new_image.paste(img, (0, metadata_image.height))
-    new_image.paste(palette_image, (0, metadata_image.height + img_dimensions["img_height"] + white_space))
-    print(new_image.size)
-    print(f"Additional Height Padding (400 for 40MP uncropped): {get_proportions(img.width, img.height, 400)}")
-    # new_image.show()
-
-    # Adjust the borders of the image to fit a certain aspect ratio if used for a print
-
-    if used_for_print == True:
-        # Set the horizonal and vertical padding according to common print apsect ratios
-        horizontal_padding, vertical_padding = setup_print_padding(img, new_image, 400, print_aspect_ratio)
-    else:
-        # Use a constant border value
-        target_border = 600
-        # Get the value of our border using the helper method (A 40 MP image should have a border value of 600)
-        horizontal_padding = vertical_padding = get_proportions(img.width, img.height, target_border)
-        print(f"Horizontal padding: {horizontal_padding} and Vertical padding: {vertical_padding}")
-
-    # Define the border
-
-    border_size = (horizontal_padding, vertical_padding, horizontal_padding, vertical_padding)
-    border_color = (255, 255, 255)
-
-    # Add border to the image
-
-    img_with_border = ImageOps.expand(new_image, border=border_size, fill=border_color)
-    print(f"Final Image Dimensions: {img_with_border.width} * {img_with_border.height}")
+    # Every step below is timed as a stage (joins the caller's trace when the upload service already started one)
+    source_path = image_path.path if isinstance(image_path, ImageContext) else image_path
+    with trace("overlay", os.path.basename(source_path or "")):
+        # Open an image from the specified path for processing and ensure the orientation is corrected based on EXIF data.
+        # The context decodes (and transposes) the pixels once and keeps the parsed EXIF for the metadata step.
+        # Very large images are never decoded as a whole, their rows are read band by band when the result is encoded.
+        with stage("open"):
+            context = image_path if isinstance(image_path, ImageContext) else load_image_context(image_path)
+            strip_render = use_strip_render(*context.size)
+            img = None if strip_render else context.image
+        img_dimensions = get_dimensions(context)
+        logger.debug("Image dimensions: %s", img_dimensions)
+
+        # Every size and offset only depends on the dimensions, reuse the plan's layout when it was made for them
+        if plan is not None and tuple(plan["layout"]["image_size"]) == context.size:
+            layout = plan["layout"]
+            timezone_str, location_str = plan["timezone"], plan["location"]
+        else:
+            layout = overlay_layout(context.width, context.height, used_for_print, print_aspect_ratio)
+            timezone_str = location_str = None
+
+        # Get the image metadata and use that to generate a separate image
+        # Here we can use the optional latitude, longitude, and photo title
+        logger.debug("Latitude: %s, Longitude: %s, Photo Title: %s", latitude, longitude, photo_title)
+        with stage("metadata"):
+            metadata = get_image_metadata(context, latitude, longitude, timezone_str)
+        logger.debug("Metadata: %s", metadata)
+        with stage("overlay"):
+            metadata_image = generate_metadata_image(metadata, img_dimensions["img_width"], img_dimensions["img_height"], photo_title, layout["metadata"], location_str)
+        # metadata_image.show()
+
+        # Setup the palette image and show a preview of it
+
+        with stage("palette"):
+            # Cluster a downsampled copy of the decoded image instead of re-reading the full file
+            # (given the context, the palette only decodes at reduced scale if the full pixels aren't decoded yet)
+            palette = extract_palette(context, palette_size=7)
+            palette_width = layout["palette_width"]
+            # Render the swatches straight into memory (no shared color_palette.jpg between requests)
+            palette_image = render_palette(palette, w=palette_width, h=palette_width)
+        logger.debug("Palette width: %s", palette_width)
+
+        with stage("composite"):
+            # The layout of the 3 stacked images (Metadata image -> main image -> palette image) and the
+            # padding (for print: according to common print aspect ratios) are known before anything is allocated
+            white_space = layout["white_space"]
+            horizontal_padding, vertical_padding = layout["padding"]
+            logger.debug("Stacked dimensions: %s, padding: %s", layout["stacked_size"], layout["padding"])
+
+            # Paste every component straight into the final bordered canvas (one allocation, no intermediate stack),
+            # very large canvases are only described and composed strip by strip when they are encoded
+            if strip_render:
+                compose, img = StripCanvas, UprightRows(context.raw_bytes, context.orientation)
+            else:
+                compose = compose_canvas
+            img_with_border = compose(layout["canvas_size"], [
+                (metadata_image, (horizontal_padding, vertical_padding)),
+                (img, (horizontal_padding, vertical_padding + metadata_image.height)),
+                (palette_image, (horizontal_padding, vertical_padding + metadata_image.height + img_dimensions["img_height"] + white_space)),
+            ], fill=(255, 255, 255))
+        logger.debug("Final Image Dimensions: %s * %s", img_with_border.width, img_with_border.height)
 
     # Save the new image if local_save is True
     if local_save:
         destination_folder = "C:/Users/rahul/OneDrive/Pictures/Switzerland 2024/Image Transformer JPGs/" if used_for_print != True else "C:/Users/rahul/OneDrive/Pictures/Switzerland 2024/Image Transformer JPGs/Prints/"
-        save_image(img_with_border, image_path, destination_folder)
+        with stage("save"):
+            save_image(img_with_border, context.path, destination_folder)
 
     # Display the image with border
 
@@ -157,9 +161,7 @@ def process_image(image_path: string, latitude: float=None, longitude: float=Non
 
 # Main method for standalone execution
 if __name__ == "__main__":
-    image_path = "C:/Users/rahul/OneDrive/Pictures/Switzerland 2024/Lightroom Enhanced JPGs/DSCF0297.jpg"
-    latitude, longitude = 45.9845, 7.7654
-    used_for_print = True
-    photo_title = "Rotenboden"
-    img_with_border = process_image(image_path, latitude, longitude, used_for_print=True, print_aspect_ratio=(2,3), photo_title="Rotenboden")
-    img_with_border.show()
\ No newline at end of file
+    # Kept for running the module directly, the batch command line lives in processing_scripts.cli
+    import sys
+    from processing_scripts.cli import main
+    sys.exit(main(["overlay", *sys.argv[1:]]))
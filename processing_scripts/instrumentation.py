@@ -0,0 +1,340 @@
+import contextvars, json, logging, os, sqlite3, threading, time, tracemalloc
+from contextlib import contextmanager
+from PIL import Image
+
+'''
+Stage instrumentation
+
+Every image run through the overlay or border pipeline is wrapped in a `trace`, and each step of it
+in a `stage` (open/transpose, metadata, geocode, overlay, palette, composite, border, save). A stage
+records its wall time and the bytes allocated while it ran: Pillow image memory (counted in arena
+blocks, so rounded up to the block size) plus, when TRACE_PYTHON_ALLOCATIONS is set, the peak of
+Python/NumPy allocations traced by tracemalloc.
+
+When a trace ends its stages are added to a SQLite store shared by every web and batch worker
+process, which `/metrics` renders in the Prometheus text format. Set LOG_STAGE_TIMINGS to also log
+one JSON line per processed image.
+'''
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("open", "metadata", "geocode", "overlay", "palette", "composite", "border", "save")
+
+# Upper bounds of the stage duration histogram buckets (seconds)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Where the shared totals live (override with the METRICS_PATH environment variable, empty disables the store)
+DEFAULT_METRICS_PATH = os.environ.get("METRICS_PATH", os.path.join("cache", "metrics.sqlite3"))
+
+# Log one line with the stage breakdown of every processed image
+LOG_STAGE_TIMINGS = os.environ.get("LOG_STAGE_TIMINGS", "").lower() in ("1", "true", "yes")
+
+# Trace Python allocations with tracemalloc (slows allocation heavy Python code, so off by default)
+TRACE_PYTHON_ALLOCATIONS = os.environ.get("TRACE_PYTHON_ALLOCATIONS", "").lower() in ("1", "true", "yes")
+
+class StageTrace:
+    """
+    The stages recorded while processing one image.
+
+    Attributes:
+        pipeline (str): The pipeline name (e.g. "overlay" or "border").
+        name (str): What is being processed (usually the upload's filename).
+        stages (list[tuple[str, float, int]]): (stage, seconds, allocated bytes) in the order they first ran.
+        seconds (float): Total wall time of the trace (set when it ends).
+        failed (bool): Whether the trace ended with an exception.
+    """
+
+    def __init__(self, pipeline: str, name: str=None):
+        self.pipeline = pipeline
+        self.name = name
+        self.stages = []
+        self.seconds = 0.0
+        self.failed = False
+        self._start = time.perf_counter()
+
+    def add(self, name: str, seconds: float, allocated: int):
+        # A stage entered more than once for the same image (e.g. the upload is read by the service and
+        # decoded by process_image) counts as one observation
+        for index, (existing, total_seconds, total_allocated) in enumerate(self.stages):
+            if existing == name:
+                self.stages[index] = (name, total_seconds + seconds, total_allocated + allocated)
+                return
+        self.stages.append((name, seconds, allocated))
+
+    def as_dict(self) -> dict:
+        return {
+            "pipeline": self.pipeline,
+            "name": self.name,
+            "seconds": round(self.seconds, 6),
+            "failed": self.failed,
+            "stages": [{"stage": stage, "seconds": round(seconds, 6), "allocated_bytes": allocated} for stage, seconds, allocated in self.stages],
+        }
+
+_current_trace = contextvars.ContextVar("stage_trace", default=None)
+
+# Allocation counting
+# --------------------------------------------------------------------
+
+# Helper function to read how much image memory Pillow has allocated in this process so far
+def _pillow_allocated_bytes() -> int:
+    # Pillow allocates image memory in arena blocks and counts them, the block size bounds each one
+    get_stats = getattr(Image.core, "get_stats", None)
+    if get_stats is None:
+        return 0
+    return get_stats()["allocated_blocks"] * Image.core.get_block_size()
+
+class _AllocationMeter:
+    """
+    Measures the bytes allocated between `start` and `stop` (Pillow blocks plus traced Python allocations).
+    """
+
+    def start(self):
+        if TRACE_PYTHON_ALLOCATIONS and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._pillow = _pillow_allocated_bytes()
+        self._tracing = tracemalloc.is_tracing()
+        if self._tracing:
+            self._python = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+    def stop(self) -> int:
+        allocated = _pillow_allocated_bytes() - self._pillow
+        if self._tracing and tracemalloc.is_tracing():
+            allocated += max(0, tracemalloc.get_traced_memory()[1] - self._python)
+        return allocated
+
+# Recording
+# --------------------------------------------------------------------
+
+# Helper function to time one stage of the pipeline
+@contextmanager
+def stage(name: str):
+    """
+    Records the duration and allocated bytes of the wrapped block as the stage `name`.
+
+    Inside a `trace` the stage is added to it, otherwise it is written to the shared metrics right away.
+
+    Parameters:
+        name (str): One of STAGES.
+    """
+    meter = _AllocationMeter()
+    meter.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds, allocated = time.perf_counter() - start, meter.stop()
+        current = _current_trace.get()
+        if current is not None:
+            current.add(name, seconds, allocated)
+        else:
+            _publish(stages=[(name, seconds, allocated)])
+
+# Helper function to group the stages of one processed image
+@contextmanager
+def trace(pipeline: str, name: str=None):
+    """
+    Collects the stages run inside the block and publishes them together when it ends (the metrics store
+    is written once per image, and the per-image log line is emitted if LOG_STAGE_TIMINGS is set).
+    Nested traces join the outer one.
+
+    Parameters:
+        pipeline (str): The pipeline name (e.g. "overlay" or "border").
+        name (str, optional): What is being processed, used in the log line.
+
+    Yields:
+        StageTrace: The active trace.
+    """
+    current = _current_trace.get()
+    if current is not None:
+        yield current
+        return
+
+    current = StageTrace(pipeline, name)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    except BaseException:
+        current.failed = True
+        raise
+    finally:
+        _current_trace.reset(token)
+        current.seconds = time.perf_counter() - current._start
+        _publish(current)
+        if LOG_STAGE_TIMINGS:
+            logger.info("stage timings %s", json.dumps(current.as_dict()))
+
+# Helper function to add finished stages to the shared metrics without ever failing the image itself
+def _publish(finished: StageTrace=None, stages: list=None):
+    try:
+        get_stage_metrics().record(finished.stages if finished is not None else stages, finished)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("Could not record stage metrics: %s", e)
+
+# Shared metrics
+# --------------------------------------------------------------------
+
+class StageMetrics:
+    """
+    Stage duration histograms, allocated byte totals and pipeline run counts, shared by every process
+    through a SQLite file.
+
+    Parameters:
+        path (str): The SQLite file (None or empty disables recording, e.g. for command line runs).
+    """
+
+    def __init__(self, path: str=DEFAULT_METRICS_PATH):
+        self.path = path
+        if not self.enabled:
+            return
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                "stage TEXT PRIMARY KEY, count INTEGER NOT NULL, seconds REAL NOT NULL, allocated_bytes INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS stage_buckets (stage TEXT NOT NULL, le REAL NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (stage, le))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "pipeline TEXT NOT NULL, outcome TEXT NOT NULL, count INTEGER NOT NULL, seconds REAL NOT NULL, PRIMARY KEY (pipeline, outcome))"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self):
+        # A short-lived connection per call keeps the store safe across threads and worker processes
+        return sqlite3.connect(self.path, timeout=10)
+
+    def record(self, stages: list[tuple[str, float, int]], trace: StageTrace=None):
+        """
+        Adds stage measurements (and the run they belong to, if any) to the totals in one transaction.
+
+        Parameters:
+            stages (list[tuple[str, float, int]]): (stage, seconds, allocated bytes) measurements.
+            trace (StageTrace, optional): The finished trace the stages came from.
+        """
+        if not self.enabled:
+            return
+
+        with self._connect() as connection:
+            for name, seconds, allocated in stages:
+                connection.execute(
+                    "INSERT INTO stages (stage, count, seconds, allocated_bytes) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT(stage) DO UPDATE SET count = count + 1, seconds = seconds + excluded.seconds, "
+                    "allocated_bytes = allocated_bytes + excluded.allocated_bytes",
+                    (name, seconds, allocated),
+                )
+                connection.executemany(
+                    "INSERT INTO stage_buckets (stage, le, count) VALUES (?, ?, 1) "
+                    "ON CONFLICT(stage, le) DO UPDATE SET count = count + 1",
+                    [(name, le) for le in DURATION_BUCKETS if seconds <= le],
+                )
+            if trace is not None:
+                connection.execute(
+                    "INSERT INTO runs (pipeline, outcome, count, seconds) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(pipeline, outcome) DO UPDATE SET count = count + 1, seconds = seconds + excluded.seconds",
+                    (trace.pipeline, "error" if trace.failed else "ok", trace.seconds),
+                )
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current totals: per stage its count, seconds, allocated bytes and cumulative bucket
+        counts, and per (pipeline, outcome) the number of runs and their total seconds.
+        """
+        if not self.enabled:
+            return {"stages": {}, "runs": {}}
+
+        with self._connect() as connection:
+            stages = connection.execute("SELECT stage, count, seconds, allocated_bytes FROM stages").fetchall()
+            buckets = connection.execute("SELECT stage, le, count FROM stage_buckets").fetchall()
+            runs = connection.execute("SELECT pipeline, outcome, count, seconds FROM runs").fetchall()
+
+        bucket_counts = {}
+        for name, le, count in buckets:
+            bucket_counts.setdefault(name, {})[le] = count
+
+        # Known stages first in pipeline order, then anything else that was recorded
+        order = {name: index for index, name in enumerate(STAGES)}
+        snapshot = {"stages": {}, "runs": {}}
+        for name, count, seconds, allocated in sorted(stages, key=lambda row: (order.get(row[0], len(STAGES)), row[0])):
+            snapshot["stages"][name] = {
+                "count": count,
+                "seconds": seconds,
+                "allocated_bytes": allocated,
+                "buckets": {le: bucket_counts.get(name, {}).get(le, 0) for le in DURATION_BUCKETS},
+            }
+        for pipeline, outcome, count, seconds in sorted(runs):
+            snapshot["runs"][(pipeline, outcome)] = {"count": count, "seconds": seconds}
+        return snapshot
+
+# Helper function to render the shared metrics in the Prometheus text exposition format
+def render_prometheus(snapshot: dict) -> str:
+    """
+    Formats a `StageMetrics.snapshot()` as Prometheus metrics.
+
+    Parameters:
+        snapshot (dict): The snapshot to render.
+
+    Returns:
+        str: The metrics text (version 0.0.4 of the exposition format).
+    """
+    lines = [
+        "# HELP image_stage_duration_seconds Time spent in each image processing stage.",
+        "# TYPE image_stage_duration_seconds histogram",
+    ]
+    for name, totals in snapshot["stages"].items():
+        for le, count in totals["buckets"].items():
+            lines.append(f'image_stage_duration_seconds_bucket{{stage="{name}",le="{le:g}"}} {count}')
+        lines.append(f'image_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {totals["count"]}')
+        lines.append(f'image_stage_duration_seconds_sum{{stage="{name}"}} {totals["seconds"]:.6f}')
+        lines.append(f'image_stage_duration_seconds_count{{stage="{name}"}} {totals["count"]}')
+
+    lines += [
+        "# HELP image_stage_allocated_bytes_total Bytes allocated in each image processing stage.",
+        "# TYPE image_stage_allocated_bytes_total counter",
+    ]
+    for name, totals in snapshot["stages"].items():
+        lines.append(f'image_stage_allocated_bytes_total{{stage="{name}"}} {totals["allocated_bytes"]}')
+
+    lines += [
+        "# HELP image_pipeline_runs_total Images run through each pipeline.",
+        "# TYPE image_pipeline_runs_total counter",
+    ]
+    for (pipeline, outcome), totals in snapshot["runs"].items():
+        lines.append(f'image_pipeline_runs_total{{pipeline="{pipeline}",outcome="{outcome}"}} {totals["count"]}')
+
+    lines += [
+        "# HELP image_pipeline_seconds_total Wall time spent in each pipeline.",
+        "# TYPE image_pipeline_seconds_total counter",
+    ]
+    for (pipeline, outcome), totals in snapshot["runs"].items():
+        lines.append(f'image_pipeline_seconds_total{{pipeline="{pipeline}",outcome="{outcome}"}} {totals["seconds"]:.6f}')
+
+    return "\n".join(lines) + "\n"
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+# Helper function to get the shared StageMetrics (created on first use so importing the module has no side effects)
+def get_stage_metrics() -> StageMetrics:
+    global _default_metrics
+
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = StageMetrics()
+        return _default_metrics
+
+# Helper function to replace the shared StageMetrics (e.g. with one in a temporary directory for tests)
+def set_stage_metrics(metrics: StageMetrics):
+    global _default_metrics
+
+    with _default_metrics_lock:
+        _default_metrics = metrics
@@ -0,0 +1,215 @@
+import math
+from PIL import Image
+from typing import TYPE_CHECKING
+from processing_scripts.image_context import ImageContext
+
+# Importing Pylette pulls in scikit-learn and scipy, so it (and NumPy) is only imported once a palette is actually built
+if TYPE_CHECKING:
+    import numpy as np
+    from Pylette import Palette
+
+# Palette engine settings
+# --------------------------------------------------------------------
+
+# Maximum number of pixels the clustering step will ever look at (256 x 256, same budget Pylette resizes to)
+PALETTE_PIXEL_BUDGET = 256 * 256
+
+# Fixed seed so the same image always produces the same palette
+PALETTE_SEED = 2024
+
+# Upper bound on the Lloyd iterations, the centers usually settle well before this
+PALETTE_MAX_ITERATIONS = 30
+
+# Palette extraction
+# --------------------------------------------------------------------
+
+# Helper function to work out how large a draft decode has to be to still cover the pixel budget
+def palette_draft_size(size: tuple[int, int], pixel_budget: int=PALETTE_PIXEL_BUDGET) -> int:
+    """
+    Returns the long edge a reduced-resolution decode needs so it holds about 4x the pixel budget
+    (the reduction in `sample_palette_pixels` then still averages whole blocks, as with a full decode).
+
+    Parameters:
+        size (tuple[int, int]): The (width, height) of the image.
+        pixel_budget (int, optional): The maximum number of pixels to sample. Defaults to PALETTE_PIXEL_BUDGET.
+
+    Returns:
+        int: The smallest long edge (pixels) to decode at.
+    """
+    long_edge, short_edge = max(size), max(1, min(size))
+    return 2 * math.ceil(math.sqrt(pixel_budget * long_edge / short_edge))
+
+# Helper function to shrink an already decoded image down to the pixel budget before clustering
+def sample_palette_pixels(img: Image, pixel_budget: int=PALETTE_PIXEL_BUDGET) -> "np.ndarray":
+    """
+    Reduces a decoded image to at most `pixel_budget` pixels and returns them as a flat RGB array.
+
+    The reduction uses `Image.reduce`, which box-averages whole blocks of pixels inside Pillow
+    without allocating a full-size RGB copy of the source first.
+
+    Parameters:
+        img (Image): A decoded (and already EXIF-transposed) PIL Image instance.
+        pixel_budget (int, optional): The maximum number of pixels to sample. Defaults to PALETTE_PIXEL_BUDGET.
+
+    Returns:
+        np.ndarray: A float32 array of shape (N, 3) holding the sampled RGB values, with N <= pixel_budget.
+    """
+    import numpy as np
+
+    sample = img
+    factor = math.ceil(math.sqrt((img.width * img.height) / pixel_budget))
+    # Image.reduce rounds partial blocks up, so bump the factor until the result really fits
+    while math.ceil(img.width / factor) * math.ceil(img.height / factor) > pixel_budget:
+        factor += 1
+    if factor > 1:
+        # Image.reduce only supports a handful of modes, normalize anything exotic first
+        if sample.mode not in ("L", "RGB", "RGBA", "RGBX", "CMYK", "I", "F"):
+            sample = sample.convert("RGB")
+        sample = sample.reduce(factor)
+
+    if sample.mode != "RGB":
+        sample = sample.convert("RGB")
+
+    return np.asarray(sample, dtype=np.float32).reshape(-1, 3)
+
+# Helper function to pick the starting cluster centers using k-means++ seeding
+def kmeans_plus_plus_init(pixels: "np.ndarray", num_colors: int, rng: "np.random.Generator") -> "np.ndarray":
+    """
+    Chooses initial cluster centers with the k-means++ strategy (each new center is drawn with
+    probability proportional to its squared distance from the closest existing center).
+
+    Parameters:
+        pixels (np.ndarray): A float32 array of shape (N, 3) with the sampled RGB values.
+        num_colors (int): The number of centers to choose.
+        rng (np.random.Generator): The seeded generator used for every random draw.
+
+    Returns:
+        np.ndarray: A float32 array of shape (num_colors, 3) with the initial centers.
+    """
+    import numpy as np
+
+    centers = np.empty((num_colors, 3), dtype=np.float32)
+    centers[0] = pixels[rng.integers(len(pixels))]
+    closest_distances = np.sum((pixels - centers[0]) ** 2, axis=1)
+
+    for i in range(1, num_colors):
+        total = closest_distances.sum()
+        if total > 0:
+            index = rng.choice(len(pixels), p=closest_distances / total)
+        else:
+            # Every pixel already sits on a center (flat images), any pick is as good as another
+            index = rng.integers(len(pixels))
+        centers[i] = pixels[index]
+        closest_distances = np.minimum(closest_distances, np.sum((pixels - centers[i]) ** 2, axis=1))
+
+    return centers
+
+# Helper function that runs a vectorized k-means over the sampled pixels
+def kmeans_colors(pixels: "np.ndarray", num_colors: int, seed: int=PALETTE_SEED, max_iterations: int=PALETTE_MAX_ITERATIONS) -> "tuple[np.ndarray, np.ndarray]":
+    """
+    Clusters RGB pixels into `num_colors` groups with Lloyd's algorithm, fully vectorized in NumPy.
+
+    Parameters:
+        pixels (np.ndarray): A float32 array of shape (N, 3) with the sampled RGB values.
+        num_colors (int): The number of clusters (palette colors) to find.
+        seed (int, optional): Seed for the k-means++ initialization. Defaults to PALETTE_SEED.
+        max_iterations (int, optional): Maximum number of Lloyd iterations. Defaults to PALETTE_MAX_ITERATIONS.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The cluster centers with shape (num_colors, 3) and the
+        number of pixels assigned to each center with shape (num_colors,).
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = kmeans_plus_plus_init(pixels, num_colors, rng)
+    pixel_norms = np.sum(pixels ** 2, axis=1)[:, None]
+
+    for _ in range(max_iterations):
+        # Squared distances via |p|^2 - 2p.c + |c|^2, avoids building an (N, k, 3) temporary
+        distances = pixel_norms - 2 * (pixels @ centers.T) + np.sum(centers ** 2, axis=1)[None, :]
+        labels = np.argmin(distances, axis=1)
+
+        counts = np.bincount(labels, minlength=num_colors)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, pixels)
+
+        # Keep empty clusters where they were instead of dividing by zero
+        new_centers = centers.copy()
+        filled = counts > 0
+        new_centers[filled] = sums[filled] / counts[filled][:, None]
+
+        if np.allclose(new_centers, centers, atol=0.5):
+            centers = new_centers
+            break
+        centers = new_centers
+
+    distances = pixel_norms - 2 * (pixels @ centers.T) + np.sum(centers ** 2, axis=1)[None, :]
+    counts = np.bincount(np.argmin(distances, axis=1), minlength=num_colors)
+    return centers, counts
+
+# Helper function to extract a color palette from a decoded image (or an image context)
+def extract_palette(img: "Image | ImageContext", palette_size: int=7, pixel_budget: int=PALETTE_PIXEL_BUDGET, seed: int=PALETTE_SEED) -> "Palette":
+    """
+    Extracts a deterministic color palette from a decoded image without touching the file on disk.
+
+    The image is first reduced to the pixel budget and then clustered with a seeded k-means, so
+    the cost is bounded no matter how large the original upload was. Given an ImageContext whose
+    pixels haven't been decoded yet, only a reduced-resolution (draft) decode is done for it.
+
+    Parameters:
+        img (Image | ImageContext): A decoded (and already EXIF-transposed) PIL Image instance, or the context of the image.
+        palette_size (int, optional): The number of colors to extract. Defaults to 7.
+        pixel_budget (int, optional): The maximum number of pixels to cluster. Defaults to PALETTE_PIXEL_BUDGET.
+        seed (int, optional): Seed used for the clustering. Defaults to PALETTE_SEED.
+
+    Returns:
+        Palette: A Pylette Palette whose colors are sorted from most to least frequent.
+    """
+    import numpy as np
+    from Pylette import Palette
+    from Pylette.src.color import Color
+
+    if isinstance(img, ImageContext):
+        img = img.draft_image(palette_draft_size(img.size, pixel_budget))
+
+    pixels = sample_palette_pixels(img, pixel_budget)
+    centers, counts = kmeans_colors(pixels, palette_size, seed=seed)
+
+    frequencies = counts / float(counts.sum())
+    colors = [Color(tuple(int(round(channel)) for channel in np.clip(center, 0, 255)), float(freq)) for center, freq in zip(centers, frequencies)]
+
+    # Match Pylette's default ordering (most frequent color first)
+    colors.sort(reverse=True)
+
+    return Palette(colors)
+
+# Palette rendering
+# --------------------------------------------------------------------
+
+# Helper function to render a palette as a strip of color swatches entirely in memory
+def render_palette(palette: "Palette", w: float=50.0, h: float=50.0) -> Image:
+    """
+    Renders the palette as a row of solid color swatches and returns it as a PIL Image, 
+    without encoding or writing anything to disk.
+
+    Parameters:
+        palette (Palette): The palette to render.
+        w (float, optional): Width of each color swatch, fractional widths are allowed. Defaults to 50.0.
+        h (float, optional): Height of the swatches. Defaults to 50.0.
+
+    Returns:
+        Image: A new RGB PIL Image of size (int(w * number_of_colors), int(h)) containing the swatches.
+    """
+    import numpy as np
+
+    img_width = int(w * palette.number_of_colors)
+    img_height = int(h)
+
+    # Fill a single row and broadcast it down, the swatches are constant per column
+    row = np.zeros((img_width, 3), dtype=np.uint8)
+    for i, color in enumerate(palette.colors):
+        row[int(i * w) : int((i + 1) * w)] = color.rgb
+
+    arr = np.broadcast_to(row, (img_height, img_width, 3))
+    return Image.fromarray(np.ascontiguousarray(arr), "RGB")
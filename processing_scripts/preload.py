@@ -0,0 +1,39 @@
+import logging, time
+
+logger = logging.getLogger(__name__)
+
+# Preloading
+# --------------------------------------------------------------------
+
+# Fonts used by the metadata overlay
+PRELOAD_FONTS = ["fonts/times.ttf", "fonts/timesbd.ttf"]
+
+# Helper function that loads the expensive, read-only processing state up front
+def preload_processing_state() -> dict:
+    """
+    Imports the heavy modules and loads the font files and the timezone dataset into this process. 
+    Called once in the server's master process before it forks workers, so every worker shares the 
+    loaded state copy-on-write instead of each paying for it on its first request.
+
+    Returns:
+        dict: Seconds spent on each step.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    import numpy, Pylette
+    from processing_scripts import helpers, palette, image_transformer
+    timings["imports"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for font_path in PRELOAD_FONTS:
+        helpers.load_font_data(font_path)
+    timings["fonts"] = time.perf_counter() - start
+
+    # Keep the whole dataset in memory, open file handles must not be shared across forked workers
+    start = time.perf_counter()
+    helpers.get_timezone_finder(in_memory=True)
+    timings["timezone_finder"] = time.perf_counter() - start
+
+    logger.info("Preloaded processing state: %s", ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items()))
+    return timings
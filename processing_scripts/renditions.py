@@ -0,0 +1,84 @@
+import logging, os
+from PIL import Image
+from processing_scripts.encoders import encode_image, format_supported, FORMAT_EXTENSIONS, ENCODER_PROFILES, get_encoder_profile
+
+logger = logging.getLogger(__name__)
+
+# Rendition settings
+# --------------------------------------------------------------------
+
+"""
+Smaller copies written next to every processed image so the results page never has to load the
+full-resolution file just to display it. Each rendition is bounded by `max_size` on its long edge
+and encoded with an encoder profile, or with `fallback_profile` on Pillow builds that can't write
+the profile's format (WebP needs libwebp). They are listed from largest to smallest, since each one
+is resized from the previous (already smaller) rendition.
+"""
+RENDITIONS = {
+    "medium": {"max_size": 1600, "profile": "preview", "fallback_profile": "web"},
+    "preview": {"max_size": 480, "profile": "preview", "fallback_profile": "web"},
+}
+
+# Helper function to pick the encoder profile a rendition is written with on this Pillow build
+def rendition_profile(rendition: str) -> str:
+    settings = RENDITIONS[rendition]
+    return settings["profile"] if format_supported(ENCODER_PROFILES[settings["profile"]]["format"]) else settings["fallback_profile"]
+
+# Helper function to work out the filename of a rendition
+def rendition_filename(filename: str, rendition: str) -> str:
+    """
+    Returns the filename of a rendition of a processed image (e.g. processed_a.jpg -> processed_a_preview.webp).
+
+    Parameters:
+        filename (str): The filename (or path) of the full-size output.
+        rendition (str): The rendition name (a key of RENDITIONS).
+
+    Returns:
+        str: The rendition filename (or path, if a path was given).
+    """
+    _, settings = get_encoder_profile(rendition_profile(rendition))
+    return f"{os.path.splitext(filename)[0]}_{rendition}{FORMAT_EXTENSIONS[settings['format']]}"
+
+# Helper function to get the size of an image bounded by a maximum long edge
+def bounded_size(width: int, height: int, max_size: int) -> tuple[int, int]:
+    """
+    Scales (width, height) down so the long edge is at most max_size, keeping the aspect ratio
+    (sizes that already fit are returned unchanged).
+    """
+    scale = max_size / max(width, height)
+    if scale >= 1:
+        return (width, height)
+    return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+# Helper function that writes every rendition of a processed image
+def write_renditions(image: Image, output_path: str, icc_profile: bytes=None) -> dict:
+    """
+    Writes the smaller renditions of a processed image straight from the in-memory result (the
+    full-size file is never read back). A rendition that can't be written is left out, the results
+    page then shows the full-size image instead (see `rendition_url` in app.py).
+
+    Parameters:
+        image (Image): The processed image that was just saved to output_path.
+        output_path (str): The path of the full-size output (renditions are written next to it).
+        icc_profile (bytes, optional): The source ICC profile, kept if the rendition's profile keeps ICC.
+
+    Returns:
+        dict: The path of each rendition that was written, keyed by rendition name.
+    """
+    paths = {}
+    source = image
+    for rendition, settings in RENDITIONS.items():
+        size = bounded_size(source.width, source.height, settings["max_size"])
+        if size != source.size:
+            # reducing_gap lets Pillow shrink by whole factors first, which is much cheaper on large images
+            source = source.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        path = rendition_filename(output_path, rendition)
+        try:
+            encode_image(source, path, rendition_profile(rendition), icc_profile=icc_profile)
+        except (OSError, ValueError) as e:
+            # The full-size output is already saved, a missing rendition must not fail the request
+            logger.warning("Could not write the %s rendition of %s: %s", rendition, output_path, e)
+            continue
+        paths[rendition] = path
+    return paths
@@ -0,0 +1,558 @@
+import io, logging, math, os, re, struct, zlib
+from PIL import Image
+from processing_scripts.helpers import simple_border_padding
+from processing_scripts.image_context import EXIF_ORIENTATION_TAG, oriented_size
+
+logger = logging.getLogger(__name__)
+
+'''
+Strip rendering for very large images
+
+Medium-format scans and panoramas (100-400 MP) don't fit a worker when the bordered result is built
+in memory next to the decoded source and then handed to the encoder. From STRIP_RENDER_MIN_MEGAPIXELS
+on, the result is never allocated as a whole: a StripCanvas only knows its size and what is pasted
+where, and encoding it composes one horizontal strip at a time (white padding rows, then the source
+rows with white side margins, then the metadata footer and palette of an overlay), hands the strip
+to a row-wise writer and drops it:
+
+- JPEG: every strip is encoded as a baseline JPEG of its own with the same tables, and the entropy
+  coded data of the strips is joined with restart markers (a restart resets exactly what starting
+  a new strip does), which makes one ordinary baseline JPEG with a restart interval of one strip.
+- PNG: the rows are filtered and fed to a single zlib stream that is written out as IDAT chunks.
+
+Formats without a row-wise writer (WebP, AVIF, TIFF) have their canvas composed in memory.
+
+The source is read band by band in its upright orientation, straight from the file where the format
+allows it: baseline JPEGs with restart markers are cut at their restart markers and each band is
+decoded on its own, uncompressed images (raw TIFF strips or tiles, PPM) are read row by row. Other
+sources, and sources rotated by 90 degrees (whose upright rows are stored columns), are decoded once
+as a whole.
+'''
+
+# Images of at least this many megapixels are rendered in strips
+STRIP_RENDER_MIN_MEGAPIXELS = float(os.environ.get("STRIP_RENDER_MIN_MEGAPIXELS", 100))
+
+# Size of one strip in bytes (the strip height follows from the canvas width)
+STRIP_BYTES = 32 * 1024 * 1024
+
+# Transpose that makes a band of the stored pixels upright, per EXIF orientation (the ones ImageOps.exif_transpose uses)
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# JPEG markers (start of image, end of image, start of scan, define restart interval)
+JPEG_SOI, JPEG_EOI, JPEG_SOS, JPEG_DRI = 0xD8, 0xD9, 0xDA, 0xDD
+
+# Start of frame markers (every SOFn except DHT, JPG and DAC), and the sequential Huffman ones that can be cut into bands
+JPEG_SOF = tuple(marker for marker in range(0xC0, 0xD0) if marker not in (0xC4, 0xC8, 0xCC))
+JPEG_SEQUENTIAL_SOF = (0xC0, 0xC1)
+
+# Header segments left out of the JPEGs decoded for a band (EXIF/XMP, ICC profile, comments)
+JPEG_BAND_SKIPPED = (0xE1, 0xE2, 0xFE)
+
+# Any marker inside entropy coded data (0xFF00 is a stuffed 0xFF and 0xFFFF fill), and the restart markers
+JPEG_MARKER = re.compile(rb"\xff[^\x00\xff]")
+JPEG_RESTART = re.compile(rb"\xff[\xd0-\xd7]")
+
+# PNG color type and channel count per mode
+PNG_COLOR_TYPES = {"L": (0, 1), "RGB": (2, 3), "RGBA": (6, 4)}
+
+# Helper function to decide whether an image is large enough to be rendered in strips
+def use_strip_render(image_width: int, image_height: int) -> bool:
+    """
+    Returns True if an image of this size should be rendered with the strip renderer.
+    """
+    return image_width * image_height >= STRIP_RENDER_MIN_MEGAPIXELS * 1_000_000
+
+# Helper function to work out how many rows go into one strip
+def strip_height(canvas_width: int) -> int:
+    return max(1, STRIP_BYTES // (canvas_width * 4))
+
+# Helper function to open the file an image source refers to
+def _open_source(source):
+    return open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+
+# JPEG structure
+# --------------------------------------------------------------------
+
+# Helper function to read the header of a JPEG
+def read_jpeg_header(fp) -> list[tuple[int, bytes]]:
+    """
+    Reads the marker segments of a JPEG up to and including its first start of scan segment, leaving
+    the file at the first byte of the entropy coded data.
+
+    Parameters:
+        fp (file object): The JPEG, positioned at its start.
+
+    Returns:
+        list[tuple[int, bytes]]: The (marker, payload) of every segment.
+
+    Raises:
+        ValueError: If the file isn't a JPEG or its header is cut short.
+    """
+    if fp.read(2) != b"\xff\xd8":
+        raise ValueError("Not a JPEG file")
+
+    segments = []
+    while True:
+        prefix, marker = fp.read(1), fp.read(1)
+        while marker == b"\xff":
+            marker = fp.read(1)
+        length = fp.read(2)
+        if prefix != b"\xff" or not marker or len(length) < 2:
+            raise ValueError("Corrupt JPEG header")
+        payload = fp.read(struct.unpack(">H", length)[0] - 2)
+        segments.append((marker[0], payload))
+        if marker[0] == JPEG_SOS:
+            return segments
+
+# Helper function to serialize JPEG marker segments
+def jpeg_segment_bytes(segments: list[tuple[int, bytes]]) -> bytes:
+    return b"".join(struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload for marker, payload in segments)
+
+# Helper function to change the height a JPEG header declares
+def jpeg_with_height(segments: list[tuple[int, bytes]], height: int) -> list[tuple[int, bytes]]:
+    return [(marker, payload[:1] + struct.pack(">H", height) + payload[3:] if marker in JPEG_SOF else payload) for marker, payload in segments]
+
+# Helper function to read the MCU size from a JPEG frame header
+def jpeg_mcu_size(frame: bytes) -> tuple[int, int]:
+    """
+    Returns the (width, height) in pixels of one MCU of a JPEG, given the payload of its SOF segment.
+    """
+    components = frame[5]
+    if components == 1:
+        # A single component is never interleaved, its MCU is one 8x8 block whatever its sampling factors
+        return (8, 8)
+    sampling = [frame[7 + 3 * index] for index in range(components)]
+    return (8 * max(factors >> 4 for factors in sampling), 8 * max(factors & 0x0F for factors in sampling))
+
+# Source bands
+# --------------------------------------------------------------------
+
+class JpegRestartBands:
+    """
+    Decodes bands of rows of a baseline JPEG on their own. The entropy coded data restarts at every
+    restart marker, so a run of restart intervals covering whole MCU rows is a JPEG of its own once
+    it gets the file's header with its height changed. Each band is decoded with one extra group of
+    rows above and below and then cropped, so the chroma upsampling at the seams matches a full decode.
+    """
+
+    def __init__(self, source, header: list, size: tuple[int, int], group_rows: int, restarts_per_group: int, starts: list, ends: list):
+        self.source = source
+        self.header = header
+        self.size = size
+        self.group_rows = group_rows
+        self.restarts_per_group = restarts_per_group
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def open(cls, source, image: Image) -> "JpegRestartBands | None":
+        """
+        Indexes the restart markers of a JPEG file. Returns None if it can't be read in bands
+        (progressive, no restart markers, restarts not lining up with rows often enough, several scans).
+        """
+        if image.format != "JPEG":
+            return None
+
+        width, height = image.size
+        with _open_source(source) as fp:
+            try:
+                segments = read_jpeg_header(fp)
+            except ValueError:
+                return None
+            frame = next((payload for marker, payload in segments if marker in JPEG_SEQUENTIAL_SOF), None)
+            restart_interval = next((struct.unpack(">H", payload[:2])[0] for marker, payload in segments if marker == JPEG_DRI), 0)
+            # (progressive and lossless JPEGs have another SOF, a scan of fewer components than the frame means several scans)
+            if frame is None or not restart_interval or segments[-1][1][0] != frame[5]:
+                return None
+
+            # Bands start where a restart lines up with the start of an MCU row
+            mcu_width, mcu_height = jpeg_mcu_size(frame)
+            mcus_per_row = math.ceil(width / mcu_width)
+            group_mcus = math.lcm(restart_interval, mcus_per_row)
+            group_rows = group_mcus // mcus_per_row * mcu_height
+            restarts_per_group = group_mcus // restart_interval
+            if group_rows * width * 4 > STRIP_BYTES:
+                return None
+
+            # Scan the entropy coded data once for the offsets where each group starts and ends
+            starts, ends = [fp.tell()], []
+            restarts, offset, tail = 0, fp.tell(), b""
+            while not ends or len(ends) < len(starts):
+                chunk = fp.read(4 * 1024 * 1024)
+                if not chunk:
+                    return None
+                buffer, base = tail + chunk, offset - len(tail)
+                offset += len(chunk)
+                for match in JPEG_MARKER.finditer(buffer):
+                    code = buffer[match.start() + 1]
+                    if code == JPEG_EOI:
+                        ends.append(base + match.start())
+                        break
+                    if not 0xD0 <= code <= 0xD7:
+                        # Another scan or a DNL marker, not a single sequential scan
+                        return None
+                    restarts += 1
+                    if restarts % restarts_per_group == 0:
+                        ends.append(base + match.start())
+                        starts.append(base + match.end())
+                tail = buffer[-1:] if buffer.endswith(b"\xff") else b""
+
+        if len(starts) != math.ceil(height / group_rows):
+            return None
+        header = [(marker, payload) for marker, payload in segments if marker not in JPEG_BAND_SKIPPED]
+        return cls(source, header, (width, height), group_rows, restarts_per_group, starts, ends)
+
+    def read(self, top: int, bottom: int) -> Image:
+        """
+        Returns the stored rows top to bottom (exclusive) as a new image.
+        """
+        first = max(0, top // self.group_rows - 1)
+        last = min(len(self.starts), -(-bottom // self.group_rows) + 1)
+        with _open_source(self.source) as fp:
+            fp.seek(self.starts[first])
+            data = fp.read(self.ends[last - 1] - self.starts[first])
+
+        # Restart markers count 0-7 from the start of the scan, so they are renumbered from the band's first one
+        shift = first * self.restarts_per_group % 8
+        if shift:
+            data = JPEG_RESTART.sub(lambda match: bytes((0xFF, 0xD0 + (match.group()[1] - 0xD0 - shift) % 8)), data)
+
+        band_top = first * self.group_rows
+        header = jpeg_with_height(self.header, min(last * self.group_rows, self.size[1]) - band_top)
+        with Image.open(io.BytesIO(b"\xff\xd8" + jpeg_segment_bytes(header) + data + b"\xff\xd9")) as band:
+            return band.crop((0, top - band_top, self.size[0], bottom - band_top))
+
+class RawTileBands:
+    """
+    Reads rows of an uncompressed image (raw TIFF strips or tiles, PPM) straight from the file.
+    """
+
+    def __init__(self, source, mode: str, size: tuple[int, int], tiles: list):
+        self.source = source
+        self.mode = mode
+        self.size = size
+        self.tiles = tiles
+
+    @classmethod
+    def open(cls, source, image: Image) -> "RawTileBands | None":
+        """
+        Collects the raw tiles of an image file. Returns None if any part of it is compressed, stored
+        bottom up, palette based or split into planes.
+        """
+        if image.mode in ("P", "PA") or not image.tile:
+            return None
+
+        tiles = []
+        for decoder, box, offset, args in (tuple(tile)[:4] for tile in image.tile):
+            rawmode, stride, ystep = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+            if decoder != "raw" or ystep != 1:
+                return None
+            if not stride:
+                try:
+                    stride = len(Image.new(image.mode, (box[2] - box[0], 1)).tobytes("raw", rawmode))
+                except ValueError:
+                    return None
+            tiles.append((box, offset, rawmode, stride))
+
+        # Planar images repeat every tile once per plane
+        if sum((x1 - x0) * (y1 - y0) for (x0, y0, x1, y1), _, _, _ in tiles) != image.width * image.height:
+            return None
+        return cls(source, image.mode, image.size, tiles)
+
+    def read(self, top: int, bottom: int) -> Image:
+        """
+        Returns the stored rows top to bottom (exclusive) as a new image.
+        """
+        band = Image.new(self.mode, (self.size[0], bottom - top))
+        with _open_source(self.source) as fp:
+            for (x0, y0, x1, y1), offset, rawmode, stride in self.tiles:
+                first, last = max(top, y0), min(bottom, y1)
+                if first < last:
+                    fp.seek(offset + (first - y0) * stride)
+                    rows = Image.frombytes(self.mode, (x1 - x0, last - first), fp.read((last - first) * stride), "raw", rawmode, stride, 1)
+                    band.paste(rows, (x0, first - top))
+        return band
+
+class UprightRows:
+    """
+    Reads horizontal bands of an image as they look once its EXIF orientation is applied, without
+    transposing the whole image (and, where the file allows it, without decoding it as a whole).
+
+    Parameters:
+        image (Image | str | bytes): A decoded image, or the path or contents of an image file.
+        orientation (int, optional): The EXIF orientation, read from the image if None.
+    """
+
+    def __init__(self, image: "Image.Image | str | bytes", orientation: int=None):
+        self._bands = None
+        self.image = image if isinstance(image, Image.Image) else Image.open(image if isinstance(image, str) else io.BytesIO(image))
+        self.orientation = self.image.getexif().get(EXIF_ORIENTATION_TAG, 1) if orientation is None else orientation
+        self.size = oriented_size(self.image.width, self.image.height, self.orientation)
+        self.mode = self.image.mode
+
+        # Upright or flipped files are read in bands of stored rows (rotated ones store the upright rows as columns)
+        if not isinstance(image, Image.Image) and self.orientation in (1, 2, 3, 4):
+            self._bands = JpegRestartBands.open(image, self.image) or RawTileBands.open(image, self.image)
+            if self._bands is not None:
+                self.image.close()
+        logger.debug("Reading %s rows %s", self.size, "in bands" if self._bands is not None else "from a full decode")
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    def rows(self, top: int, bottom: int) -> Image:
+        """
+        Returns the upright rows top to bottom (exclusive) as a new image.
+        """
+        width, height = self.image.size
+        if self.orientation in (3, 4):
+            box = (0, height - bottom, width, height - top)
+        elif self.orientation in (5, 6):
+            # Rotated by 90 degrees: upright rows are stored columns
+            box = (top, 0, bottom, height)
+        elif self.orientation in (7, 8):
+            box = (width - bottom, 0, width - top, height)
+        else:
+            box = (0, top, width, bottom)
+
+        band = self._bands.read(box[1], box[3]) if self._bands is not None else self.image.crop(box)
+        method = ORIENTATION_TRANSPOSE.get(self.orientation)
+        return band.transpose(method) if method is not None else band
+
+# Strip canvas
+# --------------------------------------------------------------------
+
+class StripCanvas:
+    """
+    A canvas described by its size and the images pasted into it (like `compose_canvas`) that is never
+    allocated as a whole. It stands in for the Image the pipelines return: `save` (which encode_image
+    calls) writes it strip by strip, `resize` (for the renditions) reduces it strip by strip.
+
+    Parameters:
+        size (tuple[int, int]): The (width, height) of the final image.
+        components (list[tuple[Image | UprightRows, tuple[int, int]]]): The images to paste with their (x, y) offsets.
+        mode (str, optional): The mode of the canvas. Default is "RGB".
+        fill (optional): The background color. Default is white.
+    """
+
+    def __init__(self, size: tuple[int, int], components: list, mode: str="RGB", fill="white"):
+        self.size = tuple(size)
+        self.components = [(component if isinstance(component, UprightRows) else UprightRows(component, 1), tuple(offset)) for component, offset in components]
+        self.mode = mode
+        self.fill = fill
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    def strips(self, rows: int):
+        """
+        Composes the canvas `rows` rows at a time, yielding the top row and the image of every strip.
+        """
+        width, height = self.size
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            strip = Image.new(self.mode, (width, bottom - top), self.fill)
+            for source, (x, y) in self.components:
+                first, last = max(top, y), min(bottom, y + source.height)
+                if first < last:
+                    strip.paste(source.rows(first - y, last - y), (x, first - top))
+            yield top, strip
+
+    def convert(self, mode: str) -> "StripCanvas":
+        # The components are converted strip by strip when they are pasted
+        return StripCanvas(self.size, self.components, mode, self.fill)
+
+    def render(self) -> Image:
+        """
+        Composes the whole canvas in memory (for writers that can't take it strip by strip).
+        """
+        canvas = Image.new(self.mode, self.size, self.fill)
+        for top, strip in self.strips(strip_height(self.width)):
+            canvas.paste(strip, (0, top))
+        return canvas
+
+    def resize(self, size: tuple[int, int], resample=Image.Resampling.BICUBIC, reducing_gap: float=None) -> Image:
+        """
+        Resizes the canvas like Image.resize. With a reducing_gap, the canvas is first reduced by whole
+        factors strip by strip (Image.reduce averages blocks, so strips of whole blocks reduce exactly
+        as the full canvas would), then the reduced image is resized.
+        """
+        width, height = self.size
+        factor_x = (int(width / size[0] / reducing_gap) or 1) if reducing_gap else 1
+        factor_y = (int(height / size[1] / reducing_gap) or 1) if reducing_gap else 1
+
+        reduced = Image.new(self.mode, (math.ceil(width / factor_x), math.ceil(height / factor_y)))
+        rows = max(factor_y, strip_height(width) // factor_y * factor_y)
+        for top, strip in self.strips(rows):
+            reduced.paste(strip.reduce((factor_x, factor_y)) if factor_x > 1 or factor_y > 1 else strip, (0, top // factor_y))
+        return reduced.resize(size, resample, box=(0, 0, width / factor_x, height / factor_y))
+
+    def save(self, fp, format: str=None, **options):
+        """
+        Encodes the canvas like Image.save, strip by strip for JPEG and PNG.
+
+        Parameters:
+            fp (str | file object): The output path or a binary file object.
+            format (str, optional): The format, from the file extension if None.
+            **options: The encoder options (see write_jpeg_strips / write_png_strips).
+        """
+        if format is None and isinstance(fp, str):
+            format = Image.registered_extensions().get(os.path.splitext(fp)[1].lower())
+        format = (format or "").upper()
+
+        writer = STRIP_WRITERS.get(format)
+        if writer is None or (format == "PNG" and self.mode not in PNG_COLOR_TYPES):
+            logger.warning("No strip writer for %s %s, composing the %sx%s canvas in memory", format, self.mode, self.width, self.height)
+            self.render().save(fp, format=format, **options)
+            return
+
+        if isinstance(fp, str):
+            with open(fp, "wb") as f:
+                writer(self, f, **options)
+        else:
+            writer(self, fp, **options)
+
+# Strip writers
+# --------------------------------------------------------------------
+
+# Helper function to write a strip canvas as one baseline JPEG
+def write_jpeg_strips(canvas: StripCanvas, fp, quality: int=None, subsampling=None, icc_profile: bytes=None, exif: bytes=None, **options):
+    """
+    Writes a canvas as a baseline JPEG, one strip at a time. Each strip is encoded as a JPEG of its own
+    (a whole number of MCU rows, with the same quality, subsampling and standard Huffman tables) and
+    the strips' entropy coded data is joined with restart markers, declared by a restart interval of
+    one strip. Progressive and optimized encoding need the whole image and are ignored.
+
+    Parameters:
+        canvas (StripCanvas): The canvas to write.
+        fp (file object): The binary file to write to.
+        quality (int, optional): The JPEG quality (Pillow's default if None).
+        subsampling (optional): The chroma subsampling (Pillow's default if None).
+        icc_profile (bytes, optional): The ICC profile to embed.
+        exif (bytes, optional): The EXIF block to embed.
+    """
+    width, height = canvas.size
+    strip_options = {key: value for key, value in (("quality", quality), ("subsampling", subsampling)) if value is not None}
+    header_options = dict(strip_options, **{key: value for key, value in (("icc_profile", icc_profile), ("exif", exif)) if value})
+
+    # Whole MCU rows (16 fits every subsampling), and few enough 8x8 MCUs for the 16-bit restart interval
+    rows = max(16, min(strip_height(width), 65535 * 8 // math.ceil(width / 8)) // 16 * 16)
+    for index, (top, strip) in enumerate(canvas.strips(rows)):
+        encoded = io.BytesIO()
+        strip.save(encoded, "JPEG", **(header_options if index == 0 else strip_options))
+        encoded.seek(0)
+        segments = read_jpeg_header(encoded)
+        data = encoded.read()[:-2]
+
+        if index == 0:
+            # The first strip's header (with the EXIF and ICC profile) declares the full height and the restart interval
+            frame = next(payload for marker, payload in segments if marker in JPEG_SOF)
+            mcu_width, mcu_height = jpeg_mcu_size(frame)
+            restart_interval = math.ceil(width / mcu_width) * (rows // mcu_height)
+            header = jpeg_with_height(segments, height)
+            header.insert(len(header) - 1, (JPEG_DRI, struct.pack(">H", restart_interval)))
+            fp.write(b"\xff\xd8" + jpeg_segment_bytes(header))
+        else:
+            fp.write(bytes((0xFF, 0xD0 + (index - 1) % 8)))
+        fp.write(data)
+    fp.write(b"\xff\xd9")
+
+# Helper function to filter PNG rows with the Paeth predictor
+def _png_paeth_rows(pixels: "np.ndarray", previous: "np.ndarray", channels: int) -> bytes:
+    import numpy as np
+
+    current = pixels.astype(np.int16)
+    up = np.vstack([previous[None].astype(np.int16), current[:-1]])
+    left, up_left = np.zeros_like(current), np.zeros_like(current)
+    left[:, channels:], up_left[:, channels:] = current[:, :-channels], up[:, :-channels]
+
+    # Paeth: whichever of left, up and up-left is closest to left + up - up-left
+    distance_left, distance_up, distance_up_left = np.abs(up - up_left), np.abs(left - up_left), np.abs(left + up - 2 * up_left)
+    predictor = np.where((distance_left <= distance_up) & (distance_left <= distance_up_left), left, np.where(distance_up <= distance_up_left, up, up_left))
+
+    filtered = np.empty((pixels.shape[0], pixels.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = 4
+    filtered[:, 1:] = (current - predictor) & 0xFF
+    return filtered.tobytes()
+
+# Helper function to write a strip canvas as a PNG
+def write_png_strips(canvas: StripCanvas, fp, compress_level: int=6, icc_profile: bytes=None, exif: bytes=None, **options):
+    """
+    Writes a canvas as a PNG, one strip at a time: the rows are Paeth filtered and fed to a single
+    zlib stream whose output is written as IDAT chunks as it comes.
+
+    Parameters:
+        canvas (StripCanvas): The canvas to write (L, RGB or RGBA).
+        fp (file object): The binary file to write to.
+        compress_level (int, optional): The zlib compression level. Default is 6.
+        icc_profile (bytes, optional): The ICC profile to embed.
+        exif (bytes, optional): The EXIF block to embed.
+    """
+    import numpy as np
+
+    def chunk(kind: bytes, data: bytes):
+        fp.write(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data)))
+
+    width, height = canvas.size
+    color_type, channels = PNG_COLOR_TYPES[canvas.mode]
+    fp.write(b"\x89PNG\r\n\x1a\n")
+    chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+    if icc_profile:
+        chunk(b"iCCP", b"ICC Profile\x00\x00" + zlib.compress(icc_profile))
+    if exif:
+        chunk(b"eXIf", exif[6:] if exif.startswith(b"Exif\x00\x00") else exif)
+
+    # Smaller strips than for JPEG, the filter works on 16-bit copies of the rows
+    compressor = zlib.compressobj(compress_level)
+    previous = np.zeros(width * channels, dtype=np.uint8)
+    for top, strip in canvas.strips(max(1, strip_height(width) // 8)):
+        pixels = np.frombuffer(strip.tobytes(), dtype=np.uint8).reshape(strip.height, width * channels)
+        compressed = compressor.compress(_png_paeth_rows(pixels, previous, channels))
+        previous = pixels[-1]
+        if compressed:
+            chunk(b"IDAT", compressed)
+    chunk(b"IDAT", compressor.flush())
+    chunk(b"IEND", b"")
+
+# Formats a StripCanvas is written strip by strip in
+STRIP_WRITERS = {"JPEG": write_jpeg_strips, "PNG": write_png_strips}
+
+# Strip rendered pipelines
+# --------------------------------------------------------------------
+
+# Helper function to add the simple white border to a very large image without building it in memory
+def create_strip_border(image: "UprightRows | Image.Image | str | bytes", target_aspect_ratio: tuple[int, int], border_percentage: int) -> StripCanvas:
+    """
+    Creates the same white border as `create_simple_border` as a StripCanvas. The image is passed as
+    stored (not transposed), ideally as its file, so it is read band by band when the canvas is encoded.
+
+    Parameters:
+        image (UprightRows | Image | str | bytes): The source, as rows, a stored image or the path or contents of its file.
+        target_aspect_ratio (tuple[int, int]): The desired aspect ratio as a tuple (width, height).
+        border_percentage (int): The size of the uniform border as a percentage of the shorter side.
+
+    Returns:
+        StripCanvas: The bordered canvas.
+    """
+    source = image if isinstance(image, UprightRows) else UprightRows(image)
+    left, top, right, bottom = simple_border_padding(source.width, source.height, target_aspect_ratio, border_percentage)
+    canvas_size = (left + source.width + right, top + source.height + bottom)
+    return StripCanvas(canvas_size, [(source, (left, top))], mode=source.mode)
@@ -0,0 +1,202 @@
+import importlib, logging, multiprocessing, os, threading
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+'''
+Batch execution layer
+
+Spreads the per-image work of a multi-image request (metadata overlays, white borders) across a
+shared process pool so a batch uses every core instead of running one image at a time in the
+request thread. The pool is created lazily on first use and reused between requests.
+
+Workers are started from a forkserver rather than forked from the web worker: the web worker runs
+several threads (job dispatcher, request threads) that may hold a lock at the moment the pool starts,
+and a forked child would inherit that lock held forever. The processing modules are imported once
+in the (single-threaded) forkserver and every worker checks them in its initializer, so the per-image
+jobs don't pay for those imports.
+'''
+
+logger = logging.getLogger(__name__)
+
+# Default number of worker processes (override with the BATCH_WORKERS environment variable)
+DEFAULT_BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", os.cpu_count() or 1))
+
+# Modules every worker imports up front (the heavy palette and timezone dependencies included)
+WORKER_PRELOAD_MODULES = (
+    "services.image_upload_service",
+    "processing_scripts.image_transformer",
+    "processing_scripts.palette",
+    "Pylette",
+    "timezonefinder",
+)
+
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+
+# Number of batches running on each pool (a pool is only replaced while nothing runs on it)
+_executor_batches = Counter()
+
+# Helper function to import the processing modules when a worker process starts
+# (already loaded when the forkserver preloaded them, see _worker_context)
+def _preload_worker_modules(modules: tuple[str, ...]):
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            # The job importing it will report the error, the worker itself is still usable
+            logger.warning("Could not preload %s in batch worker: %s", module, e)
+
+# Helper function to get the multiprocessing context the workers are started from
+def _worker_context():
+    context = multiprocessing.get_context("forkserver")
+    # Only takes effect when the forkserver starts, workers forked from it then inherit the imports
+    context.set_forkserver_preload(list(WORKER_PRELOAD_MODULES))
+    return context
+
+# Helper function to get the shared pool, or a new one, without taking the lock
+def _current_batch_executor(max_workers: int) -> ProcessPoolExecutor:
+    global _executor, _executor_workers
+
+    if _executor is not None and _executor_workers != max_workers:
+        if _executor_batches[_executor]:
+            # Another request's batch is still running on it, resizing would cancel that batch
+            logger.debug("Batch pool busy, keeping %s workers instead of %s", _executor_workers, max_workers)
+            return _executor
+        _executor.shutdown(wait=False)
+        _executor = None
+
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=_worker_context(),
+            initializer=_preload_worker_modules,
+            initargs=(WORKER_PRELOAD_MODULES,),
+        )
+        _executor_workers = max_workers
+    return _executor
+
+# Helper function to get (or lazily create) the shared process pool for a given worker count
+def get_batch_executor(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the shared ProcessPoolExecutor, creating it on first use or when the requested
+    worker count changes. A pool that a batch is still running on is returned as it is.
+
+    Parameters:
+        max_workers (int): The number of worker processes the pool should have.
+
+    Returns:
+        ProcessPoolExecutor: The shared executor.
+    """
+    with _executor_lock:
+        return _current_batch_executor(max_workers)
+
+# Helper function to hold on to the shared pool while a batch runs on it
+@contextmanager
+def borrow_batch_executor(max_workers: int):
+    """
+    Yields the shared ProcessPoolExecutor (see get_batch_executor) and keeps it from being resized
+    until the block ends.
+
+    Parameters:
+        max_workers (int): The number of worker processes the pool should have.
+    """
+    with _executor_lock:
+        executor = _current_batch_executor(max_workers)
+        _executor_batches[executor] += 1
+    try:
+        yield executor
+    finally:
+        with _executor_lock:
+            _executor_batches[executor] -= 1
+            if _executor_batches[executor] <= 0:
+                del _executor_batches[executor]
+
+# Helper function to tear down the shared pool (used on exit, or after a worker crashed)
+def shutdown_batch_executor(wait: bool=True):
+    """
+    Shuts down the shared process pool if one was created.
+
+    Parameters:
+        wait (bool, optional): Whether to wait for running jobs to finish. Defaults to True.
+    """
+    global _executor, _executor_workers
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait, cancel_futures=not wait)
+        _executor = None
+        _executor_workers = None
+
+# Helper function to run one job per image across the pool, yielding each result as soon as it is ready
+def iter_batch(func, jobs: list[tuple], max_workers: int=None):
+    """
+    Runs `func(*args)` for every entry of `jobs`, in parallel when more than one worker is configured,
+    and yields `(index, result)` pairs in completion order (used for progress reporting).
+
+    Each job is isolated: if it raises, the error is logged and its result is None,
+    the same way the request loops used to `continue` past a failing image.
+
+    Parameters:
+        func (callable): A module-level (picklable) function processing a single image.
+        jobs (list[tuple]): The positional arguments for each call.
+        max_workers (int, optional): Number of worker processes. Defaults to DEFAULT_BATCH_WORKERS.
+            With 1 worker (or a single job) everything runs inline in the calling thread.
+
+    Yields:
+        tuple[int, Any]: The index of the finished job in `jobs` and its return value (None on failure).
+    """
+    if max_workers is None:
+        max_workers = DEFAULT_BATCH_WORKERS
+
+    # Not worth shipping a single image (or a one-worker config) to another process
+    if max_workers <= 1 or len(jobs) <= 1:
+        for index, args in enumerate(jobs):
+            try:
+                result = func(*args)
+            except Exception as e:
+                logger.error("Error processing batch job %s: %s", args[0], e)
+                result = None
+            yield index, result
+        return
+
+    pool_broken = False
+    with borrow_batch_executor(max_workers) as executor:
+        futures = {executor.submit(func, *args): index for index, args in enumerate(jobs)}
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. out of memory), drop the pool so the next batch gets a fresh one
+                    logger.error("Worker process died while processing %s: %s", jobs[index][0], e)
+                    result = None
+                    pool_broken = True
+                except Exception as e:
+                    logger.error("Error processing batch job %s: %s", jobs[index][0], e)
+                    result = None
+                yield index, result
+        finally:
+            if pool_broken:
+                shutdown_batch_executor(wait=False)
+
+# Helper function to run one job per image across the pool and collect the results in input order
+def run_batch(func, jobs: list[tuple], max_workers: int=None) -> list:
+    """
+    Runs every job through `iter_batch` and returns the results in the same order as `jobs`.
+
+    Parameters:
+        func (callable): A module-level (picklable) function processing a single image.
+        jobs (list[tuple]): The positional arguments for each call.
+        max_workers (int, optional): Number of worker processes. Defaults to DEFAULT_BATCH_WORKERS.
+
+    Returns:
+        list: The return value of each job (None for failed jobs), in the same order as `jobs`.
+    """
+    results = [None] * len(jobs)
+    for index, result in iter_batch(func, jobs, max_workers):
+        results[index] = result
+    return results
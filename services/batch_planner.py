@@ -0,0 +1,101 @@
+import logging
+from PIL import Image, ExifTags
+from processing_scripts.helpers import compute_print_padding_bulk, get_coordinates_from_address, overlay_layout, overlay_plan, parse_print_aspect_ratio
+from processing_scripts.image_context import EXIF_ORIENTATION_TAG, oriented_size
+from processing_scripts.geocode_cache import normalize_address
+from services.image_upload_service import resolve_print_aspect_ratio
+
+'''
+Batch planner for metadata overlays
+
+Images of one shoot mostly share their dimensions, location and requested aspect ratio, and
+everything the overlay works out from those alone (the geocoded location, its timezone
+and GPS string, the overlay font sizes and text positions, the stack layout and the print padding)
+comes out the same for each of them. Before a batch is fanned out, the planner reads the header
+and EXIF of every upload (no pixels are decoded), groups the images on those fields and builds one
+`overlay_plan` per group. Each job then carries its group's plan, so the workers only do the
+per-image work: decoding, the metadata text, the palette, compositing and encoding.
+
+The print padding of all groups is worked out in one vectorized call (`compute_print_padding_bulk`).
+Geocoding is serialized: the distinct addresses of a batch are looked up one after another, through
+the shared geocode cache, on the thread that plans the batch (the request thread for synchronous
+batches, the job dispatcher for background jobs). A batch usually carries a single address, so this
+is one lookup (none when it is cached) rather than one per image in the workers.
+Images the planner can't plan (unreadable headers, no location, an unparsable aspect ratio) are left
+without a plan and processed exactly as before.
+'''
+
+logger = logging.getLogger(__name__)
+
+# Helper function to read what the planner groups on from the header alone
+def read_image_header(image_path: str) -> dict:
+    """
+    Reads the upright size of an image and whether it is geotagged from its header and EXIF without decoding it.
+
+    Parameters:
+        image_path (str): Path to the image.
+
+    Returns:
+        dict: The upright `size` and `has_gps`, whether the file carries GPS tags the overlay would report
+        instead of the requested location.
+    """
+    with Image.open(image_path) as img:
+        # The same flattened EXIF the ImageContext parses, read from the APP1 block that came with the header
+        exif = (img._getexif() if hasattr(img, "_getexif") else None) or {}
+        size = oriented_size(img.width, img.height, exif.get(EXIF_ORIENTATION_TAG, 1))
+
+    return {
+        "size": size,
+        "has_gps": any(tag in ExifTags.GPSTAGS for tag in exif),
+    }
+
+'''
+Plans a batch of metadata overlay jobs (runs before the batch is handed to the executor)
+
+Parameters:
+- jobs: The `process_saved_overlay` arguments of each image, (filepath, form, upload_folder, upload_digest) (list[tuple])
+
+Returns:
+- planned_jobs: The same jobs with the plan of each image's group appended (None for images that couldn't be planned) (list[tuple])
+'''
+def plan_overlay_jobs(jobs):
+    coordinates_by_address = {}
+    groups = {}
+    job_keys = []
+
+    # Read every header and group the images (the location is resolved once per distinct address, one after another)
+    for filepath, form, upload_folder, upload_digest in jobs:
+        key = None
+        try:
+            header = read_image_header(filepath)
+
+            latitude, longitude = form.get('latitude'), form.get('longitude')
+            if (latitude is None or longitude is None) and form.get('address'):
+                address = normalize_address(form['address'])
+                if address not in coordinates_by_address:
+                    coordinates_by_address[address] = get_coordinates_from_address(form['address'])
+                latitude, longitude = coordinates_by_address[address]
+
+            if latitude is not None and longitude is not None and not header["has_gps"]:
+                width, height = header["size"]
+                print_aspect_ratio = parse_print_aspect_ratio(resolve_print_aspect_ratio(form, header["size"]), width, height)
+                key = (header["size"], (latitude, longitude), print_aspect_ratio)
+                groups.setdefault(key, None)
+        except Exception as e:
+            # The worker runs into the same problem and reports it for this image, the rest of the batch is still planned
+            logger.debug("Not planning %s: %s", filepath, e)
+        job_keys.append(key)
+
+    # The print padding of every group in one vectorized call, then the rest of each group's plan
+    if groups:
+        keys = list(groups)
+        sizes = [key[0] for key in keys]
+        stacked_sizes = [overlay_layout(width, height, padding=(0, 0))["stacked_size"] for width, height in sizes]
+        paddings = compute_print_padding_bulk(sizes, stacked_sizes, [key[2] for key in keys])
+        for key, padding in zip(keys, paddings):
+            size, (latitude, longitude), print_aspect_ratio = key
+            groups[key] = overlay_plan(size, latitude, longitude, print_aspect_ratio, padding=padding)
+
+    planned_jobs = [job + (groups[key] if key is not None else None,) for job, key in zip(jobs, job_keys)]
+    logger.info("Planned %s of %s images in %s groups", sum(1 for key in job_keys if key is not None), len(jobs), len(groups))
+    return planned_jobs
@@ -0,0 +1,100 @@
+import json, os, sqlite3, threading, time, uuid
+
+'''
+Server-side store for finished batches
+
+The results page and /download-all need the list of processed files of the last batch. Keeping
+that list in Flask's cookie session makes the cookie grow with the batch and be sent back on every
+request, so the list lives here instead and the session only holds the short batch ID. The store is
+a SQLite file, so any worker process can serve a batch another one produced.
+'''
+
+# How long a batch can be looked up after it was stored
+BATCH_TTL_SECONDS = int(os.environ.get("BATCH_TTL_SECONDS", 6 * 60 * 60))
+
+# Where the store lives (override with the BATCH_STORE_PATH environment variable)
+DEFAULT_BATCH_STORE_PATH = os.environ.get("BATCH_STORE_PATH", os.path.join("cache", "batches.sqlite3"))
+
+class BatchStore:
+    """
+    Maps batch IDs to the processed filenames of a batch, with expiry.
+
+    Parameters:
+        path (str): The SQLite file.
+        ttl_seconds (int): How long a batch stays available.
+        clock (callable): Returns the current time in seconds (injectable for tests).
+    """
+
+    def __init__(self, path: str=DEFAULT_BATCH_STORE_PATH, ttl_seconds: int=BATCH_TTL_SECONDS, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS batches (batch_id TEXT PRIMARY KEY, filenames TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # A short-lived connection per call keeps the store safe across threads and worker processes
+        return sqlite3.connect(self.path, timeout=10)
+
+    def save(self, filenames: list[str]) -> str:
+        """
+        Stores the processed filenames of a batch.
+
+        Parameters:
+            filenames (list[str]): The processed filenames, in display order.
+
+        Returns:
+            str: The new batch ID.
+        """
+        batch_id = uuid.uuid4().hex
+        now = self.clock()
+        with self._connect() as connection:
+            # Drop expired batches while we are here
+            connection.execute("DELETE FROM batches WHERE expires_at <= ?", (now,))
+            connection.execute(
+                "INSERT INTO batches (batch_id, filenames, expires_at) VALUES (?, ?, ?)",
+                (batch_id, json.dumps(list(filenames)), now + self.ttl_seconds),
+            )
+        return batch_id
+
+    def get(self, batch_id: str) -> list[str]:
+        """
+        Returns the processed filenames of a batch, or None if the ID is unknown or expired.
+        """
+        if not batch_id:
+            return None
+        with self._connect() as connection:
+            row = connection.execute("SELECT filenames, expires_at FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if row is None or row[1] <= self.clock():
+            return None
+        return json.loads(row[0])
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+'''
+Returns the shared BatchStore (created on first use so importing the module has no side effects)
+'''
+def get_batch_store():
+    global _default_store
+
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = BatchStore()
+        return _default_store
+
+'''
+Replaces the shared BatchStore (e.g. with one in a temporary directory for tests)
+'''
+def set_batch_store(store):
+    global _default_store
+
+    with _default_store_lock:
+        _default_store = store
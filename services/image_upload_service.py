@@ -1,88 +1,245 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, session, send_from_directory
 from werkzeug.utils import secure_filename
-from processing_scripts.image_transformer import process_image
 from processing_scripts.helpers import *
-from livereload import Server
-import os, atexit, math, uuid, zlib
+from processing_scripts.image_context import load_image_context, request_draft, DRAFT_MAX_SIZE
+from processing_scripts.encoders import encode_image, get_encoder_profile, output_filename
+from processing_scripts.renditions import write_renditions
+from processing_scripts.strip_render import create_strip_border, use_strip_render
+from processing_scripts.geocode_cache import normalize_address
+from processing_scripts.instrumentation import stage, trace
+from services.result_cache import get_result_cache, file_digest
+from services.upload_ingest import IngestedUpload, ingested_digest
+import logging, os, math, uuid
 from PIL import Image, ImageOps
 
+logger = logging.getLogger(__name__)
+
+# Output qualities of the white border tool ("draft" decodes JPEGs at reduced scale for a quick proof)
+BORDER_QUALITIES = ("full", "draft")
+
 '''
-Metadata overlay method (API will call this function directly)
+Upload saving helper (always runs in the request thread, the FileStorage can't leave it)
 
-Core logic to handle the processing of a singluar image with a requested metadata overlay
+Saves an uploaded file under a unique name in the upload folder
 
 Parameters:
 - file: The uploaded image file object (werkzeug.datastructures.FileStorage)
-- form: The form data containing overlay parameters (flask.request.form)
 - upload_folder: The directory path where uploaded and processed images are stored (str)
 
 Returns:
-- processed_image_path: The file path of the processed image with metadata overlay (str)
+- filepath: The path of the saved upload (str)
 '''
-def process_metadata_overlay(file, form, upload_folder):
-    # Save the uploaded file
+def save_upload(file, upload_folder):
     original_filename = secure_filename(file.filename)
     unique_prefix = uuid.uuid4().hex[:8]
     filename = f"{unique_prefix}_{original_filename}"
     filepath = os.path.join(upload_folder, filename)
-    file.save(filepath)
+    if isinstance(file.stream, IngestedUpload):
+        # Already streamed into the upload folder while the request was parsed, just move it into place
+        file.stream.commit(filepath)
+    else:
+        file.save(filepath)
+    return filepath
 
-    # Extract the form data
-    address = form.get('address')
-    latitude = to_float(form.get('latitude'))
-    longitude = to_float(form.get('longitude'))
-    photo_title = form.get('photoName')
-    aspect_ratio = form.get('aspectRatio', 'Default')
-    print(f"Address: {address}, Latitude: {latitude}, Longitude: {longitude}, Photo Title: {photo_title}, Aspect Ratio: {aspect_ratio}")
+'''
+Print aspect ratio helper (shared by the overlay workers and the batch planner)
 
-    # Get the coordinates from the address if provided otherwise just use lat/long
-    if latitude is None or longitude is None:
-        if address is None:
-            raise ValueError("A location must be provided if latitude/longitude are not provided")
-        else:
-            # Call the Nominatim backed helper
-            coordinates = get_coordinates_from_address(address=address)
-            latitude, longitude = coordinates
+Parameters:
+- form: A plain mapping with the overlay parameters (aspectRatio, customAspectRatio)
+- image_size: The upright (width, height) of the image, used for the "Default" aspect ratio
+
+Returns:
+- print_aspect_ratio: A (width, height) tuple, or the aspect ratio string as given when it is neither "Custom" nor "Default"
+'''
+def resolve_print_aspect_ratio(form, image_size):
+    aspect_ratio = form.get('aspectRatio', 'Default')
 
     # Convert the aspect ratio into a valid format if a custom aspect ratio is requested
     print_aspect_ratio = aspect_ratio
     if aspect_ratio == "Custom":
-        custom_aspect = request.form.get('customAspectRatio')
+        custom_aspect = form.get('customAspectRatio')
         if custom_aspect:
             try:
                 width, height = map(int, custom_aspect.split(":"))
                 print_aspect_ratio = (width, height)
             except ValueError:
-                return jsonify({"error": "Invalid custom aspect ratio"}), 400
+                raise ValueError(f"Invalid custom aspect ratio: {custom_aspect}")
     elif aspect_ratio == "Default":
-        # Open the image to determine its aspect ratio
-        with Image.open(filepath) as img:
-            # Ensure the image is in its correct orientation after opening it
-            img = ImageOps.exif_transpose(img)
-            width, height = img.size
-
-            # Need to reduce width and height to their simplest form
-            gcd = math.gcd(width, height)
-            width //= gcd
-            height //= gcd
-            print_aspect_ratio = (width, height)
-
-    # Now that we have all of the fields in the desired format we can start working on the metadata overlay
-    try:
-        processed_image = process_image(
-            filepath,
-            latitude=latitude,
-            longitude=longitude,
-            photo_title=photo_title,
-            print_aspect_ratio=print_aspect_ratio,
-            local_save=False # Not saving it locally within the function, will only save in the static/uploads folder
-        )
-
-        # Save the processed image to return
-        processed_image_filename = f"processed_{filename}"
-        processed_image_path = os.path.join(upload_folder, processed_image_filename)
-        processed_image.save(processed_image_path, quality=100, optimize=True, progressive=True)
+        width, height = image_size
+
+        # Need to reduce width and height to their simplest form
+        gcd = math.gcd(width, height)
+        width //= gcd
+        height //= gcd
+        print_aspect_ratio = (width, height)
+    return print_aspect_ratio
+
+'''
+Metadata overlay method (API will call this function directly)
+
+Core logic to handle the processing of a singluar image with a requested metadata overlay
+
+Parameters:
+- file: The uploaded image file object (werkzeug.datastructures.FileStorage)
+- form: The form data containing overlay parameters (flask.request.form)
+- upload_folder: The directory path where uploaded and processed images are stored (str)
+
+Returns:
+- processed_image_path: The file path of the processed image with metadata overlay (str)
+'''
+def process_metadata_overlay(file, form, upload_folder):
+    # Save the uploaded file
+    digest = ingested_digest(file)
+    filepath = save_upload(file, upload_folder)
+    return process_saved_overlay(filepath, form, upload_folder, digest)
+
+'''
+Metadata overlay for an upload that is already on disk (batch workers call this directly)
+
+Parameters:
+- filepath: Path of the saved upload (str)
+- form: A plain mapping with the overlay parameters (address, latitude, longitude, photoName, aspectRatio, customAspectRatio, encoderProfile)
+- upload_folder: The directory path where processed images are stored (str)
+- upload_digest: SHA-256 of the upload if it was already computed during ingestion (str)
+- plan: The overlay plan the batch planner shared with the other images of this one's group (dict, see services.batch_planner)
+
+Returns:
+- processed_image_path: The file path of the processed image with metadata overlay (str)
+'''
+def process_saved_overlay(filepath, form, upload_folder, upload_digest=None, plan=None):
+    filename = os.path.basename(filepath)
+
+    # Extract the form data
+    address = form.get('address')
+    latitude = to_float(form.get('latitude'))
+    longitude = to_float(form.get('longitude'))
+    photo_title = form.get('photoName')
+    aspect_ratio = form.get('aspectRatio', 'Default')
+    encoder_profile, _ = get_encoder_profile(form.get('encoderProfile'))
+    logger.debug("Address: %s, Latitude: %s, Longitude: %s, Photo Title: %s, Aspect Ratio: %s", address, latitude, longitude, photo_title, aspect_ratio)
+
+    processed_image_filename = output_filename(f"processed_{filename}", encoder_profile)
+    processed_image_path = os.path.join(upload_folder, processed_image_filename)
 
+    # The same upload with the same settings was processed before, reuse the stored output (no geocoding, decode or encode)
+    result_cache = get_result_cache()
+    cache_key = result_cache.key(upload_digest or file_digest(filepath), "overlay", {
+        "location": [round(latitude, 6), round(longitude, 6)] if latitude is not None and longitude is not None else normalize_address(address or ""),
+        "photo_title": (photo_title or "").strip(),
+        "aspect_ratio": aspect_ratio,
+        "custom_aspect_ratio": (form.get('customAspectRatio') or "").strip() if aspect_ratio == "Custom" else None,
+        "encoder_profile": encoder_profile,
+    })
+    if result_cache.fetch(cache_key, processed_image_path):
         return processed_image_path
-    except Exception as e:
-        print("Error during image processing:", e)
+
+    # Everything from here on is timed per stage and published as one trace for this image
+    with trace("overlay", filename) as current_trace:
+        # Read and parse the upload once, every later step reuses this context
+        with stage("open"):
+            context = load_image_context(filepath)
+
+        # The batch planner already resolved the location for the whole group
+        if plan is not None:
+            latitude, longitude = plan["latitude"], plan["longitude"]
+
+        # Get the coordinates from the address if provided otherwise just use lat/long
+        if latitude is None or longitude is None:
+            if address is None:
+                raise ValueError("A location must be provided if latitude/longitude are not provided")
+            else:
+                # Call the Nominatim backed helper
+                with stage("geocode"):
+                    coordinates = get_coordinates_from_address(address=address)
+                latitude, longitude = coordinates
+
+        # Convert the aspect ratio into a valid format (from the already oriented dimensions for "Default")
+        print_aspect_ratio = resolve_print_aspect_ratio(form, context.size)
+
+        # Now that we have all of the fields in the desired format we can start working on the metadata overlay
+        # (imported here, the overlay pipeline pulls in Pylette/NumPy which the border tool never needs)
+        from processing_scripts.image_transformer import process_image
+
+        try:
+            processed_image = process_image(
+                context,
+                latitude=latitude,
+                longitude=longitude,
+                photo_title=photo_title,
+                print_aspect_ratio=print_aspect_ratio,
+                local_save=False, # Not saving it locally within the function, will only save in the static/uploads folder
+                plan=plan,
+            )
+
+            # Save the processed image to return
+            with stage("save"):
+                encode_image(processed_image, processed_image_path, encoder_profile, context.exif_bytes, context.icc_profile)
+
+                # Write the smaller renditions for the results page from the image still in memory
+                write_renditions(processed_image, processed_image_path, context.icc_profile)
+            result_cache.store(cache_key, processed_image_path)
+
+            return processed_image_path
+        except Exception as e:
+            current_trace.failed = True
+            logger.exception("Error during image processing: %s", e)
+
+'''
+White border method (batch workers call this directly)
+
+Adds the simple white border to an upload that is already on disk and saves the result
+
+Parameters:
+- filepath: Path of the saved upload (str)
+- aspect_ratio: The target aspect ratio as a (width, height) tuple
+- border_size: The border size as a percentage of the shorter side (int)
+- upload_folder: The directory path where processed images are stored (str)
+- encoder_profile: The encoder profile to save with, the default profile if None (str)
+- upload_digest: SHA-256 of the upload if it was already computed during ingestion (str)
+- quality: "full" (default) or "draft", which renders from a reduced-resolution decode with a long edge of about DRAFT_MAX_SIZE (str)
+
+Returns:
+- processed_image_path: The file path of the bordered image (str)
+'''
+def process_border_image(filepath, aspect_ratio, border_size, upload_folder, encoder_profile=None, upload_digest=None, quality="full"):
+    filename = os.path.basename(filepath)
+    encoder_profile, _ = get_encoder_profile(encoder_profile)
+
+    processed_image_filename = output_filename(f"border_{filename}", encoder_profile)
+    processed_image_path = os.path.join(upload_folder, processed_image_filename)
+
+    # Reuse the stored output if this upload was already bordered with the same settings
+    result_cache = get_result_cache()
+    cache_key = result_cache.key(upload_digest or file_digest(filepath), "border", {
+        "aspect_ratio": list(aspect_ratio),
+        "border_size": int(border_size),
+        "encoder_profile": encoder_profile,
+        "quality": quality,
+    })
+    if result_cache.fetch(cache_key, processed_image_path):
+        return processed_image_path
+
+    with trace("border", filename):
+        with Image.open(filepath) as img:
+            with stage("open"):
+                # The border is a percentage of the shorter side, so a draft keeps the layout of the full render
+                if quality == "draft":
+                    request_draft(img, DRAFT_MAX_SIZE)
+                exif_bytes = img.info.get("exif")
+                icc_profile = img.info.get("icc_profile")
+                # Very large images are bordered in strips, read band by band from the file when they are encoded
+                strip_render = use_strip_render(*img.size)
+                if not strip_render:
+                    ImageOps.exif_transpose(img, in_place=True)
+            with stage("border"):
+                if strip_render:
+                    processed_image = create_strip_border(filepath, aspect_ratio, border_size)
+                else:
+                    processed_image = create_simple_border(img, aspect_ratio, border_size)
+
+        with stage("save"):
+            encode_image(processed_image, processed_image_path, encoder_profile, exif_bytes, icc_profile)
+            write_renditions(processed_image, processed_image_path, icc_profile)
+    result_cache.store(cache_key, processed_image_path)
+
+    logger.debug("Processed image saved at: %s", processed_image_path)
+    return processed_image_path
@@ -0,0 +1,210 @@
+import logging, os, queue, sqlite3, threading, time, uuid
+from services.batch_executor import iter_batch
+
+'''
+Background job queue
+
+Lets the browser submit a large batch, get a job ID back immediately and poll for per-image
+progress instead of holding one request (and a WSGI worker) open until every image is done.
+Jobs are processed one batch at a time by a single dispatcher thread in the web worker that
+accepted them, which fans the images of the batch out over the shared batch executor. The state
+of every job (status and per-image progress) lives in a SQLite file, like the batch store, so any
+web worker can answer the polling requests. No external broker is needed.
+'''
+
+logger = logging.getLogger(__name__)
+
+# How long finished jobs are kept around for polling before they are dropped
+JOB_TTL_SECONDS = 60 * 60
+
+# Where the job state lives (override with the JOB_STORE_PATH environment variable)
+DEFAULT_JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", os.path.join("cache", "jobs.sqlite3"))
+
+class Job:
+    """
+    A submitted batch, as handed to the dispatcher thread (its progress is kept in the job store).
+
+    Attributes:
+        id (str): The job ID handed back to the client.
+        kind (str): What the job does (e.g. "overlay" or "border").
+    """
+
+    def __init__(self, kind: str, func, jobs: list[tuple], max_workers: int=None, prepare=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+
+        self._func = func
+        self._jobs = jobs
+        self._max_workers = max_workers
+        self._prepare = prepare
+
+
+class JobQueue:
+    """
+    FIFO of batch jobs served by one lazily started dispatcher thread per process, with the job
+    state in SQLite.
+
+    Parameters:
+        path (str): The SQLite file.
+        ttl_seconds (int): How long a finished job can still be polled.
+        clock (callable): Returns the current time in seconds (injectable for tests).
+    """
+
+    def __init__(self, path: str=DEFAULT_JOB_STORE_PATH, ttl_seconds: int=JOB_TTL_SECONDS, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, owner TEXT, status TEXT NOT NULL, created_at REAL NOT NULL, finished_at REAL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS job_items ("
+                "job_id TEXT NOT NULL, position INTEGER NOT NULL, filename TEXT, status TEXT NOT NULL, output TEXT, "
+                "PRIMARY KEY (job_id, position))"
+            )
+
+    def _connect(self):
+        # A short-lived connection per call keeps the store safe across threads and worker processes
+        return sqlite3.connect(self.path, timeout=10)
+
+    def submit(self, kind: str, func, jobs: list[tuple], filenames: list[str], max_workers: int=None, prepare=None, owner: str=None) -> Job:
+        """
+        Queues a batch for background processing.
+
+        Parameters:
+            kind (str): What the job does (e.g. "overlay" or "border").
+            func (callable): The module-level function processing one image (see `iter_batch`).
+            jobs (list[tuple]): The positional arguments for each image.
+            filenames (list[str]): The original filename of each image (for progress reporting).
+            max_workers (int, optional): Number of worker processes for the batch.
+            prepare (callable, optional): Turns `jobs` into the arguments actually run (e.g. the batch planner),
+                called on the dispatcher thread so the submitting request isn't held up by it.
+            owner (str, optional): Who submitted the job (e.g. the session), see `snapshot`.
+
+        Returns:
+            Job: The queued job.
+        """
+        job = Job(kind, func, jobs, max_workers, prepare)
+        now = self.clock()
+        with self._connect() as connection:
+            # Drop expired jobs while we are here
+            connection.execute("DELETE FROM job_items WHERE job_id IN (SELECT job_id FROM jobs WHERE finished_at <= ?)", (now - self.ttl_seconds,))
+            connection.execute("DELETE FROM jobs WHERE finished_at <= ?", (now - self.ttl_seconds,))
+            connection.execute(
+                "INSERT INTO jobs (job_id, kind, owner, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job.id, kind, owner, now),
+            )
+            connection.executemany(
+                "INSERT INTO job_items (job_id, position, filename, status) VALUES (?, ?, ?, 'pending')",
+                [(job.id, position, filename) for position, filename in enumerate(filenames)],
+            )
+
+        with self._lock:
+            self._ensure_dispatcher()
+        self._queue.put(job)
+        return job
+
+    def snapshot(self, job_id: str, owner: str=None) -> dict:
+        """
+        Returns a consistent status snapshot of a job for the status endpoint.
+
+        Parameters:
+            job_id (str): The job ID.
+            owner (str, optional): If given, only a job submitted by this owner is returned.
+
+        Returns:
+            dict: The job's `job_id`, `kind`, `status`, `total`, `completed`, `failed` and `items` (one entry
+                per image with its `filename`, `status` and `output`), or None if it is unknown, has expired
+                or belongs to someone else.
+        """
+        if not job_id:
+            return None
+        with self._connect() as connection:
+            row = connection.execute("SELECT kind, owner, status, finished_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            items = connection.execute("SELECT filename, status, output FROM job_items WHERE job_id = ? ORDER BY position", (job_id,)).fetchall()
+        if row is None or (row[3] is not None and row[3] <= self.clock() - self.ttl_seconds):
+            return None
+        kind, job_owner, status, _ = row
+        if owner is not None and job_owner != owner:
+            return None
+
+        items = [{"filename": filename, "status": item_status, "output": output} for filename, item_status, output in items]
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "total": len(items),
+            "completed": sum(1 for item in items if item["status"] == "done"),
+            "failed": sum(1 for item in items if item["status"] == "failed"),
+            "items": items,
+        }
+
+    def _ensure_dispatcher(self):
+        # Started on first submit (and again after a fork), so no thread is created at import time
+        if self._thread is None or not self._thread.is_alive() or self._thread_pid != os.getpid():
+            self._thread = threading.Thread(target=self._dispatch, name="job-queue-dispatcher", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _set_status(self, job_id: str, status: str, finished_at: float=None):
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE job_id = ?", (status, finished_at, job_id))
+
+    def _dispatch(self):
+        while True:
+            job = self._queue.get()
+            self._set_status(job.id, "running")
+
+            try:
+                jobs = job._prepare(job._jobs) if job._prepare is not None else job._jobs
+                for index, result in iter_batch(job._func, jobs, job._max_workers):
+                    with self._connect() as connection:
+                        connection.execute(
+                            "UPDATE job_items SET status = ?, output = ? WHERE job_id = ? AND position = ?",
+                            ("done" if result else "failed", os.path.basename(result) if result else None, job.id, index),
+                        )
+            except Exception as e:
+                logger.error("Error running job %s: %s", job.id, e)
+                with self._connect() as connection:
+                    connection.execute("UPDATE job_items SET status = 'failed' WHERE job_id = ? AND status = 'pending'", (job.id,))
+
+            with self._connect() as connection:
+                completed = connection.execute("SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status = 'done'", (job.id,)).fetchone()[0]
+            self._set_status(job.id, "done" if completed else "failed", self.clock())
+            # The arguments can be large (forms, paths), drop them once the job is finished
+            job._jobs = None
+            self._queue.task_done()
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+'''
+Returns the shared JobQueue used by the web app (created on first use so importing the module has no side effects)
+'''
+def get_job_queue():
+    global _default_queue
+
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue()
+        return _default_queue
+
+'''
+Replaces the shared JobQueue (e.g. with one in a temporary directory for tests)
+'''
+def set_job_queue(job_queue):
+    global _default_queue
+
+    with _default_queue_lock:
+        _default_queue = job_queue
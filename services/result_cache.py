@@ -0,0 +1,245 @@
+import hashlib, json, logging, os, shutil, sqlite3, threading, time, uuid
+from processing_scripts.renditions import RENDITIONS, rendition_filename
+
+'''
+Content-addressed result cache
+
+Processed outputs (and their renditions) are stored on disk under a key made from the SHA-256 of
+the uploaded bytes plus the normalized processing parameters. Submitting the same photo with the
+same settings again (or a retried upload) copies the stored files instead of decoding, extracting
+a palette and encoding all over again. The store is bounded in bytes with least-recently-used
+eviction, and its index and hit/miss counters live in SQLite so every worker process shares them.
+'''
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pipeline output changes so stale results are not served
+RESULT_CACHE_VERSION = 1
+
+# Where cached results live (override with the RESULT_CACHE_DIR environment variable)
+DEFAULT_RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join("cache", "results"))
+
+# Upper bound on the size of the store (RESULT_CACHE_MAX_BYTES, 0 disables the cache)
+DEFAULT_RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# How much of an upload is hashed at a time
+HASH_CHUNK_SIZE = 1024 * 1024
+
+'''
+Hashes a file on disk
+
+Parameters:
+- path: The file to hash (str)
+
+Returns:
+- The hex SHA-256 digest of the file contents (str)
+'''
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Size-bounded, LRU-evicted on-disk store of processed outputs.
+
+    Parameters:
+        directory (str): Where the entries and the SQLite index are kept.
+        max_bytes (int): The store is trimmed to this many bytes after every insert (0 disables caching).
+    """
+
+    def __init__(self, directory: str=DEFAULT_RESULT_CACHE_DIR, max_bytes: int=DEFAULT_RESULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, extension TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _connect(self):
+        # A short-lived connection per call keeps the index safe across threads and worker processes
+        return sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=10)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _count(self, connection, name: str, amount: int=1):
+        connection.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    @staticmethod
+    def key(digest: str, kind: str, params: dict) -> str:
+        """
+        Builds the cache key for an upload and its processing parameters.
+
+        Parameters:
+            digest (str): The SHA-256 of the uploaded bytes.
+            kind (str): The operation (e.g. "overlay" or "border").
+            params (dict): The normalized parameters (JSON-serializable).
+
+        Returns:
+            str: The hex cache key.
+        """
+        payload = json.dumps([RESULT_CACHE_VERSION, digest, kind, params], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def fetch(self, key: str, output_path: str) -> bool:
+        """
+        Copies a cached result (and its renditions) to output_path if the key is in the store.
+
+        Parameters:
+            key (str): The cache key.
+            output_path (str): Where the output should be written (its extension must match the cached one).
+
+        Returns:
+            bool: True on a hit, False on a miss (or when the cache is disabled).
+        """
+        if not self.enabled:
+            return False
+
+        extension = os.path.splitext(output_path)[1]
+        entry_dir = self._entry_dir(key)
+        with self._connect() as connection:
+            row = connection.execute("SELECT extension FROM entries WHERE key = ?", (key,)).fetchone()
+            hit = row is not None and row[0] == extension and os.path.isfile(os.path.join(entry_dir, "output" + extension))
+            if hit:
+                connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._count(connection, "hits" if hit else "misses")
+
+        if not hit:
+            return False
+
+        try:
+            _copy(os.path.join(entry_dir, "output" + extension), output_path)
+            for rendition in RENDITIONS:
+                cached = rendition_filename(os.path.join(entry_dir, "output"), rendition)
+                if os.path.isfile(cached):
+                    _copy(cached, rendition_filename(output_path, rendition))
+        except OSError as e:
+            # Evicted by another worker between the lookup and the copy, treat it as a miss
+            logger.warning("Result cache entry %s vanished: %s", key, e)
+            return False
+
+        logger.debug("Result cache hit for %s", os.path.basename(output_path))
+        return True
+
+    def store(self, key: str, output_path: str):
+        """
+        Adds a freshly processed output (and the renditions written next to it) to the store, then
+        evicts the least recently used entries until the store fits in max_bytes.
+
+        Parameters:
+            key (str): The cache key.
+            output_path (str): The processed output on disk.
+        """
+        if not self.enabled:
+            return
+
+        extension = os.path.splitext(output_path)[1]
+        files = [(output_path, "output" + extension)]
+        for rendition in RENDITIONS:
+            path = rendition_filename(output_path, rendition)
+            if os.path.isfile(path):
+                files.append((path, os.path.basename(rendition_filename("output" + extension, rendition))))
+
+        # Build the entry in a temporary directory and move it into place so readers never see half of it
+        entry_dir = self._entry_dir(key)
+        staging_dir = os.path.join(self.directory, f"tmp-{uuid.uuid4().hex}")
+        os.makedirs(staging_dir)
+        size = 0
+        for source, name in files:
+            _copy(source, os.path.join(staging_dir, name))
+            size += os.path.getsize(source)
+
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        try:
+            os.replace(staging_dir, entry_dir)
+        except OSError:
+            # Another worker stored the same result first
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return
+
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, extension, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, extension, size, time.time()),
+            )
+            self._count(connection, "stores")
+            self._evict(connection)
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in connection.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            self._count(connection, "evictions")
+            total -= size
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss/store/eviction counts (across every process using this store), the
+        hit rate and the current size of the store.
+        """
+        with self._connect() as connection:
+            counters = dict(connection.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+        stats = {name: counters.get(name, 0) for name in ("hits", "misses", "stores", "evictions")}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = entries
+        stats["bytes"] = size
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+# Helper function to copy a file through a temporary name, so a reader never sees a partial file
+def _copy(source: str, destination: str):
+    temporary = f"{destination}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, destination)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+'''
+Returns the shared ResultCache (created on first use so importing the module has no side effects)
+'''
+def get_result_cache():
+    global _default_cache
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
+
+'''
+Replaces the shared ResultCache (e.g. with one in a temporary directory for tests)
+'''
+def set_result_cache(cache):
+    global _default_cache
+
+    with _default_cache_lock:
+        _default_cache = cache
@@ -0,0 +1,175 @@
+import hashlib, os, uuid
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+'''
+Streaming upload ingestion
+
+Werkzeug hands every uploaded file of a multipart body to `Request._get_file_stream` and writes it
+there chunk by chunk as the body is parsed. IngestRequest returns an IngestedUpload for each file,
+which writes straight into the upload folder while hashing the bytes, rejects a file as soon as its
+magic bytes show it isn't a supported image or it grows past the per-file limit, and is later moved
+into place by `save_upload` (no second copy). The per-request limit is Flask's MAX_CONTENT_LENGTH.
+'''
+
+# Largest single upload accepted (override with the MAX_UPLOAD_FILE_BYTES environment variable)
+DEFAULT_MAX_UPLOAD_FILE_BYTES = int(os.environ.get("MAX_UPLOAD_FILE_BYTES", 200 * 1024 * 1024))
+
+# Largest request body accepted (override with the MAX_CONTENT_LENGTH environment variable)
+DEFAULT_MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", 1024 * 1024 * 1024))
+
+# Sizes of the DIB header that follows a BMP file header (core, info, v2 to v5), as found at offset 14
+BMP_DIB_HEADER_SIZES = (12, 40, 52, 56, 108, 124)
+
+# Leading bytes of the image formats the pipeline can open (offset, signature)
+IMAGE_SIGNATURES = {
+    "JPEG": [(0, b"\xff\xd8\xff")],
+    "PNG": [(0, b"\x89PNG\r\n\x1a\n")],
+    "WEBP": [(0, b"RIFF"), (8, b"WEBP")],
+    "TIFF": [(0, b"II*\x00")],
+    "TIFF_BE": [(0, b"MM\x00*")],
+    "GIF87": [(0, b"GIF87a")],
+    "GIF89": [(0, b"GIF89a")],
+    # "BM" alone starts plenty of files that aren't bitmaps, so the DIB header size has to match as well
+    **{f"BMP_{size}": [(0, b"BM"), (14, size.to_bytes(4, "little"))] for size in BMP_DIB_HEADER_SIZES},
+    "AVIF": [(4, b"ftypavif")],
+    "AVIS": [(4, b"ftypavis")],
+}
+
+# Enough leading bytes to check every signature
+SIGNATURE_BYTES = 18
+
+# Helper function to check the leading bytes of an upload against the known image signatures
+def is_image_header(header: bytes) -> bool:
+    """
+    Returns True if the leading bytes of a file match one of IMAGE_SIGNATURES.
+    """
+    return any(all(header[offset:offset + len(signature)] == signature for offset, signature in parts) for parts in IMAGE_SIGNATURES.values())
+
+class IngestedUpload:
+    """
+    Write-once file object for one uploaded file, spooled straight into the upload folder.
+
+    Attributes:
+        sha256 (str): Hex digest of the uploaded bytes (set once the upload is complete).
+        size (int): Number of bytes received.
+    """
+
+    def __init__(self, directory: str, filename: str, max_bytes: int):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.sha256 = None
+        self.path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.part")
+
+        self._hash = hashlib.sha256()
+        self._header = b""
+        self._checked = False
+        self._committed = False
+        self._file = open(self.path, "w+b")
+
+    def _reject(self, error):
+        self.close()
+        raise error
+
+    def _check_header(self):
+        self._checked = True
+        if not is_image_header(self._header):
+            self._reject(UnsupportedMediaType(f"{self.filename} is not a supported image"))
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self._reject(RequestEntityTooLarge(f"{self.filename} is larger than {self.max_bytes} bytes"))
+
+        # Check the magic bytes as soon as enough of the file has arrived
+        if not self._checked:
+            self._header += data[:SIGNATURE_BYTES - len(self._header)]
+            if len(self._header) >= SIGNATURE_BYTES:
+                self._check_header()
+
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def seek(self, offset: int, whence: int=0) -> int:
+        # Werkzeug rewinds the stream once the part is complete, short files are checked here
+        if not self._checked:
+            self._check_header()
+        if self.sha256 is None:
+            self.sha256 = self._hash.hexdigest()
+        return self._file.seek(offset, whence)
+
+    def read(self, size: int=-1) -> bytes:
+        return self._file.read(size)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def commit(self, destination: str):
+        """
+        Moves the received file to its final path (a rename within the upload folder, not a copy).
+        """
+        self._file.close()
+        os.replace(self.path, destination)
+        self._committed = True
+
+    def close(self):
+        # Uploads that were never saved (rejected or skipped) are removed with the request
+        self._file.close()
+        if not self._committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class IngestRequest(Request):
+    """
+    Flask request class that streams uploaded files through IngestedUpload.
+
+    Attributes:
+        ingested_uploads (list[IngestedUpload]): Every upload created while parsing the body.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ingested_uploads = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Parts without a filename (empty file inputs) keep Werkzeug's default in-memory handling
+        if not filename:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        max_bytes = current_app.config.get('MAX_UPLOAD_FILE_BYTES', DEFAULT_MAX_UPLOAD_FILE_BYTES)
+        upload = IngestedUpload(upload_folder, filename, max_bytes)
+        self.ingested_uploads.append(upload)
+        return upload
+
+    def _load_form_data(self):
+        # A rejected part aborts the whole parse, the files received before it never reach request.files
+        # (which the request closes when it ends), so they are removed here
+        try:
+            super()._load_form_data()
+        except BaseException:
+            for upload in self.ingested_uploads:
+                upload.close()
+            raise
+
+# Helper function to get the hash computed while an upload was streamed in
+def ingested_digest(file) -> str:
+    """
+    Returns the SHA-256 computed during ingestion for an uploaded FileStorage (None if it wasn't ingested).
+    """
+    stream = getattr(file, "stream", None)
+    return stream.sha256 if isinstance(stream, IngestedUpload) else None
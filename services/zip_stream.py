@@ -0,0 +1,81 @@
+import logging, os, zipfile
+
+'''
+Streaming ZIP writer
+
+Builds a ZIP archive on the fly and yields it in chunks, so a download can start with the first
+file and memory stays constant however large the batch is. The archive is written to an
+unseekable sink (zipfile then uses data descriptors instead of seeking back to patch headers),
+entries large enough to need it get ZIP64 headers, and already-compressed images are stored
+rather than deflated.
+'''
+
+logger = logging.getLogger(__name__)
+
+# Formats that don't get any smaller when deflated (they are stored as is)
+STORED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".gif"}
+
+# How much of a file is read (and yielded) at a time
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+class _ChunkSink:
+    """
+    Write-only, unseekable file object that collects what zipfile writes until it is drained.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+'''
+Streams a ZIP archive of files on disk
+
+Parameters:
+- files: (path, arcname) pairs to add, in order (missing files are skipped)
+- chunk_size: Number of bytes read from each file at a time (int)
+
+Returns:
+- A generator of bytes chunks that together form the archive
+'''
+def stream_zip(files, chunk_size=ZIP_CHUNK_SIZE):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", allowZip64=True) as archive:
+        for path, arcname in files:
+            if not os.path.isfile(path):
+                logger.warning("Skipping missing file in zip: %s", path)
+                continue
+
+            # from_file fills in the size, which lets zipfile decide up front whether the entry needs ZIP64
+            info = zipfile.ZipInfo.from_file(path, arcname=arcname)
+            stored = os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+
+            with open(path, "rb") as source, archive.open(info, mode="w") as entry:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+            data = sink.drain()
+            if data:
+                yield data
+
+    # Central directory (written when the archive is closed)
+    data = sink.drain()
+    if data:
+        yield data
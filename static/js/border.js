@@ -550,6 +550,14 @@ if (borderForm) {
         }
         formData.append('aspectRatio', aspectValue);
 
+        // Add the selected output encoder profile
+        const encoderProfile = document.getElementById('encoderProfile');
+        if (encoderProfile) formData.append('encoderProfile', encoderProfile.value);
+
+        // Add the render quality (full resolution or a reduced-resolution draft)
+        const renderQuality = document.getElementById('renderQuality');
+        if (renderQuality) formData.append('quality', renderQuality.value);
+
         // Log the form data being sent
         for (let pair of formData.entries()) {
             console.log(pair[0]+ ': ' + pair[1]);
@@ -560,45 +568,15 @@ if (borderForm) {
             const loadingScreen = document.getElementById('loadingScreen');
             if (loadingScreen) loadingScreen.style.display = 'flex';
             
-            const response = await fetch('/white-border', {
-                method: 'POST',
-                body: formData
-            });
-
-            // Check if response is JSON or HTML redirect
-            const contentType = response.headers.get('content-type');
-            
-            if (contentType && contentType.includes('application/json')) {
-                // Handle JSON response (success or error)
-                const data = await response.json();
-                
-                if (!response.ok) {
-                    throw new Error(data.error || 'Failed to process border');
-                }
+            // Submit the batch as a background job and poll for progress instead of waiting on one long request
+            const job = await runBatchJob('/jobs/white-border', formData, showJobProgress);
 
-                if (data.processed_image_url) {
-                    // Hide canvas and show the processed image
-                    previewCanvas.classList.add('d-none');
-                    previewImage.src = data.processed_image_url;
-                    previewImage.classList.remove('d-none');
-                }
-            } else {
-                // Handle HTML response (redirect)
-                // The server is redirecting us, so we should follow the redirect
-                const redirectUrl = response.url;
-                if (redirectUrl) {
-                    window.location.href = redirectUrl;
-                } else {
-                    // If no redirect URL, try to parse the response as text
-                    const text = await response.text();
-                    if (text.includes('results_page')) {
-                        // If the HTML contains results page, redirect to results
-                        window.location.href = '/results';
-                    } else {
-                        throw new Error('Unexpected response from server');
-                    }
-                }
+            if (job.status !== 'done') {
+                throw new Error('None of the images could be processed');
             }
+
+            // Let Flask serve the results page for the finished batch
+            window.location.href = job.view_url;
         } catch (err) {
             console.error("Form submission error:", err);
             alert("Something went wrong while processing the border.");
@@ -0,0 +1,44 @@
+// =======================================================
+// ==============  BACKGROUND BATCH JOBS  ================
+// =======================================================
+
+// Submit a batch as a background job, then poll its status until every image is done.
+// Resolves with the final job status (plus the job links returned on submit).
+async function runBatchJob(submitUrl, formData, onProgress, pollInterval = 1000) {
+    const response = await fetch(submitUrl, {
+        method: "POST",
+        body: formData,
+    });
+
+    const job = await response.json();
+    if (!response.ok) {
+        throw new Error(job.error || "Failed to submit the batch");
+    }
+
+    while (true) {
+        const statusResponse = await fetch(job.status_url, { cache: "no-store" });
+        if (!statusResponse.ok) {
+            throw new Error("Lost track of the batch job");
+        }
+
+        const status = await statusResponse.json();
+        if (onProgress) onProgress(status);
+
+        if (status.status === "done" || status.status === "failed") {
+            return { ...job, ...status };
+        }
+
+        await new Promise((resolve) => setTimeout(resolve, pollInterval));
+    }
+}
+
+// Show "Processed X of Y" under the loading spinner
+function showJobProgress(status) {
+    const progressEl = document.getElementById("loadingProgress");
+    if (!progressEl) return;
+
+    const finished = status.completed + status.failed;
+    let text = `Processed ${finished} of ${status.total} image${status.total === 1 ? "" : "s"}`;
+    if (status.failed) text += ` (${status.failed} failed)`;
+    progressEl.textContent = text;
+}
@@ -3,11 +3,14 @@ document.addEventListener('DOMContentLoaded', () => {
   if (!container) return;
 
   let images = [];
+  let previews = [];
   let filenames = [];
   try { images = JSON.parse(container.dataset.images || '[]'); } catch { images = []; }
+  try { previews = JSON.parse(container.dataset.previews || '[]'); } catch { previews = []; }
   try { filenames = JSON.parse(container.dataset.filenames || '[]'); } catch { filenames = []; }
 
   if (!Array.isArray(images)) images = [images];
+  if (!Array.isArray(previews)) previews = [previews];
   if (!Array.isArray(filenames)) filenames = [filenames];
 
   const imgEl = document.getElementById('transformedImage');
@@ -22,34 +25,12 @@ document.addEventListener('DOMContentLoaded', () => {
   let current = 0;
   const total = images.length || 1;
 
-  // ---- Blob URL cache: originalSrc -> blobUrl ----
-  const blobUrlCache = new Map();
-  const inflight = new Map(); // originalSrc -> Promise<blobUrl>
-
-  async function getBlobUrl(src) {
-    if (!src) return "";
-    if (blobUrlCache.has(src)) return blobUrlCache.get(src);
-    if (inflight.has(src)) return inflight.get(src);
-
-    const p = (async () => {
-      const res = await fetch(src, { cache: "force-cache" });
-      if (!res.ok) throw new Error(`Failed to fetch: ${src}`);
-      const blob = await res.blob();
-      const blobUrl = URL.createObjectURL(blob);
-      blobUrlCache.set(src, blobUrl);
-      return blobUrl;
-    })()
-      .finally(() => inflight.delete(src));
-
-    inflight.set(src, p);
-    return p;
-  }
-
-  async function decodeIntoImg(srcOrBlobUrl) {
-    if (!srcOrBlobUrl) return;
+  // The page only loads the small renditions (the browser cache keeps them), the full file is fetched on download
+  async function decodeIntoImg(src) {
+    if (!src) return;
     // Decode in background when supported (reduces jank)
     const tmp = new Image();
-    tmp.src = srcOrBlobUrl;
+    tmp.src = src;
     try {
       if (typeof tmp.decode === "function") await tmp.decode();
     } catch (_) {}
@@ -103,33 +84,20 @@ document.addEventListener('DOMContentLoaded', () => {
     const src = images[current] || images[0] || '';
     if (!src) return;
 
-    // Get cached blob URL (fetches once)
-    let blobUrl = "";
-    try {
-      blobUrl = await getBlobUrl(src);
-    } catch (e) {
-      console.error(e);
-      // fallback: show normal src if blob fetch fails
-      blobUrl = src;
-    }
-    if (token !== navToken) return;
-
-    // decode off-thread before swapping (best effort)
-    await decodeIntoImg(blobUrl);
-    if (token !== navToken) return;
-
     imgEl.loading = "eager";
     imgEl.decoding = "async";
-    imgEl.src = blobUrl;
+
+    // Paint the tiny preview right away, then swap in the medium rendition once it is decoded
+    const preview = previews[current];
+    if (preview && preview !== src) imgEl.src = preview;
+
+    await decodeIntoImg(src);
+    if (token !== navToken) return;
+    imgEl.src = src;
 
     // Preload neighbors in background
-    neighborIndexes(current).forEach(async (i) => {
-      const nSrc = images[i];
-      if (!nSrc) return;
-      try {
-        const nBlob = await getBlobUrl(nSrc);
-        decodeIntoImg(nBlob);
-      } catch (_) {}
+    neighborIndexes(current).forEach((i) => {
+      decodeIntoImg(images[i]);
     });
   }
 
@@ -149,11 +117,4 @@ document.addEventListener('DOMContentLoaded', () => {
 
   // Initial paint
   updateUI();
-
-  // Cleanup blob URLs when leaving page (avoid memory leaks)
-  window.addEventListener("beforeunload", () => {
-    for (const blobUrl of blobUrlCache.values()) {
-      try { URL.revokeObjectURL(blobUrl); } catch (_) {}
-    }
-  });
-});
\ No newline at end of file
+});
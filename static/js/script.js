@@ -613,18 +613,14 @@ async function submitMultiImageForm(formElem) {
     }
 
     try {
-        // Adjust the URL and response handling to match your multi-image API
-        const response = await fetch("/process-images", {
-            method: "POST",
-            body: formData,
-        });
+        // Submit the batch as a background job and poll for progress instead of waiting on one long request
+        const job = await runBatchJob("/jobs/process-images", formData, showJobProgress);
 
-        if (response.ok) {
-            // Let Flask serve the results page directly
-            window.location.href = "/results";
+        if (job.status === "done") {
+            // Let Flask serve the results page for the finished batch
+            window.location.href = job.view_url;
         } else {
-            const error = await response.json();
-            alert(`Error: ${error.error || "Unknown error"}`);
+            alert("Error: None of the images could be processed");
             if (loadingScreen) loadingScreen.style.display = "none";
         }
     } catch (error) {
@@ -0,0 +1,38 @@
+import unittest
+from services.batch_executor import *
+
+# Module-level so the worker processes can unpickle it
+def square_or_fail(value):
+    if value < 0:
+        raise ValueError("negative input")
+    return value * value
+
+class TestBatchExecutor(unittest.TestCase):
+
+    def tearDown(self):
+        shutdown_batch_executor()
+
+    def test_results_keep_input_order_across_workers(self):
+        jobs = [(value,) for value in range(20)]
+        self.assertEqual(run_batch(square_or_fail, jobs, max_workers=3), [value * value for value in range(20)])
+
+    def test_failed_jobs_are_isolated(self):
+        jobs = [(2,), (-1,), (3,)]
+        self.assertEqual(run_batch(square_or_fail, jobs, max_workers=2), [4, None, 9])
+        self.assertEqual(run_batch(square_or_fail, jobs, max_workers=1), [4, None, 9])
+
+    def test_busy_pool_is_not_resized(self):
+        running = iter_batch(square_or_fail, [(value,) for value in range(6)], max_workers=3)
+        first = next(running)
+        pool = get_batch_executor(3)
+
+        # A batch asking for another worker count meanwhile runs on the same pool instead of shutting it down
+        self.assertEqual(run_batch(square_or_fail, [(2,), (3,)], max_workers=2), [4, 9])
+        self.assertIs(get_batch_executor(2), pool)
+        self.assertEqual(sorted([first] + list(running)), [(value, value * value) for value in range(6)])
+
+        # Once nothing runs on it, the pool is resized
+        self.assertIsNot(get_batch_executor(2), pool)
+
+    def test_workers_are_not_forked_from_the_threaded_parent(self):
+        self.assertEqual(get_batch_executor(2)._mp_context.get_start_method(), "forkserver")
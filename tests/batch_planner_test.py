@@ -0,0 +1,49 @@
+import os, tempfile, unittest
+from PIL import ExifTags, Image
+from processing_scripts import helpers
+from processing_scripts.helpers import overlay_layout
+from processing_scripts.geocode_cache import GeocodeCache, MemoryGeocodeStore, set_geocode_cache
+from services.batch_planner import *
+
+class TestBatchPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.lookup_timezone = helpers.lookup_timezone
+        self.geocoded = []
+        self.timezones = []
+        helpers.lookup_timezone = lambda latitude, longitude: self.timezones.append((latitude, longitude)) or "Europe/Zurich"
+        set_geocode_cache(GeocodeCache(geocoder=lambda address: self.geocoded.append(address) or (46.0207, 7.7491), store=MemoryGeocodeStore()))
+
+    def tearDown(self):
+        helpers.lookup_timezone = self.lookup_timezone
+        set_geocode_cache(None)
+        self.directory.cleanup()
+
+    def upload(self, name, size, model="X-T5"):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Make] = "FUJIFILM"
+        exif[ExifTags.Base.Model] = model
+        path = os.path.join(self.directory.name, name)
+        Image.new("RGB", size, (90, 120, 160)).save(path, exif=exif.tobytes())
+        return path
+
+    def test_similar_images_share_one_plan(self):
+        form = {"address": "Zermatt", "aspectRatio": "Default", "photoName": "Matterhorn"}
+        paths = [self.upload("a.jpg", (300, 200)), self.upload("b.jpg", (300, 200)), self.upload("c.jpg", (300, 200), model="X100V"), self.upload("d.jpg", (200, 300))]
+        planned = plan_overlay_jobs([(path, form, self.directory.name, None) for path in paths])
+
+        plans = [job[4] for job in planned]
+        self.assertIs(plans[0], plans[1])
+        self.assertIs(plans[0], plans[2])  # another camera, nothing in the plan depends on it
+        self.assertEqual(plans[3]["layout"], overlay_layout(200, 300, True, (2, 3)))
+        self.assertEqual((plans[0]["latitude"], plans[0]["timezone"], plans[0]["location"]), (46.0207, "Europe/Zurich", "46.0207° N, 7.7491° E"))
+
+        # The address is geocoded once for the batch and the timezone once per group
+        self.assertEqual(len(self.geocoded), 1)
+        self.assertEqual(len(self.timezones), 2)
+
+    def test_images_without_location_are_not_planned(self):
+        path = self.upload("a.jpg", (300, 200))
+        planned = plan_overlay_jobs([(path, {"aspectRatio": "Default"}, self.directory.name, "digest")])
+        self.assertEqual(planned, [(path, {"aspectRatio": "Default"}, self.directory.name, "digest", None)])
@@ -0,0 +1,21 @@
+import os, tempfile, unittest
+from services.batch_store import *
+
+class TestBatchStore(unittest.TestCase):
+
+    def test_batches_round_trip_and_expire(self):
+        with tempfile.TemporaryDirectory() as directory:
+            now = [1000.0]
+            path = os.path.join(directory, "batches.sqlite3")
+            store = BatchStore(path, ttl_seconds=60, clock=lambda: now[0])
+
+            filenames = [f"processed_{index:03d}_photo.jpg" for index in range(200)]
+            batch_id = store.save(filenames)
+            self.assertEqual(len(batch_id), 32)
+
+            # Another process (a second store on the same file) sees the same batch
+            self.assertEqual(BatchStore(path, clock=lambda: now[0]).get(batch_id), filenames)
+
+            now[0] += 61
+            self.assertIsNone(store.get(batch_id))
+            self.assertIsNone(store.get(None))
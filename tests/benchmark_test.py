@@ -0,0 +1,59 @@
+import os, tempfile, unittest
+from processing_scripts import helpers
+from processing_scripts.geocode_cache import set_geocode_cache
+from processing_scripts.image_context import load_image_context
+from processing_scripts.image_transformer import process_image
+from processing_scripts.instrumentation import set_stage_metrics
+from services.result_cache import set_result_cache
+from benchmarks.synthetic import source_dimensions, synthesize_image
+from benchmarks.pipeline import *
+from benchmarks.__main__ import compare_reports
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.lookup_timezone = helpers.lookup_timezone
+        install_offline_stubs(self.directory.name)
+
+    def tearDown(self):
+        helpers.lookup_timezone = self.lookup_timezone
+        set_geocode_cache(None)
+        set_result_cache(None)
+        set_stage_metrics(None)
+        self.directory.cleanup()
+
+    def test_synthetic_portrait_is_stored_rotated(self):
+        path = synthesize_image(os.path.join(self.directory.name, "portrait.jpg"), 0.06, "portrait")
+        context = load_image_context(path)
+        self.assertEqual(source_dimensions(0.06, "portrait"), (300, 200))
+        self.assertEqual((context.orientation, context.size), (6, (200, 300)))
+        self.assertIn(0x010F, context.exif)  # Make
+
+    def test_overlay_stages_match_process_image(self):
+        path = synthesize_image(os.path.join(self.directory.name, "landscape.jpg"), 0.24, "landscape")
+        result = run_overlay(path, self.directory.name, "web")
+
+        self.assertEqual(tuple(result["stages"]), OVERLAY_STAGES)
+        latitude, longitude = BENCHMARK_COORDINATES
+        expected = process_image(path, latitude, longitude, print_aspect_ratio=(3, 2), photo_title=BENCHMARK_TITLE)
+        self.assertEqual(tuple(result["output_size"]), expected.size)
+        self.assertGreater(result["output_bytes"], 0)
+
+    def test_border_stages_come_from_the_pipeline_trace(self):
+        path = synthesize_image(os.path.join(self.directory.name, "portrait.jpg"), 0.06, "portrait")
+        first = run_border(path, self.directory.name, "web")
+        second = run_border(path, self.directory.name, "web")
+
+        # The result cache is off, so every repeat renders again
+        self.assertEqual(tuple(first["stages"]), BORDER_STAGES)
+        self.assertEqual(tuple(second["stages"]), BORDER_STAGES)
+        self.assertEqual(first["output_size"], second["output_size"])
+
+    def test_compare_flags_slower_cases(self):
+        case = {"name": "border/12mp/square", "wall_seconds": 1.0, "stages": {"decode": 0.2, "border": 0.001}, "peak_rss_bytes": 100, "output_bytes": 50}
+        slower = dict(case, wall_seconds=1.5, stages={"decode": 0.2, "border": 0.005})
+        rows = compare_reports({"cases": [case]}, {"cases": [slower]}, threshold=10)
+
+        regressed = {metric for _, metric, _, _, _, flagged in rows if flagged}
+        self.assertEqual(regressed, {"wall_seconds"})
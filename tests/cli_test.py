@@ -0,0 +1,68 @@
+import contextlib, io, json, os, tempfile, unittest
+from PIL import Image
+from processing_scripts.cli import *
+from processing_scripts.helpers import save_image
+from processing_scripts.instrumentation import set_stage_metrics
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.metrics_path = os.environ.get("METRICS_PATH")
+
+    def tearDown(self):
+        if self.metrics_path is None:
+            os.environ.pop("METRICS_PATH", None)
+        else:
+            os.environ["METRICS_PATH"] = self.metrics_path
+        set_stage_metrics(None)
+        self.directory.cleanup()
+
+    def path(self, *parts):
+        return os.path.join(self.directory.name, *parts)
+
+    def run_cli(self, *argv):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = main(list(argv))
+        return status, output.getvalue()
+
+    def test_manifest_formats_and_lookup(self):
+        with open(self.path("photos.csv"), "w") as f:
+            f.write("filename,title,latitude,longitude,aspect_ratio\nDSCF0297.jpg,Rotenboden,45.98,7.76,2:3\n")
+        with open(self.path("photos.json"), "w") as f:
+            json.dump({"DSCF0297.jpg": {"title": "Rotenboden", "latitude": 45.98, "longitude": 7.76, "aspect_ratio": "2:3"}}, f)
+
+        expected = {"title": "Rotenboden", "latitude": 45.98, "longitude": 7.76, "aspect_ratio": "2:3"}
+        for manifest in ("photos.csv", "photos.json"):
+            entries = load_manifest(self.path(manifest))
+            self.assertEqual(manifest_entry(entries, "/pictures/switzerland/DSCF0297.jpg"), expected)
+        self.assertEqual(parse_aspect_ratio("Default", (6000, 4000)), (3, 2))
+
+    def test_second_run_skips_up_to_date_outputs(self):
+        os.mkdir(self.path("in"))
+        for name, size in (("a.jpg", (120, 80)), ("b.png", (80, 120))):
+            Image.new("RGB", size, (50, 100, 150)).save(self.path("in", name))
+        arguments = ("border", self.path("in"), "--output", self.path("out"), "--aspect-ratio", "4:5", "--jobs", "1")
+
+        status, _ = self.run_cli(*arguments)
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(os.listdir(self.path("out"))), [STATE_FILENAME, "a_border.jpg", "b_border.jpg"])
+        with Image.open(self.path("out", "a_border.jpg")) as rendered:
+            self.assertEqual(rendered.width * 5, rendered.height * 4)
+
+        status, summary = self.run_cli(*arguments)
+        self.assertEqual(status, 0)
+        self.assertIn("2 up to date, rendering 0", summary)
+
+        # A changed parameter makes the outputs stale again
+        status, summary = self.run_cli(*arguments[:-2], "--border-size", "10")
+        self.assertIn("0 up to date, rendering 2", summary)
+
+    def test_save_image_never_prompts_with_on_exists(self):
+        image = Image.new("RGB", (40, 30))
+        first = save_image(image, "/pictures/photo.jpg", self.directory.name, "web", on_exists="skip")
+
+        self.assertEqual(first, self.path("photo_IT.jpg"))
+        self.assertIsNone(save_image(image, "/pictures/photo.jpg", self.directory.name, "web", on_exists="skip"))
+        self.assertEqual(save_image(image, "/pictures/photo.jpg", self.directory.name, "web", on_exists="new"), self.path("photo_IT_1.jpg"))
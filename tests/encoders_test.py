@@ -0,0 +1,69 @@
+import io, os, tempfile, unittest
+from PIL import ExifTags, Image
+from processing_scripts.encoders import *
+
+class TestEncoders(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.image = Image.new("RGB", (64, 48), (200, 120, 40))
+
+        # Source EXIF with a rotated orientation (the processed pixels are already upright)
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION_TAG] = 6
+        exif[0x010F] = "TestCam"
+        self.exif_bytes = exif.tobytes()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_archive_matches_original_settings(self):
+        encode_image(self.image, self.path("archive.jpg"), "archive")
+        self.image.save(self.path("legacy.jpg"), quality=100, optimize=True, progressive=True)
+        with open(self.path("archive.jpg"), "rb") as archive, open(self.path("legacy.jpg"), "rb") as legacy:
+            self.assertEqual(archive.read(), legacy.read())
+
+    def test_kept_exif_has_no_location_or_serial_numbers(self):
+        exif = Image.Exif()
+        exif.load(self.exif_bytes)
+        exif[ExifTags.IFD.GPSInfo] = {ExifTags.GPS.GPSLatitudeRef: "N", ExifTags.GPS.GPSLatitude: (46.0, 1.0, 2.0)}
+        exif[ExifTags.IFD.Exif] = {ExifTags.Base.ExposureTime: 0.004, ExifTags.Base.BodySerialNumber: "123456", ExifTags.Base.MakerNote: b"vendor"}
+
+        encode_image(self.image, self.path("print.jpg"), "print", exif.tobytes())
+        with Image.open(self.path("print.jpg")) as output:
+            kept = output.getexif()
+            self.assertEqual(kept[0x010F], "TestCam")
+            self.assertNotIn(ExifTags.IFD.GPSInfo, kept)
+            self.assertEqual(kept.get_ifd(ExifTags.IFD.Exif), {ExifTags.Base.ExposureTime: 0.004})
+
+    def test_profiles_pick_format_and_metadata(self):
+        self.assertEqual(output_filename("processed_a.jpg", "archive"), "processed_a.jpg")
+        self.assertEqual(output_filename("processed_a.jpg", "preview"), "processed_a.webp")
+
+        encode_image(self.image, self.path("print.jpg"), "print", self.exif_bytes)
+        with Image.open(self.path("print.jpg")) as printed:
+            exif = printed.getexif()
+            self.assertEqual(exif[0x010F], "TestCam")
+            self.assertEqual(exif[EXIF_ORIENTATION_TAG], 1)
+
+        # The default profile writes no EXIF, like the original save_image
+        for profile in ("archive", "web"):
+            encode_image(self.image, self.path(f"{profile}.jpg"), profile, self.exif_bytes)
+            with Image.open(self.path(f"{profile}.jpg")) as output:
+                self.assertNotIn("exif", output.info)
+
+        buffer = io.BytesIO()
+        result = encode_image(self.image.convert("RGBA"), buffer, "preview")
+        self.assertEqual(result["format"], "WEBP")
+        self.assertEqual(result["bytes"], len(buffer.getvalue()))
+
+    def test_stats_and_unknown_profiles(self):
+        before = encoder_stats().get("web", {"count": 0})["count"]
+        encode_image(self.image, self.path("web.jpg"), "web")
+        self.assertEqual(encoder_stats()["web"]["count"], before + 1)
+
+        with self.assertRaises(ValueError):
+            get_encoder_profile("tiff")
@@ -0,0 +1,103 @@
+import os, tempfile, threading, time, unittest
+from processing_scripts.geocode_cache import *
+
+class StubGeocoder:
+    """
+    Local stand-in for Nominatim that counts how often it is called.
+    """
+
+    def __init__(self, known=None, delay=0):
+        self.known = known or {"112 north main st, windsor, nj": (40.24, -74.58)}
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, address):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.known.get(normalize_address(address))
+
+class TestGeocodeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "geocode.sqlite3")
+        self.now = 1000.0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_cache(self, geocoder, **kwargs):
+        return GeocodeCache(geocoder=geocoder, store=SQLiteGeocodeStore(self.path), clock=lambda: self.now, **kwargs)
+
+    def test_normalized_addresses_share_an_entry(self):
+        geocoder = StubGeocoder()
+        cache = self.make_cache(geocoder)
+        self.assertEqual(cache.lookup("112 North Main St, Windsor, NJ"), (40.24, -74.58))
+        self.assertEqual(cache.lookup("  112 north main st ,windsor,  NJ "), (40.24, -74.58))
+        self.assertEqual(geocoder.calls, 1)
+        self.assertEqual(cache.stats["hits"], 1)
+
+    def test_entries_persist_and_expire(self):
+        self.make_cache(StubGeocoder(), ttl=60).lookup("112 North Main St, Windsor, NJ")
+
+        # A fresh cache (new process) is served from the SQLite file
+        geocoder = StubGeocoder()
+        cache = self.make_cache(geocoder, ttl=60)
+        cache.lookup("112 North Main St, Windsor, NJ")
+        self.assertEqual(geocoder.calls, 0)
+
+        # Once the TTL has passed the address is looked up again
+        self.now += 61
+        cache.lookup("112 North Main St, Windsor, NJ")
+        self.assertEqual(geocoder.calls, 1)
+
+    def test_expired_memory_entry_falls_back_to_the_store(self):
+        cache = self.make_cache(StubGeocoder(), ttl=60)
+        cache.lookup("112 North Main St, Windsor, NJ")
+
+        # Another worker refreshes the address after this one's memory copy expired
+        self.now += 61
+        self.make_cache(StubGeocoder(), ttl=60).lookup("112 North Main St, Windsor, NJ")
+
+        geocoder = StubGeocoder()
+        cache.geocoder = geocoder
+        self.assertEqual(cache.lookup("112 North Main St, Windsor, NJ"), (40.24, -74.58))
+        self.assertEqual(geocoder.calls, 0)
+
+    def test_memory_is_bounded(self):
+        cache = self.make_cache(StubGeocoder(), max_entries=2)
+        for address in ("a", "b", "a", "c"):
+            cache.lookup(address)
+        # "b" was the least recently used address
+        self.assertEqual(list(cache._memory), ["a", "c"])
+
+    def test_store_is_read_outside_the_lock(self):
+        store = SQLiteGeocodeStore(self.path)
+        cache = GeocodeCache(geocoder=StubGeocoder(), store=store, clock=lambda: self.now)
+        held = []
+        get = store.get
+        store.get = lambda key: held.append(cache._lock.locked()) or get(key)
+
+        cache.lookup("112 North Main St, Windsor, NJ")
+        self.assertEqual(held, [False])
+
+    def test_not_found_is_cached(self):
+        geocoder = StubGeocoder()
+        cache = self.make_cache(geocoder, negative_ttl=30)
+        self.assertEqual(cache.lookup("Nowhere"), (None, None))
+        self.assertEqual(cache.lookup("nowhere"), (None, None))
+        self.assertEqual(geocoder.calls, 1)
+        self.assertEqual(cache.stats["negative_hits"], 1)
+
+    def test_concurrent_lookups_are_coalesced(self):
+        geocoder = StubGeocoder(delay=0.2)
+        cache = GeocodeCache(geocoder=geocoder)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.lookup("112 North Main St, Windsor, NJ"))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [(40.24, -74.58)] * 5)
+        self.assertEqual(geocoder.calls, 1)
@@ -28,3 +28,78 @@ class TestHelpers(unittest.TestCase):
         img_with_border = create_simple_border(img, aspect_ratio, border_percentage)
         img_with_border.show()
         print(f"Image with border size: {img_with_border.size}")
+
+    def test_lookup_timezone_is_memoized(self):
+        # The shared finder is only built once per process
+        self.assertIs(get_timezone_finder(), get_timezone_finder())
+
+        before = timezone_cache_stats()
+        self.assertEqual(lookup_timezone(45.9841, 7.7654), "Europe/Zurich")
+
+        # A nearby point rounds to the same key and is served from the cache
+        self.assertEqual(lookup_timezone(45.98412, 7.76539), "Europe/Zurich")
+        after = timezone_cache_stats()
+        self.assertGreaterEqual(after["hits"] - before["hits"], 1)
+
+    def test_adjust_line_font_shrinks_to_fit(self):
+        left, right = "A rather long photo title (45.9845° N, 7.7654° E)", "f/5.6 1/250s ISO200"
+
+        # Plenty of room keeps the initial size
+        self.assertEqual(adjust_line_font(left, right, "fonts/timesbd.ttf", 40, 4000), (40, 1.0))
+
+        # A narrow line shrinks to the largest size where both sides still fit with a gap
+        size, scale = adjust_line_font(left, right, "fonts/timesbd.ttf", 200, 2000)
+        self.assertLess(size, 200)
+        self.assertAlmostEqual(scale, size / 200)
+        font = load_font("fonts/timesbd.ttf", size)
+        self.assertLess(font.getbbox(left)[2] + 10, 2000 - font.getbbox(right)[2])
+        bigger = load_font("fonts/timesbd.ttf", size + 1)
+        self.assertGreaterEqual(bigger.getbbox(left)[2] + 10, 2000 - bigger.getbbox(right)[2])
+
+        # Fonts are cached per (path, size)
+        self.assertIs(load_font("fonts/timesbd.ttf", size), font)
+
+    def test_create_simple_border_matches_target_ratio(self):
+        image = Image.new("RGB", (300, 200), (10, 20, 30))
+        bordered = create_simple_border(image, (4, 5), 10)
+
+        # 10% uniform border (10px per side) then even top/bottom padding up to 4:5
+        self.assertEqual(simple_border_padding(300, 200, (4, 5), 10), (10, 100, 10, 100))
+        self.assertEqual(bordered.size, (320, 400))
+        self.assertEqual(bordered.getpixel((10, 99)), (255, 255, 255))
+        self.assertEqual(bordered.getpixel((10, 100)), (10, 20, 30))
+
+    def test_compose_canvas_pastes_at_offsets(self):
+        top = Image.new("RGB", (4, 2), (255, 0, 0))
+        bottom = Image.new("L", (4, 3), 0)
+        canvas = compose_canvas((8, 9), [(top, (2, 1)), (bottom, (2, 4))])
+        self.assertEqual(canvas.size, (8, 9))
+        self.assertEqual(canvas.getpixel((0, 0)), (255, 255, 255))
+        self.assertEqual(canvas.getpixel((2, 1)), (255, 0, 0))
+        self.assertEqual(canvas.getpixel((5, 6)), (0, 0, 0))
+
+    def test_print_padding_is_solved_for_any_ratio(self):
+        stacks = {size: overlay_layout(*size, used_for_print=False)["stacked_size"] for size in ((6000, 4000), (4000, 6000), (3000, 3000), (1010, 1000))}
+
+        for (width, height), (stacked_width, stacked_height) in stacks.items():
+            # The vertical pad the old search loop settled on (lowered in steps of 50 for landscape stacks)
+            base = 400
+            while width > height and get_proportions(width, height, base) * 2 + stacked_height > stacked_width:
+                base -= 50
+            vertical = get_proportions(width, height, base)
+
+            # Every ratio the old lookup table knew gives the same padding as before
+            for option in best_aspect_ratios_for_padding(stacked_width, stacked_height + 2 * vertical):
+                ratio = tuple(map(int, option["aspect_ratio"].split(":")))
+                self.assertEqual(compute_print_padding(width, height, stacked_width, stacked_height, 400, ratio), (option["width_padding"] // 2, vertical))
+
+        # Ratios outside the orientation's list (a square image stacks into a portrait layout) no longer fail
+        self.assertEqual(compute_print_padding(3000, 3000, *stacks[(3000, 3000)], 400, (1, 1)), compute_print_padding(3000, 3000, *stacks[(3000, 3000)], 400, "1:1"))
+        with self.assertRaises(ValueError):
+            compute_print_padding(3000, 3000, *stacks[(3000, 3000)], 400, "Custom")
+
+        # The bulk variant agrees with the scalar one
+        sizes = list(stacks)
+        for ratio in (None, (4, 5), (16, 9)):
+            expected = [compute_print_padding(*size, *stacks[size], 400, ratio) for size in sizes]
+            self.assertEqual(compute_print_padding_bulk(sizes, [stacks[size] for size in sizes], ratio).tolist(), [list(padding) for padding in expected])
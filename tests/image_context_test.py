@@ -0,0 +1,51 @@
+import os, tempfile, unittest
+from io import BytesIO
+from PIL import Image
+from processing_scripts.image_context import *
+
+class TestImageContext(unittest.TestCase):
+
+    def setUp(self):
+        # A 60x40 landscape that the camera tagged as rotated 90 degrees clockwise (Orientation 6)
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION_TAG] = 6
+        buffer = BytesIO()
+        Image.new("RGB", (60, 40), (120, 30, 200)).save(buffer, "JPEG", exif=exif.tobytes())
+        self.raw_bytes = buffer.getvalue()
+
+        handle, self.path = tempfile.mkstemp(suffix=".jpg")
+        with os.fdopen(handle, "wb") as f:
+            f.write(self.raw_bytes)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_geometry_is_read_from_header(self):
+        self.assertEqual(read_image_geometry(self.path), (60, 40, 6))
+        self.assertEqual(get_effective_size(self.path), (40, 60))
+
+    def test_context_size_does_not_decode(self):
+        context = load_image_context(self.path)
+        self.assertEqual(context.size, (40, 60))
+        self.assertIsNone(context._image)
+
+        # Decoding applies the orientation and agrees with the header geometry
+        self.assertEqual(context.image.size, (40, 60))
+        self.assertIs(context.image, context.image)
+
+    def test_draft_decodes_at_reduced_scale(self):
+        context = load_image_context(self.path)
+        draft = context.draft_image(15)
+        self.assertEqual(draft.size, (10, 15))
+        self.assertIsNone(context._image)
+
+        # PNGs (and JPEGs already small enough) decode at full resolution
+        with Image.new("RGB", (60, 40)) as png:
+            buffer = BytesIO()
+            png.save(buffer, "PNG")
+        with Image.open(buffer) as img:
+            self.assertEqual(request_draft(img, 15), 1)
+
+        # Once the full pixels are decoded they are reused instead of decoding again
+        full = context.image
+        self.assertIs(context.draft_image(15), full)
@@ -0,0 +1,33 @@
+import os, subprocess, sys, tempfile, unittest
+
+# Upper bound for `import app` (cumulative microseconds reported by -X importtime), generous enough
+# for slow CI machines but far below the ~1 s that loading Pylette/scikit-learn eagerly costs
+IMPORT_TIME_BUDGET_US = 600_000
+
+# Heavy dependencies that must only load on the code path that needs them
+LAZY_MODULES = ["Pylette", "sklearn", "scipy", "geopy", "timezonefinder", "pytz", "livereload"]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestImportTime(unittest.TestCase):
+
+    def test_app_import_stays_light(self):
+        code = "import sys, app; print('loaded:' + ','.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,)
+
+        # Run from a scratch directory since importing the app creates (and clears) its upload folder
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+            result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=directory, env=env, capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+        marker = [line for line in result.stdout.splitlines() if line.startswith("loaded:")][-1]
+        loaded = [name for name in marker[len("loaded:"):].split(",") if name]
+        self.assertEqual(loaded, [])
+
+        cumulative = {}
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _, total, name = line[len("import time:"):].split("|")
+                if total.strip().isdigit():
+                    cumulative[name.strip()] = int(total)
+        self.assertLess(cumulative["app"], IMPORT_TIME_BUDGET_US)
@@ -0,0 +1,52 @@
+import os, tempfile, unittest
+from PIL import Image
+from processing_scripts.instrumentation import *
+from services.result_cache import ResultCache, set_result_cache
+from services.image_upload_service import process_border_image
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.metrics = StageMetrics(os.path.join(self.directory.name, "metrics.sqlite3"))
+        set_stage_metrics(self.metrics)
+
+    def tearDown(self):
+        set_stage_metrics(None)
+        set_result_cache(None)
+        self.directory.cleanup()
+
+    def test_trace_publishes_each_stage_once(self):
+        with trace("overlay", "photo.jpg") as outer:
+            with stage("open"):
+                Image.new("RGB", (64, 64))
+            # A nested trace (process_image inside the upload service) joins the outer one
+            with trace("overlay", "photo.jpg") as inner, stage("open"):
+                pass
+
+        self.assertIs(inner, outer)
+        self.assertEqual([name for name, _, _ in outer.stages], ["open"])
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot["stages"]["open"]["count"], 1)
+        self.assertGreater(snapshot["stages"]["open"]["allocated_bytes"], 0)
+        self.assertEqual(snapshot["runs"][("overlay", "ok")]["count"], 1)
+
+    def test_failed_trace_is_counted_as_an_error(self):
+        with self.assertRaises(ValueError):
+            with trace("border"), stage("border"):
+                raise ValueError("broken upload")
+
+        self.assertEqual(set(self.metrics.snapshot()["runs"]), {("border", "error")})
+
+    def test_border_pipeline_metrics_render_as_prometheus(self):
+        set_result_cache(ResultCache(os.path.join(self.directory.name, "cache"), max_bytes=0))
+        source = os.path.join(self.directory.name, "photo.jpg")
+        Image.new("RGB", (120, 80), (50, 100, 150)).save(source)
+        process_border_image(source, (4, 5), 10, self.directory.name, "web")
+
+        text = render_prometheus(self.metrics.snapshot())
+        for name in ("open", "border", "save"):
+            self.assertIn(f'image_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} 1', text)
+            self.assertIn(f'image_stage_duration_seconds_count{{stage="{name}"}} 1', text)
+        self.assertIn('image_pipeline_runs_total{pipeline="border",outcome="ok"} 1', text)
+        self.assertIn("# TYPE image_stage_allocated_bytes_total counter", text)
@@ -0,0 +1,55 @@
+import os, tempfile, time, unittest
+from services.job_queue import JobQueue
+
+# Module-level so the worker processes can unpickle it
+def output_name_or_fail(name):
+    if name.startswith("bad"):
+        raise ValueError("cannot process")
+    return f"/uploads/processed_{name}"
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "jobs.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def wait_for(self, queue, job_id):
+        for _ in range(200):
+            snapshot = queue.snapshot(job_id)
+            if snapshot["status"] in ("done", "failed"):
+                return snapshot
+            time.sleep(0.01)
+        self.fail("job did not finish")
+
+    def test_job_reports_per_image_progress(self):
+        queue = JobQueue(self.path)
+        job = queue.submit("test", output_name_or_fail, [("a.jpg",), ("bad.jpg",), ("c.jpg",)], ["a.jpg", "bad.jpg", "c.jpg"], max_workers=1)
+        snapshot = self.wait_for(queue, job.id)
+
+        self.assertEqual(snapshot["status"], "done")
+        self.assertEqual((snapshot["total"], snapshot["completed"], snapshot["failed"]), (3, 2, 1))
+        self.assertEqual([item["output"] for item in snapshot["items"]], ["processed_a.jpg", None, "processed_c.jpg"])
+
+    def test_progress_is_visible_to_other_workers(self):
+        job = JobQueue(self.path).submit("test", output_name_or_fail, [("a.jpg",)], ["a.jpg"], max_workers=1, owner="session-a")
+        other_worker = JobQueue(self.path)
+        snapshot = self.wait_for(other_worker, job.id)
+
+        self.assertEqual(snapshot["items"][0]["output"], "processed_a.jpg")
+        self.assertEqual(other_worker.snapshot(job.id, owner="session-a")["status"], "done")
+        self.assertIsNone(other_worker.snapshot(job.id, owner="session-b"))
+
+    def test_finished_jobs_expire(self):
+        now = [1000.0]
+        queue = JobQueue(self.path, ttl_seconds=60, clock=lambda: now[0])
+        job = queue.submit("test", output_name_or_fail, [("a.jpg",)], ["a.jpg"], max_workers=1)
+        self.wait_for(queue, job.id)
+
+        now[0] += 61
+        self.assertIsNone(queue.snapshot(job.id))
+
+    def test_unknown_job(self):
+        self.assertIsNone(JobQueue(self.path).snapshot("missing"))
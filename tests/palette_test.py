@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+from PIL import Image
+from processing_scripts.palette import *
+
+class TestPalette(unittest.TestCase):
+
+    def setUp(self):
+        # Three flat vertical bands with a known split (50% red, 30% green, 20% blue)
+        arr = np.zeros((400, 1000, 3), dtype=np.uint8)
+        arr[:, :500] = (200, 20, 20)
+        arr[:, 500:800] = (20, 200, 20)
+        arr[:, 800:] = (20, 20, 200)
+        self.image = Image.fromarray(arr, "RGB")
+
+    def test_sample_respects_pixel_budget(self):
+        pixels = sample_palette_pixels(self.image, pixel_budget=5000)
+        self.assertLessEqual(len(pixels), 5000)
+        self.assertEqual(pixels.shape[1], 3)
+
+    def test_extract_palette_finds_dominant_colors(self):
+        palette = extract_palette(self.image, palette_size=3)
+        self.assertEqual(palette.number_of_colors, 3)
+
+        # Most frequent first, and each band should be recovered almost exactly
+        expected = [(200, 20, 20), (20, 200, 20), (20, 20, 200)]
+        for color, rgb in zip(palette.colors, expected):
+            self.assertTrue(all(abs(a - b) <= 3 for a, b in zip(color.rgb, rgb)))
+        self.assertAlmostEqual(sum(palette.frequencies), 1.0)
+
+    def test_extract_palette_is_deterministic(self):
+        noisy = Image.fromarray(np.random.default_rng(0).integers(0, 256, (300, 300, 3), dtype=np.uint8), "RGB")
+        first = [tuple(c.rgb) for c in extract_palette(noisy, palette_size=7).colors]
+        second = [tuple(c.rgb) for c in extract_palette(noisy, palette_size=7).colors]
+        self.assertEqual(first, second)
+
+    def test_extract_palette_handles_flat_image(self):
+        flat = Image.new("RGB", (64, 64), (10, 20, 30))
+        palette = extract_palette(flat, palette_size=7)
+        self.assertEqual(palette.number_of_colors, 7)
+        self.assertEqual(tuple(palette.colors[0].rgb), (10, 20, 30))
+
+    def test_render_palette_in_memory(self):
+        palette = extract_palette(self.image, palette_size=3)
+        swatches = render_palette(palette, w=10.5, h=12)
+        self.assertEqual(swatches.size, (31, 12))
+        self.assertEqual(swatches.getpixel((0, 0)), tuple(palette.colors[0].rgb))
+        self.assertEqual(swatches.getpixel((30, 11)), tuple(palette.colors[2].rgb))
@@ -0,0 +1,37 @@
+import os, tempfile, unittest
+from unittest import mock
+from PIL import Image
+from processing_scripts.renditions import *
+
+class TestRenditions(unittest.TestCase):
+
+    def test_renditions_are_written_next_to_the_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, "processed_a.jpg")
+            image = Image.new("RGB", (3000, 2000), (30, 60, 90))
+            image.save(output_path)
+
+            paths = write_renditions(image, output_path)
+            self.assertEqual(paths["preview"], os.path.join(directory, "processed_a_preview.webp"))
+            self.assertEqual(paths["medium"], os.path.join(directory, rendition_filename("processed_a.jpg", "medium")))
+
+            with Image.open(paths["medium"]) as medium:
+                self.assertEqual(medium.size, (1600, 1067))
+            with Image.open(paths["preview"]) as preview:
+                self.assertEqual(preview.size, (480, 320))
+
+    def test_jpeg_renditions_without_webp_support(self):
+        Image.init()
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict(Image.SAVE):
+            # A Pillow build without libwebp has no WEBP encoder registered
+            del Image.SAVE["WEBP"]
+            output_path = os.path.join(directory, "processed_a.jpg")
+            paths = write_renditions(Image.new("RGB", (900, 600), (30, 60, 90)), output_path)
+
+            self.assertEqual(paths["preview"], os.path.join(directory, "processed_a_preview.jpg"))
+            with Image.open(paths["preview"]) as preview:
+                self.assertEqual((preview.format, preview.size), ("JPEG", (480, 320)))
+
+    def test_small_images_are_not_upscaled(self):
+        self.assertEqual(bounded_size(300, 200, 480), (300, 200))
+        self.assertEqual(bounded_size(2000, 4000, 1600), (800, 1600))
@@ -0,0 +1,57 @@
+import os, tempfile, unittest
+from PIL import Image
+from services.result_cache import *
+from services.image_upload_service import process_border_image
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.directory.name, "cache")
+        self.upload_dir = os.path.join(self.directory.name, "uploads")
+        os.makedirs(self.upload_dir)
+
+    def tearDown(self):
+        set_result_cache(None)
+        self.directory.cleanup()
+
+    def write_output(self, name, size):
+        path = os.path.join(self.upload_dir, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_keys_depend_on_bytes_and_parameters(self):
+        key = ResultCache.key("abc", "border", {"border_size": 10, "aspect_ratio": [4, 5]})
+        self.assertEqual(key, ResultCache.key("abc", "border", {"aspect_ratio": [4, 5], "border_size": 10}))
+        self.assertNotEqual(key, ResultCache.key("abc", "border", {"aspect_ratio": [4, 5], "border_size": 11}))
+        self.assertNotEqual(key, ResultCache.key("abd", "border", {"aspect_ratio": [4, 5], "border_size": 10}))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResultCache(self.cache_dir, max_bytes=2500)
+        cache.store("a" * 64, self.write_output("a.jpg", 1000))
+        cache.store("b" * 64, self.write_output("b.jpg", 1000))
+
+        # Touch "a" so "b" is the least recently used when "c" pushes the store over its bound
+        self.assertTrue(cache.fetch("a" * 64, os.path.join(self.upload_dir, "a_copy.jpg")))
+        cache.store("c" * 64, self.write_output("c.jpg", 1000))
+
+        self.assertFalse(cache.fetch("b" * 64, os.path.join(self.upload_dir, "b_copy.jpg")))
+        self.assertTrue(cache.fetch("c" * 64, os.path.join(self.upload_dir, "c_copy.jpg")))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["entries"]), (2, 1, 1, 2))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+    def test_repeated_border_request_is_served_from_the_cache(self):
+        set_result_cache(ResultCache(self.cache_dir))
+        source = os.path.join(self.upload_dir, "photo.jpg")
+        Image.new("RGB", (120, 80), (50, 100, 150)).save(source)
+
+        first = process_border_image(source, (4, 5), 10, self.upload_dir, "web")
+        os.remove(first)
+        second = process_border_image(source, (4, 5), 10, self.upload_dir, "web")
+
+        self.assertEqual(first, second)
+        with Image.open(second) as output:
+            self.assertEqual(output.size, (128, 160))
+        self.assertEqual(get_result_cache().stats()["hits"], 1)
@@ -0,0 +1,82 @@
+import io, os, tempfile, unittest
+from PIL import Image, ImageChops, ImageOps
+from processing_scripts import strip_render
+from processing_scripts.encoders import encode_image
+from processing_scripts.helpers import compose_canvas, create_simple_border
+from processing_scripts.image_context import EXIF_ORIENTATION_TAG
+from processing_scripts.strip_render import *
+
+class TestStripRender(unittest.TestCase):
+
+    def setUp(self):
+        # Strips of 20 rows (16 for JPEG) for the 40 px wide canvases below, so every component spans several strips
+        self.strip_bytes = strip_render.STRIP_BYTES
+        strip_render.STRIP_BYTES = 20 * 40 * 4
+        gradient = Image.linear_gradient("L")
+        self.source = Image.merge("RGB", (gradient.resize((37, 83)), gradient.rotate(90).resize((37, 83)), gradient.rotate(45).resize((37, 83))))
+
+    def tearDown(self):
+        strip_render.STRIP_BYTES = self.strip_bytes
+
+    def assertSamePixels(self, first, second):
+        self.assertEqual(first.size, second.size)
+        self.assertIsNone(ImageChops.difference(first.convert("RGB"), second.convert("RGB")).getbbox())
+
+    # Helper function to encode the test source with an EXIF orientation
+    def encoded(self, orientation: int, format: str="PNG", **options) -> bytes:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION_TAG] = orientation
+        encoded = io.BytesIO()
+        self.source.save(encoded, format, exif=exif.tobytes(), **options)
+        return encoded.getvalue()
+
+    def test_strip_border_matches_simple_border_for_every_orientation(self):
+        for orientation in range(1, 9):
+            with self.subTest(orientation=orientation):
+                data = self.encoded(orientation)
+                bordered = create_strip_border(data, (4, 5), 10)
+                self.assertIsInstance(bordered, StripCanvas)
+                self.assertSamePixels(bordered.render(), create_simple_border(Image.open(io.BytesIO(data)), (4, 5), 10))
+
+    def test_strip_canvas_matches_compose_canvas(self):
+        footer = Image.new("L", (37, 3), 0)
+        components = [(self.source, (1, 2)), (footer, (1, 90))]
+        self.assertSamePixels(StripCanvas((40, 96), components, fill=(255, 255, 255)).render(), compose_canvas((40, 96), components))
+
+    def test_jpeg_restart_bands_match_a_full_decode(self):
+        for options in ({"restart_marker_rows": 1}, {"restart_marker_rows": 2, "subsampling": "4:4:4"}, {"restart_marker_blocks": 3}):
+            for orientation in (1, 2, 3, 4):
+                with self.subTest(options=options, orientation=orientation):
+                    data = self.encoded(orientation, "JPEG", quality=90, **options)
+                    rows = UprightRows(data)
+                    self.assertIsNotNone(rows._bands)
+                    bands = StripCanvas(rows.size, [(rows, (0, 0))]).render()
+                    self.assertSamePixels(bands, ImageOps.exif_transpose(Image.open(io.BytesIO(data))))
+
+    def test_jpeg_without_restart_markers_is_decoded_once(self):
+        self.assertIsNone(UprightRows(self.encoded(1, "JPEG"))._bands)
+
+    def test_raw_tiff_is_read_in_bands(self):
+        for orientation in (1, 3):
+            data = self.encoded(orientation, "TIFF")
+            rows = UprightRows(data)
+            self.assertIsInstance(rows._bands, RawTileBands)
+            self.assertSamePixels(StripCanvas(rows.size, [(rows, (0, 0))]).render(), ImageOps.exif_transpose(Image.open(io.BytesIO(data))))
+
+    def test_strip_canvas_is_written_like_the_composed_image(self):
+        canvas = StripCanvas((40, 96), [(self.source, (1, 2))])
+        composed = canvas.render()
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in ("print", "png"):
+                with self.subTest(profile=profile):
+                    paths = [os.path.join(directory, f"{name}.{profile}") for name in ("strips", "memory")]
+                    encode_image(canvas, paths[0], profile)
+                    encode_image(composed, paths[1], profile)
+                    with Image.open(paths[0]) as strips, Image.open(paths[1]) as memory:
+                        self.assertEqual(strips.format, memory.format)
+                        self.assertSamePixels(strips, memory)
+
+    def test_strip_canvas_resizes_like_the_composed_image(self):
+        canvas = StripCanvas((40, 96), [(self.source, (1, 2))])
+        resized = canvas.resize((9, 20), Image.Resampling.LANCZOS, reducing_gap=1.5)
+        self.assertSamePixels(resized, canvas.render().resize((9, 20), Image.Resampling.LANCZOS, reducing_gap=1.5))
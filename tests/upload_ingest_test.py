@@ -0,0 +1,57 @@
+import io, os, tempfile, unittest
+from flask import Flask, jsonify, request
+from PIL import Image
+from services.upload_ingest import *
+from services.image_upload_service import save_upload
+from services.result_cache import file_digest
+
+class TestUploadIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.request_class = IngestRequest
+        self.app.config['UPLOAD_FOLDER'] = self.directory.name
+        self.app.config['MAX_UPLOAD_FILE_BYTES'] = 1000
+
+        @self.app.route('/upload', methods=['POST'])
+        def upload():
+            file = request.files['image']
+            digest = ingested_digest(file)
+            filepath = save_upload(file, self.directory.name)
+            return jsonify({"digest": digest, "path": filepath})
+
+        @self.app.route('/upload-many', methods=['POST'])
+        def upload_many():
+            return jsonify({"paths": [save_upload(file, self.directory.name) for file in request.files.getlist('images')]})
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def post(self, data, filename="photo.jpg"):
+        return self.client.post('/upload', data={'image': (io.BytesIO(data), filename)}, content_type='multipart/form-data')
+
+    def test_upload_is_hashed_while_streamed(self):
+        response = self.post(b"\xff\xd8\xff\xe0" + os.urandom(500))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["digest"], file_digest(response.json["path"]))
+        self.assertEqual(os.listdir(self.directory.name), [os.path.basename(response.json["path"])])
+
+    def test_rejected_uploads_leave_nothing_behind(self):
+        self.assertEqual(self.post(b"GIF89a" + b"\x00" * 2000).status_code, 413)
+        self.assertEqual(self.post(b"<html></html>", "page.jpg").status_code, 415)
+        self.assertEqual(self.post(b"BMW service history\n" * 10, "notes.bmp").status_code, 415)
+        self.assertEqual(self.post(b"BM").status_code, 415)
+
+        bitmap = io.BytesIO()
+        Image.new("RGB", (4, 4)).save(bitmap, "BMP")
+        self.assertEqual(self.post(bitmap.getvalue(), "tiny.bmp").status_code, 200)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+    def test_uploads_before_a_rejected_part_are_removed(self):
+        files = [(io.BytesIO(b"\xff\xd8\xff\xe0" + os.urandom(500)), "first.jpg"), (io.BytesIO(b"<html></html>"), "page.jpg")]
+        response = self.client.post('/upload-many', data={'images': files}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(os.listdir(self.directory.name), [])
@@ -0,0 +1,25 @@
+import io, os, tempfile, unittest, zipfile
+from services.zip_stream import *
+
+class TestZipStream(unittest.TestCase):
+
+    def test_streamed_archive_round_trips(self):
+        with tempfile.TemporaryDirectory() as directory:
+            contents = {"a.jpg": os.urandom(300_000), "notes.txt": b"hello " * 1000}
+            for name, data in contents.items():
+                with open(os.path.join(directory, name), "wb") as f:
+                    f.write(data)
+
+            files = [(os.path.join(directory, name), name) for name in contents] + [(os.path.join(directory, "gone.jpg"), "gone.jpg")]
+            chunks = list(stream_zip(files, chunk_size=64 * 1024))
+
+        # The archive arrives in several pieces rather than one buffered blob
+        self.assertGreater(len(chunks), 2)
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ["a.jpg", "notes.txt"])
+            self.assertEqual(archive.getinfo("a.jpg").compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(archive.getinfo("notes.txt").compress_type, zipfile.ZIP_DEFLATED)
+            for name, data in contents.items():
+                self.assertEqual(archive.read(name), data)
@@ -0,0 +1,19 @@
+from processing_scripts.preload import preload_processing_state
+
+'''
+Production WSGI entry point
+
+Gunicorn (see gunicorn.conf.py) loads `create_app()` once in its master process with preload_app,
+so the app, the heavy imports, the fonts and the timezone dataset are loaded before the workers are
+forked and shared between them copy-on-write. Nothing livereload-related is imported here.
+
+    gunicorn -c gunicorn.conf.py
+    waitress-serve --port=5000 --call wsgi:create_app
+'''
+
+def create_app():
+    # The app is light to import and sets up logging, so it goes first and the preload gets logged
+    from app import app
+
+    preload_processing_state()
+    return app